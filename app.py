@@ -1,3 +1,6 @@
+import functools
+import os
+
 import pandas as pd
 import streamlit as st
 import plotly as plt
@@ -5,91 +8,31 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
-# Load the datasets
-customer_data = pd.read_csv("data/customer_data.csv", low_memory=False)
-usage_data = pd.read_csv("data/usage_data.csv", low_memory=False)
-
-# Define the North Star Metrics for each product
-north_star_metrics = {
-    "TurboTax": "Tax Filings Completed",
-    "Mailchimp": "Email Campaigns Successfully Sent",
-    "Mint": "Active Budget Plans",
-    "QuickBooks": "Invoices Paid"
-}
-
-# Map the North Star metric actions for easier aggregation
-action_keys = {
-    (3, "TurboTax"): "Filing Completed",
-    (2, "Mailchimp"): "Email Campaigns Sent",
-    (5, "Mint"): "Budget Created",
-    (5, "QuickBooks"): "Invoice Created"
-}
-# Map action type IDs to names in usage_data
-usage_data["Action_Type"] = usage_data.apply(
-    lambda row: action_keys.get((row["action_type_id"], row["product_name"]), "Unknown Action"), axis=1
-)
-
-# Calculate lifetime activated customers (first_activation_date is not null)
-lifetime_activated_customers = customer_data[~customer_data['first_activation_date'].isna()]
-lifetime_activated_by_product = lifetime_activated_customers.groupby('product_name').size()
-
-# Calculate current active customers (first_activation_date is not null and cancel_date is null)
-current_active_customers = customer_data[
-    (~customer_data['first_activation_date'].isna()) & (customer_data['cancel_date'].isna())
-]
-current_active_by_product = current_active_customers.groupby('product_name').size()
-
-# Calculate churned users by product
-churned_users_by_product = customer_data[~customer_data['cancel_date'].isna()].groupby('product_name').size()
-
-# Calculate churn rate: churned users / lifetime activated customers
-churn_rate_by_product = (churned_users_by_product / lifetime_activated_by_product * 100).fillna(0)
-
-customer_summary = pd.DataFrame({
-    "Lifetime_Activated_Customers": lifetime_activated_by_product,
-    "Current_Active_Customers": current_active_by_product,
-    "Churn_Rate (%)": churn_rate_by_product
-}).fillna(0).astype({
-    "Lifetime_Activated_Customers": int,
-    "Current_Active_Customers": int,
-    "Churn_Rate (%)": float
-})
-customer_summary.reset_index(inplace=True)
-
-
-# Group by product name and calculate the sum of the usage counts for the relevant actions
-north_star_values = usage_data.groupby(["product_name", "Action_Type","action_type_id"])["usage_count"].sum().reset_index()
-
-valid_combinations = set(action_keys.keys())
-
-north_star_actuals = north_star_values[
-    north_star_values.apply(
-        lambda row: (row["action_type_id"], row["product_name"]) in valid_combinations, axis=1
-    )
-]
-
-north_star_actuals = north_star_actuals[["product_name", "usage_count"]]
-
-# Merge customer_summary with north_star_actuals on product_name
-customer_summary = pd.merge(
-    customer_summary, 
-    north_star_actuals, 
-    how="left",  # Left join to preserve all rows in customer_summary
-    on="product_name"
+from pipeline import (
+    charts,
+    cube,
+    customer_index,
+    funnel,
+    ingest,
+    instrumentation,
+    loading,
+    metrics,
+    parallel,
+    refresh,
+    retention,
+    risk,
+    shared,
+    sketches,
+    snapshot,
+    sql,
+    stages,
+    store,
+    streaming,
+    tiles,
+    timeline,
+    validation,
 )
 
-# Rename usage_count column for clarity
-customer_summary.rename(columns={"usage_count": "NorthStar_Metric_Value"}, inplace=True)
-
-# Fill any NaN values in the NorthStar_Metric_Value column with 0
-customer_summary["NorthStar_Metric_Value"] = customer_summary["NorthStar_Metric_Value"].fillna(0).astype(int)
-
-# Reset index for better readability
-customer_summary.reset_index(inplace=True)
-
-
-data = customer_summary
-
 # Product tile colors
 product_colors = {
     "Mailchimp": "#FFE01B",
@@ -106,117 +49,439 @@ descriptions = {
     "Mint": "Total budgets created by all users."
 }
 
-mailchimp_actions_key = {
-    5: "Log-Ins", 
-    7: "Campaigns Created",
-    4: "Subscribers Added",
-    3: "Templates Edited",
-    2: "Email Campaigns Sent", 
-    1: "Email Campaigns Deleted",
-    6: "Email Campaigns Un-sent"
-}
-mailchimp_data = customer_data[customer_data["product_name"] == "Mailchimp"]
-mailchimp_usage = usage_data[usage_data['product_name'] == 'Mailchimp']
-
+# Per-stage timings: ?debug=1 shows them in a sidebar panel, PIPELINE_TIMINGS=1
+# logs them as JSON lines for every run. Both off costs nothing measurable.
+DEBUG_PANEL = st.query_params.get("debug") == "1"
+PIPELINE_TIMINGS = os.environ.get("PIPELINE_TIMINGS") == "1"
+if PIPELINE_TIMINGS:
+    instrumentation.configure_logging()
+instrumentation.start_run(DEBUG_PANEL or PIPELINE_TIMINGS)
 
-# Count the occurrences of each action ID using the correct column name
-mailchimp_action_counts = mailchimp_usage['action_type_id'].value_counts()
+# Set USAGE_CHUNKSIZE to stream usage_data.csv in chunks of that many rows
+# instead of loading it whole, for exports larger than the host's memory
+USAGE_CHUNKSIZE = int(os.environ.get("USAGE_CHUNKSIZE", 0))
 
-# Map the action IDs to their names using the provided key
-mailchimp_funnel = mailchimp_action_counts.rename(index=mailchimp_actions_key)
+# Set AGGREGATE_STORE to a directory to derive the KPIs from incrementally
+# maintained aggregates; daily partitions in data/usage/ are merged as they land
+AGGREGATE_STORE = os.environ.get("AGGREGATE_STORE")
 
-# Sort actions by their frequency in descending order
-mailchimp_funnel = mailchimp_funnel.sort_values(ascending=False)
+# Set PIPELINE_WORKERS to spread the usage aggregations over that many
+# processes, partitioned by customer; the default runs them in this process
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 1))
 
-# Recalculate start and end dates
-start_date = pd.Timestamp("2021-05-01")
-end_date = pd.Timestamp("2022-06-30")
-full_date_range = pd.date_range(start=start_date, end=end_date, freq="D")
-
-# Convert dates to datetime format
-mailchimp_data["first_activation_date"] = pd.to_datetime(
-    mailchimp_data["first_activation_date"], errors="coerce"
-)
-mailchimp_data["cancel_date"] = pd.to_datetime(
-    mailchimp_data["cancel_date"], errors="coerce"
-)
+# Set SQL_BACKEND to a SQLite file (built by python -m pipeline.sql, or on
+# first run) to query indexed rollups instead, with sidebar filters for the
+# date range, channels and products
+SQL_BACKEND = os.environ.get("SQL_BACKEND")
 
+# Render straight from the newest snapshot in SNAPSHOT_DIR once one has been
+# built (by python -m pipeline.snapshot); when an input file changes, a new
+# one is built. Set SNAPSHOT_DIR to an empty string to always compute live.
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", snapshot.SNAPSHOT_DIR)
 
-# Group by and calculate cumulative activated customers
-grouped_activated_customers = mailchimp_data.groupby("first_activation_date").size()
-cumulative_activated_customers_mailchimp = grouped_activated_customers.reindex(full_date_range, fill_value=0).cumsum()
+# The input files are checked every DATA_REFRESH_SECONDS on a background
+# thread, which rebuilds everything a page needs before sessions switch to
+# it; until then they keep rendering the previous data. Set it to 0 to check
+# on every run instead, which then blocks while it rebuilds. At startup the
+# first page renders from what it needs alone, and the rest is computed in the
+# background after it.
+DATA_REFRESH_SECONDS = float(os.environ.get("DATA_REFRESH_SECONDS", refresh.DEFAULT_INTERVAL))
 
 
-# Group by and calculate cumulative cancelled customers
-grouped_cancelled_customers = mailchimp_data.groupby("cancel_date").size()
-cumulative_cancelled_customers_mailchimp = grouped_cancelled_customers.reindex(full_date_range, fill_value=0).cumsum()
+@st.cache_resource(show_spinner=False)
+def get_snapshot(path):
+    return snapshot.Snapshot(path)
+
 
-# Calculate daily active customers
-active_customers_daily_mailchimp = cumulative_activated_customers_mailchimp - cumulative_cancelled_customers_mailchimp
+@st.cache_resource(show_spinner=False)
+def get_aggregate_store(path):
+    return store.AggregateStore(path)
 
 
-# Group by acquisition channel and count customers
-channel_breakdown = mailchimp_data.groupby("channel").size().reset_index(name="Customer_Count")
+@st.cache_resource(show_spinner=False)
+def get_database(path):
+    return sql.Database(path)
 
-# Sort by Customer Count
-channel_breakdown = channel_breakdown.sort_values(by="Customer_Count", ascending=False)
 
-# Filter churned Mailchimp users
-churned_mailchimp_users = mailchimp_data[~mailchimp_data["cancel_date"].isna()]
+def shared_resource(fn):
+    """Compute ``fn`` once per process for all sessions; each caller gets a read-only view.
 
-# Filter non-churned Mailchimp users
-non_churned_mailchimp_users = mailchimp_data[mailchimp_data["cancel_date"].isna()]
+    st.cache_data would pickle the result and hand every caller its own
+    unpickled copy, so a large table would be held once more for each
+    session touching it. Up to two input versions are kept: the current one
+    and the one that sessions may still be rendering.
+    """
+    @st.cache_resource(show_spinner=False, max_entries=2)
+    @functools.wraps(fn)
+    def cached(*args):
+        return shared.freeze(fn(*args))
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        return shared.view(cached(*args))
+    return wrapper
 
-# Merge churned Mailchimp users with usage_data
-churned_mailchimp_usage = usage_data.merge(churned_mailchimp_users[["customerid"]], on="customerid")
 
-# Merge non-churned Mailchimp users with usage_data
-non_churned_mailchimp_usage = usage_data.merge(non_churned_mailchimp_users[["customerid"]], on="customerid")
-
-# Group and calculate action counts for churned and non-churned users
-churned_actions = churned_mailchimp_usage.groupby("action_type_id")["usage_count"].sum().reset_index()
-non_churned_actions = non_churned_mailchimp_usage.groupby("action_type_id")["usage_count"].sum().reset_index()
-
-# Total actions
-churned_total = churned_actions["usage_count"].sum()
-non_churned_total = non_churned_actions["usage_count"].sum()
-
-# Normalize to percentages
-churned_actions["Percentage"] = churned_actions["usage_count"] / churned_total * 100
-non_churned_actions["Percentage"] = non_churned_actions["usage_count"] / non_churned_total * 100
-
-# Merge churned and non-churned action percentages
-action_comparison = pd.merge(
-    churned_actions.rename(columns={"Percentage": "Churned_Percentage"}),
-    non_churned_actions.rename(columns={"Percentage": "Non_Churned_Percentage"}),
-    on="action_type_id",
-    how="outer"
-).fillna(0)
+@instrumentation.timed("load_customer_data")
+@shared_resource
+def load_customer_data(fingerprint):
+    return ingest.load_customer_data(fingerprint.path)
+
+
+@instrumentation.timed("load_usage_data")
+@shared_resource
+def load_usage_data(fingerprint):
+    return ingest.load_usage_data(fingerprint.path)
+
+
+@instrumentation.timed("customer_cube")
+@shared_resource
+def get_customer_cube(customer_fp):
+    return cube.customer_cube(load_customer_data(customer_fp))
+
+
+@instrumentation.timed("parallel_aggregates")
+@shared_resource
+def get_parallel_aggregates(customer_fp, usage_fp):
+    return parallel.aggregate_in_subprocess(customer_fp.path, usage_fp.path, PIPELINE_WORKERS)
+
+
+@instrumentation.timed("usage_cube")
+@shared_resource
+def get_usage_cube(customer_fp, usage_fp):
+    if PIPELINE_WORKERS > 1:
+        return get_parallel_aggregates(customer_fp, usage_fp).usage_cube
+    return cube.usage_cube(load_customer_data(customer_fp), load_usage_data(usage_fp))
+
+
+@instrumentation.timed("customer_index")
+@shared_resource
+def get_customer_index(customer_fp, usage_fp):
+    return customer_index.build_customer_index(load_customer_data(customer_fp), load_usage_data(usage_fp))
+
+
+@instrumentation.timed("usage_aggregates")
+@shared_resource
+def get_usage_aggregates(usage_fp, chunksize):
+    return streaming.aggregate_usage(usage_fp.path, chunksize)
+
+
+@instrumentation.timed("customer_summary")
+@st.cache_data(show_spinner=False)
+def get_customer_summary(mode, customer_fp, usage_fp, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).customer_summary()
+    if mode == "sql":
+        return get_database(SQL_BACKEND).customer_summary(filters)
+    if mode == "store":
+        return get_aggregate_store(AGGREGATE_STORE).customer_summary()
+    if mode == "streaming":
+        return streaming.customer_summary(load_customer_data(customer_fp), get_usage_aggregates(usage_fp, USAGE_CHUNKSIZE))
+    return cube.customer_summary(get_customer_cube(customer_fp), get_usage_cube(customer_fp, usage_fp))
+
+
+@instrumentation.timed("action_funnel")
+@st.cache_data(show_spinner=False)
+def get_action_funnel(mode, customer_fp, usage_fp, product, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).action_funnel(product)
+    if mode == "sql":
+        return get_database(SQL_BACKEND).action_funnel(product, filters)
+    if mode == "store":
+        return get_aggregate_store(AGGREGATE_STORE).action_funnel(product)
+    if mode == "streaming":
+        return streaming.action_funnel(get_usage_aggregates(usage_fp, USAGE_CHUNKSIZE), product)
+    return cube.action_funnel(get_usage_cube(customer_fp, usage_fp), product)
+
+
+@instrumentation.timed("active_timeline")
+@shared_resource
+def get_active_timeline(customer_fp):
+    if AGGREGATE_STORE:
+        return timeline.active_timeline(get_aggregate_store(AGGREGATE_STORE).tables["customers"])
+    return timeline.active_timeline(load_customer_data(customer_fp))
+
+
+@instrumentation.timed("daily_customer_series")
+@st.cache_data(show_spinner=False)
+def get_daily_customer_series(mode, customer_fp, product, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).daily_customer_series(product)
+    if mode == "sql":
+        return get_database(SQL_BACKEND).daily_customer_series(product, filters)
+    return timeline.daily_customer_series(get_active_timeline(customer_fp), product)
+
+
+@instrumentation.timed("chart_series")
+@st.cache_data(show_spinner=False)
+def get_chart_series(mode, customer_fp, product, start, end, filters=None):
+    # Each line is cut to the selected range and downsampled on its own
+    daily_series = get_daily_customer_series(mode, customer_fp, product, filters)
+    start, end = (None if day is None else pd.Timestamp(day) for day in (start, end))
+    return {column: charts.chart_series(daily_series[column], start, end) for column in daily_series.columns}
+
+
+@instrumentation.timed("channel_breakdown")
+@st.cache_data(show_spinner=False)
+def get_channel_breakdown(mode, customer_fp, product, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).channel_breakdown(product)
+    if mode == "sql":
+        return get_database(SQL_BACKEND).channel_breakdown(product, filters)
+    if mode == "store":
+        return stages.channel_breakdown(get_aggregate_store(AGGREGATE_STORE).tables["customers"], product)
+    return cube.channel_breakdown(get_customer_cube(customer_fp), product)
+
+
+@instrumentation.timed("action_comparison")
+@st.cache_data(show_spinner=False)
+def get_action_comparison(mode, customer_fp, usage_fp, product, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).action_comparison(product)
+    if mode == "sql":
+        return get_database(SQL_BACKEND).action_comparison(product, filters)
+    if mode == "store":
+        return get_aggregate_store(AGGREGATE_STORE).action_comparison(product)
+    if mode == "streaming":
+        return streaming.action_comparison(load_customer_data(customer_fp), get_usage_aggregates(usage_fp, USAGE_CHUNKSIZE), product)
+    if PIPELINE_WORKERS > 1:
+        return parallel.churn_comparison(get_parallel_aggregates(customer_fp, usage_fp), product)
+    return customer_index.action_comparison(get_customer_index(customer_fp, usage_fp), product)
+
+
+@instrumentation.timed("churn_by_channel")
+@st.cache_data(show_spinner=False)
+def get_churn_by_channel(mode, customer_fp, product, filters=None):
+    if mode == "snapshot":
+        return get_snapshot(customer_fp).churn_by_channel(product)
+    if mode == "sql":
+        return get_database(SQL_BACKEND).churn_by_channel(product, filters)
+    if mode == "store":
+        return get_aggregate_store(AGGREGATE_STORE).churn_by_channel(product)
+    return cube.churn_by_channel(get_customer_cube(customer_fp), product)
+
+
+@instrumentation.timed("tile_grid")
+@st.cache_data(show_spinner=False)
+def get_tile_grid(mode, customer_fp, usage_fp, product=None, product_font_size=16, filters=None):
+    summary = get_customer_summary(mode, customer_fp, usage_fp, filters)
+    if product is not None:
+        summary = summary[summary["product_name"] == product]
+    return tiles.tile_grid_html(summary, product_colors, descriptions, product_font_size=product_font_size)
+
+
+def usage_csv_paths():
+    if AGGREGATE_STORE:
+        # Daily partitions merged into the store count too
+        return sorted(get_aggregate_store(AGGREGATE_STORE).manifest["partitions"])
+    return [loading.USAGE_DATA_PATH]
+
+
+@instrumentation.timed("sketches")
+@shared_resource
+def get_sketches(customer_fp, usage_fp):
+    # Built at ingest next to each usage CSV and merged here
+    return sketches.load(usage_csv_paths(), USAGE_CHUNKSIZE or None)
+
+
+@instrumentation.timed("distinct_customers")
+@st.cache_data(show_spinner=False)
+def get_distinct_customers(customer_fp, usage_fp, product, actions, start, end):
+    return sketches.distinct_customers(get_sketches(customer_fp, usage_fp), product, actions, start, end)
+
+
+@instrumentation.timed("exact_distinct_customers")
+@st.cache_data(show_spinner=False)
+def get_exact_distinct_customers(customer_fp, usage_fp, product, actions, start, end):
+    frames = (frame for path in usage_csv_paths() for frame in sketches.usage_frames(path, USAGE_CHUNKSIZE or None))
+    return sketches.exact_distinct(frames, product, actions, start, end)
+
+
+@instrumentation.timed("ordered_funnel")
+@st.cache_data(show_spinner=False)
+def get_ordered_funnel(customer_fp, usage_fp, product, start=None, end=None):
+    steps = metrics.funnel_steps[product]
+    # Only the product's funnel events in the range, from every usage CSV
+    frames = []
+    for path in usage_csv_paths():
+        for usage in sketches.usage_frames(path, USAGE_CHUNKSIZE or None):
+            keep = usage["product_name"].eq(product).to_numpy(dtype=bool, na_value=False) \
+                & usage["action_type_id"].isin(steps).to_numpy(dtype=bool, na_value=False)
+            if start is not None:
+                keep &= (usage["event_date"] >= pd.Timestamp(start)).to_numpy(dtype=bool, na_value=False)
+            if end is not None:
+                keep &= (usage["event_date"] <= pd.Timestamp(end)).to_numpy(dtype=bool, na_value=False)
+            frames.append(usage[keep])
+    return funnel.ordered_funnel(pd.concat(frames, ignore_index=True), steps, product)
+
+
+@instrumentation.timed("login_activity")
+@shared_resource
+def get_login_activity(customer_fp, usage_fp):
+    # Built at ingest next to each usage CSV and merged here, so a new daily
+    # partition only adds its own log-ins
+    return risk.load(usage_csv_paths(), USAGE_CHUNKSIZE or None)
+
+
+def get_customer_rows(mode, customer_fp):
+    """The typed customer frame behind ``customer_fp``, in any mode."""
+    if mode == "store":
+        return get_aggregate_store(AGGREGATE_STORE).tables["customers"]
+    # Neither a snapshot's path nor the database version is a file
+    # fingerprint, so go by the customer CSV's own
+    if mode in ("snapshot", "sql"):
+        return load_customer_data(loading.file_fingerprint(loading.CUSTOMER_DATA_PATH))
+    return load_customer_data(customer_fp)
+
+
+@instrumentation.timed("churn_watchlist")
+@st.cache_data(show_spinner=False)
+def get_churn_watchlist(mode, customer_fp, usage_fp, product, top, filters=None):
+    if mode == "sql":
+        cohort = get_database(SQL_BACKEND).active_customers(product, filters)
+    else:
+        cohort = risk.active_customers(get_customer_rows(mode, customer_fp), product)
+    return risk.watchlist(get_login_activity(customer_fp, usage_fp), cohort, top)
+
+
+@instrumentation.timed("retention_matrix")
+@st.cache_data(show_spinner=False)
+def get_retention_matrix(mode, customer_fp, product, channel, cohort_by, period, filters=None):
+    customer_data = get_customer_rows(mode, customer_fp)
+    # Over the whole customer base, so that filters leave the horizon as it is
+    as_of = retention.last_date(customer_data)
+    if filters is not None and (filters.channels or filters.products):
+        keep = pd.Series(True, index=customer_data.index)
+        if filters.channels:
+            keep &= customer_data["channel"].isin(filters.channels)
+        if filters.products:
+            keep &= customer_data["product_name"].isin(filters.products)
+        customer_data = customer_data[keep.to_numpy()]
+    result = retention.retention_matrix(customer_data, product, channel, cohort_by, period, as_of)
+    if filters is not None and (filters.start or filters.end):
+        # The date range picks the cohorts
+        cohorts = result.customers.index
+        keep = (cohorts >= pd.Timestamp(filters.start or cohorts.min())) & (cohorts <= pd.Timestamp(filters.end or cohorts.max()))
+        result = retention.Retention(result.rates[keep], result.customers[keep])
+    return result
+
+
+def build_version(customer_fp, usage_fp):
+    """Bring what the pages read up to date; returns the cache key for it and the mode to read it in.
+
+    The mode is chosen here, once per version, so every run rendering a
+    version reads it the way it was built. Pages compute the rest as they
+    need it, or find it cached by :func:`warm_version`.
+    """
+    if SQL_BACKEND:
+        # The database version covers both input files, so it stands in for
+        # their fingerprints as the cache key
+        customer_fp = usage_fp = get_database(SQL_BACKEND).sync()
+        return (customer_fp, usage_fp), "sql"
+    if AGGREGATE_STORE:
+        # The store version covers the customer snapshot and every merged usage
+        # partition, so it stands in for both file fingerprints as the cache key
+        customer_fp = usage_fp = get_aggregate_store(AGGREGATE_STORE).sync(
+            chunksize=USAGE_CHUNKSIZE or streaming.DEFAULT_CHUNKSIZE
+        )
+        return (customer_fp, usage_fp), "store"
+    if USAGE_CHUNKSIZE:
+        return (customer_fp, usage_fp), "streaming"
+    if SNAPSHOT_DIR and snapshot.latest(SNAPSHOT_DIR) is not None:
+        # A snapshot directory holds one immutable version, so its path stands
+        # in for both file fingerprints as the cache key
+        customer_fp = usage_fp = snapshot.current(SNAPSHOT_DIR) or snapshot.build_in_subprocess(out=SNAPSHOT_DIR)
+        return (customer_fp, usage_fp), "snapshot"
+    return (customer_fp, usage_fp), "live"
+
+
+def warm_version(version):
+    """Compute what the pages of ``version`` show, so that sessions find it cached."""
+    customer_fp, usage_fp = version.key
+    # The database and the store swap in their rebuilt tables themselves and
+    # answer in milliseconds, so only the other modes are worth warming
+    if version.mode not in ("sql", "store"):
+        warm_caches(version.mode, customer_fp, usage_fp)
+    if os.path.exists(loading.USAGE_DATA_PATH):
+        get_sketches(customer_fp, usage_fp)
+        get_login_activity(customer_fp, usage_fp)
+
+
+def warm_caches(mode, customer_fp, usage_fp):
+    # Make the calls an unfiltered page makes, with the same arguments, so
+    # that sessions switching to this version find every tab cached
+    summary = get_customer_summary(mode, customer_fp, usage_fp, None)
+    get_tile_grid(mode, customer_fp, usage_fp, filters=None)
+    for product in summary["product_name"]:
+        get_action_funnel(mode, customer_fp, usage_fp, product, None)
+        daily_series = get_daily_customer_series(mode, customer_fp, product, None)
+        get_channel_breakdown(mode, customer_fp, product, None)
+        get_tile_grid(mode, customer_fp, usage_fp, product, product_font_size=18, filters=None)
+        days = (daily_series.index[0].date(), daily_series.index[-1].date()) if len(daily_series) > 1 else (None, None)
+        get_chart_series(mode, customer_fp, product, *days, None)
+        get_action_comparison(mode, customer_fp, usage_fp, product, None)
+        get_churn_by_channel(mode, customer_fp, product, None)
+        if product in metrics.funnel_steps and os.path.exists(loading.USAGE_DATA_PATH):
+            get_ordered_funnel(customer_fp, usage_fp, product, None, None)
+    get_retention_matrix(mode, customer_fp, None, None, retention.COHORT_COLUMNS[0], retention.PERIODS[0], None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_refresher():
+    refresher = refresh.Refresher(
+        [loading.CUSTOMER_DATA_PATH, loading.USAGE_DATA_PATH], build_version, DATA_REFRESH_SECONDS,
+        # The store also merges the daily partitions landing there
+        directories=[loading.USAGE_PARTITIONS_DIR] if AGGREGATE_STORE else [],
+        warm=warm_version,
+    )
+    # Started at the end of the first run, once its page is out
+    return refresher
+
+
+refresher = get_refresher()
+if not DATA_REFRESH_SECONDS:
+    refresher.refresh(settle=False)
+# Read once, so the whole run renders one version even if a refresh swaps
+# in the next one meanwhile
+version = refresher.current
+customer_fp, usage_fp = version.key
+mode = version.mode
+
+FILTERS = None
+if mode == "sql":
+    database = get_database(SQL_BACKEND)
+    first_day, last_day = database.date_window
+    with st.sidebar:
+        st.header("Filters")
+        date_filter = (first_day, last_day)
+        if first_day < last_day:
+            date_filter = st.slider("Date range", first_day, last_day, date_filter, key="filter_dates")
+        channel_filter = st.multiselect("Channels", database.channels, placeholder="All channels", key="filter_channels")
+        product_filter = st.multiselect("Products", database.products, placeholder="All products", key="filter_products")
+    # Open ends and empty selections leave a dimension unfiltered
+    FILTERS = sql.Filters(
+        start=date_filter[0] if date_filter[0] != first_day else None,
+        end=date_filter[1] if date_filter[1] != last_day else None,
+        channels=tuple(channel_filter) or None,
+        products=tuple(product_filter) or None,
+    )
 
-# Map action_type_id to descriptive names
-action_type_mapping = {
-    5: "Campaigns Created ", 
-    7: "Log-Ins",
-    4: "Subscribers Added",
-    3: "Templates Edited",
-    2: "Email Campaigns Sent", 
-    1: "Email Campaigns Deleted",
-    6: "Email Campaigns Un-sent"
-}
-action_comparison["Action_Type"] = action_comparison["action_type_id"].map(action_type_mapping)
+data = get_customer_summary(mode, customer_fp, usage_fp, FILTERS)
+products = data["product_name"].tolist()
+if not products:
+    st.info("No customers match the filters.")
+    st.stop()
+# Filters can leave Mailchimp out of the product pickers
+default_product = products.index("Mailchimp") if "Mailchimp" in products else 0
 
-# Data for plotting
-action_types = action_comparison["Action_Type"]
-churned_percentage = action_comparison["Churned_Percentage"]
-non_churned_percentage = action_comparison["Non_Churned_Percentage"]
+# Streamlit App
 
-lifetime_activated_customers_mailchimp = mailchimp_data[~mailchimp_data['first_activation_date'].isna()]
-lifetime_activated_by_channel_mailchimp = lifetime_activated_customers_mailchimp.groupby('channel').size()
-churned_users_by_channel_mailchimp = mailchimp_data[~mailchimp_data['cancel_date'].isna()].groupby('channel').size()
-# Calculate churn rate: churned users / lifetime activated customers
-churn_rate_by_channel_mailchimp = (churned_users_by_channel_mailchimp / lifetime_activated_by_channel_mailchimp * 100).fillna(0)
+def plotly_chart(fig, name):
+    with instrumentation.stage(f"render {name}") as record:
+        st.plotly_chart(fig, use_container_width=True)
+        if record is not None:
+            record["rows_out"] = sum(len(trace.x) for trace in fig.data if trace.x is not None)
 
-# Streamlit App
 
 st.set_page_config(
     page_title="Soham Sabale - Intuit Conversation",  # This is the tab name
@@ -224,88 +489,43 @@ st.set_page_config(
     
 )
 st.title("Mailchimp Case Study")
-# Create tab for Intuit Overview
-tab1, tab2, tab3 = st.tabs(["Intuit Overview", "Mailchimp Deep Dive", "Mailchimp Churned Users Analysis"])
+if version.as_of is not None:
+    as_of = f"Data as of {version.as_of:%Y-%m-%d %H:%M} UTC"
+    if refresher.refreshing:
+        as_of += " · newer data is loading"
+    elif refresher.error is not None:
+        as_of += " · loading newer data failed, see the server log"
+    st.caption(as_of)
+# Only the open tab runs: switching tabs reruns the script, and widgets inside
+# a tab rerun just that tab's fragment
+tab1, tab2, tab3, tab4 = st.tabs(
+    ["Intuit Overview", "Product Deep Dive", "Churned Users Analysis", "Cohort Retention"], key="tab", on_change="rerun"
+)
+
 
-with tab1:
+def tab_fragment(name):
+    """Make a tab body a fragment that fetches its own data when it runs."""
+    def decorator(body):
+        @st.fragment
+        @functools.wraps(body)
+        def fragment():
+            # A fragment rerun skips the top of the script, so it starts
+            # its own instrumentation run
+            if not instrumentation.enabled():
+                instrumentation.start_run(DEBUG_PANEL or PIPELINE_TIMINGS)
+            with instrumentation.stage(f"tab {name}"):
+                body()
+        return fragment
+    return decorator
+
+
+@tab_fragment("Intuit Overview")
+def overview():
     st.header("Intuit Executive Overview")
     st.markdown("#### How is the business doing?")
 
-    # Create the grid headers
-    rows = st.columns([1, 1, 1, 1, 1])
-    with rows[0]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>Product</p>", unsafe_allow_html=True)
-    with rows[1]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>👥 Lifetime Activated</p>", unsafe_allow_html=True)
-    with rows[2]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>⚡Current Active</p>", unsafe_allow_html=True)
-    with rows[3]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>📉Churn Rate</p>", unsafe_allow_html=True)
-    with rows[4]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>⭐ Lifetime NorthStar Metric</p>", unsafe_allow_html=True)
-
-    # Loop through products to create tiles
-    for i, row in data.iterrows():
-        rows = st.columns([1, 1, 1, 1, 1])
-
-        # Product name tile
-        with rows[0]:
-            st.markdown(
-                f"""
-                <div style='background-color:#FFFFFF; display: flex; justify-content: center; align-items: center; border-radius: 10px; border: 1px solid #d3d3d3; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:black; font-size:16px;'>{row['product_name']}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Lifetime Activated Customers tile
-        with rows[1]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Lifetime_Activated_Customers']:,}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Current Active Customers tile
-        with rows[2]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Current_Active_Customers']:,}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Churn Rate tile
-        with rows[3]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Churn_Rate (%)']:.2f}%</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Lifetime NorthStar Metric tile
-        with rows[4]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; flex-direction: column; justify-content: center; align-items: center; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['NorthStar_Metric_Value']:,}</h3>
-                    <h6 style='text-align:center; color:white; font-size:14px; margin-top:0.5px;'>{descriptions[row['product_name']]}</h6>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Add vertical space between rows
-        st.markdown("<div style='height:20px;'></div>", unsafe_allow_html=True)
+    # The whole grid is one element, cached until the summary changes
+    st.markdown(get_tile_grid(mode, customer_fp, usage_fp, filters=FILTERS), unsafe_allow_html=True)
     st.markdown("### Insights")
     st.write(
         """Based on the metrics above \n
@@ -313,96 +533,44 @@ with tab1:
         2.Additoinally, churn rates(~30%) are also similar."
     """)
 
-with tab2:
-    st.header("Mailchimp Deep Dive")
-    st.markdown("#### How is Mailchimp doing?")
-    # Wireframe for tiles
-    st.markdown("### Metrics Overview")
-    rows = st.columns([1, 1, 1, 1, 1])
-
-    # Create the grid headers for tiles
-    with rows[0]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>Product</p>", unsafe_allow_html=True)
-    with rows[1]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>👥 Lifetime Activated</p>", unsafe_allow_html=True)
-    with rows[2]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>⚡Current Active</p>", unsafe_allow_html=True)
-    with rows[3]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>📉Churn Rate</p>", unsafe_allow_html=True)
-    with rows[4]:
-        st.markdown("<p style='text-align:center; font-weight:bold; font-size:16px;'>⭐ Lifetime NorthStar Metric</p>", unsafe_allow_html=True)
-
-    # Populate the tiles with color
-    for i, row in data[data['product_name'] == "Mailchimp"].iterrows():
-        rows = st.columns([1, 1, 1, 1, 1])
-
-        # Product name tile
-        with rows[0]:
-            st.markdown(
-                f"""
-                <div style='background-color:#FFFFFF; display: flex; justify-content: center; align-items: center; border-radius: 10px; border: 1px solid #d3d3d3; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:black; font-size:18px;'>{row['product_name']}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
 
-        # Lifetime Activated Customers tile
-        with rows[1]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Lifetime_Activated_Customers']:,}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+@tab_fragment("Product Deep Dive")
+def product_deep_dive():
+    product = st.selectbox("Product", products, index=default_product, key="deep_dive_product")
+    action_funnel = get_action_funnel(mode, customer_fp, usage_fp, product, FILTERS)
+    daily_series = get_daily_customer_series(mode, customer_fp, product, FILTERS)
+    channel_breakdown = get_channel_breakdown(mode, customer_fp, product, FILTERS)
 
-        # Current Active Customers tile
-        with rows[2]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Current_Active_Customers']:,}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Churn Rate tile
-        with rows[3]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; justify-content: center; align-items: center; flex-direction: column; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['Churn_Rate (%)']:.2f}%</h3>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        # Lifetime NorthStar Metric tile
-        with rows[4]:
-            st.markdown(
-                f"""
-                <div style='background-color:{product_colors[row['product_name']]}; display: flex; flex-direction: column; justify-content: center; align-items: center; border-radius: 10px; width:100%; height:150px; padding:20px;'>
-                    <h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; text-shadow: 0px 0px 1px black;'>{row['NorthStar_Metric_Value']:,}</h3>
-                    <h6 style='text-align:center; color:white; font-size:14px; margin-top:0.5px;'>{descriptions[row['product_name']]}</h6>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+    st.header(f"{product} Deep Dive")
+    st.markdown(f"#### How is {product} doing?")
+    # Wireframe for tiles
+    st.markdown("### Metrics Overview")
+    st.markdown(get_tile_grid(mode, customer_fp, usage_fp, product, product_font_size=18, filters=FILTERS), unsafe_allow_html=True)
 
     # Create a 2x2 Grid
     st.markdown("### Charts")
+    # Narrowing the range re-queries it at full resolution, long ranges are
+    # downsampled to the chart's point budget. A single day, or none, has no
+    # range to pick from, and the charts show all of it.
+    date_range = (None, None)
+    if len(daily_series) > 1:
+        first_day, last_day = daily_series.index[0].date(), daily_series.index[-1].date()
+        date_range = st.slider(
+            "Date range", first_day, last_day, (first_day, last_day), key=f"deep_dive_dates_{product}"
+        )
+    chart_lines = get_chart_series(mode, customer_fp, product, *date_range, FILTERS)
+    cumulative_activated_customers = chart_lines["Cumulative_Activated"]
+    active_customers_daily = chart_lines["Active"]
     chart_rows_top = st.columns(2)
 
     # Chart 1: Cumulative Lifetime Customers (Top Left)
     with chart_rows_top[0]:
         fig1 = go.Figure()
+        line = go.Scattergl if charts.use_webgl(cumulative_activated_customers) else go.Scatter
         fig1.add_trace(
-            go.Scatter(
-                x=cumulative_activated_customers_mailchimp.index,
-                y=cumulative_activated_customers_mailchimp.values,
+            line(
+                x=cumulative_activated_customers.index,
+                y=cumulative_activated_customers.values,
                 mode="lines",
                 name="Cumulative Lifetime Customers",
                 line=dict(color="blue", width=3)
@@ -415,15 +583,16 @@ with tab2:
             legend_title="Metrics",
             template="plotly_white"
         )
-        st.plotly_chart(fig1, use_container_width=True)
+        plotly_chart(fig1, "cumulative_customers")
 
     # Chart 2: Active Customers by Date (Top Right)
     with chart_rows_top[1]:
         fig2 = go.Figure()
+        line = go.Scattergl if charts.use_webgl(active_customers_daily) else go.Scatter
         fig2.add_trace(
-            go.Scatter(
-                x=active_customers_daily_mailchimp.index,
-                y=active_customers_daily_mailchimp.values,
+            line(
+                x=active_customers_daily.index,
+                y=active_customers_daily.values,
                 mode="lines",
                 name="Active Customers by Date",
                 line=dict(color="green", width=3)
@@ -436,27 +605,27 @@ with tab2:
             legend_title="Metrics",
             template="plotly_white"
         )
-        st.plotly_chart(fig2, use_container_width=True)
+        plotly_chart(fig2, "active_customers")
 
     #  Bottom Row
     chart_rows_bottom = st.columns(2)
     # Bottom Left Chart: Funnel Chart for User Actions
     with chart_rows_bottom[0]:
         fig_funnel = go.Figure(go.Funnel(
-            y=mailchimp_funnel.index,  # Action names
-            x=mailchimp_funnel.values,  # Counts of users performing each action
+            y=action_funnel.index,  # Action names
+            x=action_funnel.values,  # Usage rows logged for each action
             textinfo="value+percent initial",  # Display both values and percentages
             marker=dict(color=["#FFE01B", "#FFC30F", "#FFB000", "#FF8000", "#FF6000", "#FF4000", "#FF2000"])
         ))
 
         fig_funnel.update_layout(
-            title="Mailchimp User Actions Funnel",
+            title=f"{product} User Actions Funnel",
             yaxis_title="Actions",
-            xaxis_title="Users",
+            xaxis_title="Usage rows",
             margin=dict(l=50, r=50, t=50, b=50)
         )
 
-        st.plotly_chart(fig_funnel, use_container_width=True)
+        plotly_chart(fig_funnel, "action_funnel")
 
     with chart_rows_bottom[1]:
          # Create a bar chart for channel breakdown
@@ -464,25 +633,104 @@ with tab2:
             channel_breakdown,
             x="channel",
             y="Customer_Count",
-            title="Mailchimp Customer Channel Breakdown",
+            title=f"{product} Customer Channel Breakdown",
             labels={"channel": "Acquisition Channel", "Customer_Count": "Number of Customers"},
             color="Customer_Count",
             color_continuous_scale="Blues"
         )
 
         # Add the chart to Streamlit
-        st.plotly_chart(fig_channel, use_container_width=True)
-    st.markdown("### Insights")
-    st.write(
-        """ From the funnel chart above, we see \n 
+        plotly_chart(fig_channel, "channel_breakdown")
+
+    # Customers who took the product's funnel steps in order, rather than
+    # the usage rows of each action above
+    if product in metrics.funnel_steps and os.path.exists(loading.USAGE_DATA_PATH):
+        st.markdown("### Customer Funnel")
+        start, end = (FILTERS.start, FILTERS.end) if FILTERS is not None else (None, None)
+        ordered = get_ordered_funnel(customer_fp, usage_fp, product, start, end)
+        fig_ordered = go.Figure(go.Funnel(
+            y=ordered.index,
+            x=ordered["customers"],
+            customdata=ordered["median_days_from_previous"],
+            textinfo="value+percent initial+percent previous",
+            hovertemplate="%{y}: %{x:,} customers<br>median %{customdata:.0f} days from the previous step<extra></extra>",
+            marker=dict(color=["#FFE01B", "#FFC30F", "#FFB000", "#FF8000", "#FF6000", "#FF4000", "#FF2000"]),
+        ))
+        fig_ordered.update_layout(
+            title=f"{product} Customers Reaching Each Step in Order",
+            yaxis_title="Steps",
+            xaxis_title="Customers",
+            margin=dict(l=50, r=50, t=50, b=50)
+        )
+        plotly_chart(fig_ordered, "ordered_funnel")
+        st.caption("A customer reaches a step on or after the day they reached the one before"
+                   + (", not filtered by channel" if FILTERS is not None and FILTERS.channels else ""))
+
+    # Distinct customers for any range of days and set of actions, merged
+    # from per-day sketches instead of counted over the usage rows
+    if os.path.exists(loading.USAGE_DATA_PATH):
+        st.markdown("### Distinct Customers")
+        keys = get_sketches(customer_fp, usage_fp).keys
+        keys = keys[keys["product_name"] == product]
+        if keys.empty:
+            st.write(f"No {product} usage to count.")
+        else:
+            action_names = metrics.action_names(product)
+            first_day, last_day = keys["event_date"].min().date(), keys["event_date"].max().date()
+            distinct_columns = st.columns([2, 2, 1])
+            # Usage on a single day leaves no range to pick
+            distinct_range = (first_day, last_day)
+            if first_day < last_day:
+                distinct_range = distinct_columns[0].slider(
+                    "Usage between", first_day, last_day, distinct_range, key=f"distinct_dates_{product}"
+                )
+            distinct_actions = distinct_columns[1].multiselect(
+                "Actions", sorted(keys["action_type_id"].unique().tolist()),
+                format_func=lambda action: action_names.get(action, f"Action {action}"),
+                placeholder="All actions", key=f"distinct_actions_{product}",
+            )
+            exact = distinct_columns[2].checkbox(
+                "Exact count", key="distinct_exact", help="Count the usage rows instead, to check the estimate"
+            )
+            query = (product, tuple(distinct_actions) or None, *distinct_range)
+            estimate = get_distinct_customers(customer_fp, usage_fp, *query)
+            result_columns = st.columns(2)
+            result_columns[0].metric(
+                "Distinct customers (estimate)", f"~{estimate.customers:,}",
+                help=f"HyperLogLog, merged from {estimate.sketches:,} daily sketches",
+            )
+            st.caption(f"Within ±{2 * estimate.relative_error:.1%} of the exact count 95% of the time"
+                       + (", not filtered by channel" if FILTERS is not None and FILTERS.channels else ""))
+            if exact:
+                exact_customers = get_exact_distinct_customers(customer_fp, usage_fp, *query)
+                error = (estimate.customers - exact_customers) / exact_customers if exact_customers else 0
+                result_columns[1].metric(
+                    "Distinct customers (exact)", f"{exact_customers:,}", f"estimate off by {error:+.2%}", delta_color="off"
+                )
+    # The written insights come from the Mailchimp case study
+    if product == "Mailchimp":
+        st.markdown("### Insights")
+        st.write(
+            """ From the funnel chart above, we see \n 
         1. There's a big drop between the Campaigns Created Step and the Subsribers Added Step. \n
         2. Only 14% of customers that login actually end up sending an email campaign \n
         3. Direct channel brings in the most customers
-    """)
+        """)
     
 
-with tab3:
-    st.header("Mailchimp Deep Dive - Churned Users")
+
+@tab_fragment("Churned Users Analysis")
+def churned_users_analysis():
+    product = st.selectbox("Product", products, index=default_product, key="churn_product")
+    action_comparison = get_action_comparison(mode, customer_fp, usage_fp, product, FILTERS)
+    action_types = action_comparison["Action_Type"]
+    churned_percentage = action_comparison["Churned_Percentage"]
+    non_churned_percentage = action_comparison["Non_Churned_Percentage"]
+    churn_by_channel = get_churn_by_channel(mode, customer_fp, product, FILTERS)
+    churned_users_by_channel = churn_by_channel["Churned_Users"]
+    churn_rate_by_channel = churn_by_channel["Churn_Rate"]
+
+    st.header(f"{product} Deep Dive - Churned Users")
     st.markdown("#### What can we learn about churned users?")
     # Wireframe for tiles
     # Create a 2x2 Grid
@@ -529,7 +777,7 @@ with tab3:
         )
 
         # Render the chart in Streamlit
-        st.plotly_chart(fig_comparison, use_container_width=True)
+        plotly_chart(fig_comparison, "action_comparison")
     
     chart_rows_bottom = st.columns(1)
     with chart_rows_bottom[0]:
@@ -539,11 +787,11 @@ with tab3:
         # Add bars for churned users
         fig_comparison.add_trace(
             go.Bar(
-                x=churned_users_by_channel_mailchimp.index,
-                y=churned_users_by_channel_mailchimp.values,
+                x=churned_users_by_channel.index,
+                y=churned_users_by_channel.values,
                 name="Number of Churned Users",
                 marker=dict(color="red"),
-                text=[f"{v}" for v in churned_users_by_channel_mailchimp.values],
+                text=[f"{v}" for v in churned_users_by_channel.values],
                 textposition="outside",
             )
         )
@@ -551,13 +799,13 @@ with tab3:
         # Add a line for churn rate with labels
         fig_comparison.add_trace(
             go.Scatter(
-                x=churn_rate_by_channel_mailchimp.index,
-                y=churn_rate_by_channel_mailchimp.values,
+                x=churn_rate_by_channel.index,
+                y=churn_rate_by_channel.values,
                 mode="lines+markers+text",
                 name="Churn Rate (%)",
                 marker=dict(color="blue"),
                 line=dict(width=2),
-                text=[f"{v:.1f}%" for v in churn_rate_by_channel_mailchimp.values],
+                text=[f"{v:.1f}%" for v in churn_rate_by_channel.values],
                 textposition="top center",
                 textfont=dict(color="black")
             )
@@ -582,10 +830,123 @@ with tab3:
         )
 
         # Render the chart in Streamlit
-        st.plotly_chart(fig_comparison, use_container_width=True)
-    st.markdown("### Insights")
-    st.write(
-        """From the charts above, we can see \n
+        plotly_chart(fig_comparison, "churn_by_channel")
+    # The written insights come from the Mailchimp case study
+    if product == "Mailchimp":
+        st.markdown("### Insights")
+        st.write(
+            """From the charts above, we can see \n
         1. The churned users login activity rate is lower compared to active users. However, the rest of the activity types are equivalent to active users. Implaying that the churned users just dont login to the product UI. 
         2. This represents an opportunity to reduce churn by identifying users with low login rates."
-    """)
\ No newline at end of file
+        """)
+    if product in metrics.login_actions:
+        st.markdown("### At-Risk Customers")
+        top = st.number_input("Customers to list", min_value=5, max_value=500, value=risk.TOP, step=5, key="watchlist_top")
+        watchlist = get_churn_watchlist(mode, customer_fp, usage_fp, product, int(top), FILTERS)
+        if watchlist.customers.empty:
+            st.write(f"No active {product} customers log in less than they used to.")
+        else:
+            st.dataframe(
+                watchlist.customers,
+                column_config={
+                    "customerid": st.column_config.NumberColumn("Customer", format="%d"),
+                    "baseline_logins_per_week": st.column_config.NumberColumn("Baseline log-ins / week", format="%.2f"),
+                    "recent_logins_per_week": st.column_config.NumberColumn("Recent log-ins / week", format="%.2f"),
+                    "drop_pct": st.column_config.NumberColumn("Drop", format="%.0f%%"),
+                    "last_login": st.column_config.DateColumn("Last log-in"),
+                },
+            )
+        st.caption(
+            f"Active customers whose log-ins fell furthest below their own baseline, as of {watchlist.as_of}: "
+            f"recent rate over a {risk.RECENT_HALF_LIFE}-day half-life, baseline over {risk.BASELINE_HALF_LIFE} days. "
+            f"{watchlist.scored:,} of {watchlist.cohort:,} active customers have log-ins to score."
+        )
+
+
+@tab_fragment("Cohort Retention")
+def cohort_retention():
+    st.header("Cohort Retention")
+    st.markdown("#### How long do customers stay?")
+    channels = get_customer_rows(mode, customer_fp)["channel"].dropna().unique().tolist()
+    if FILTERS is not None and FILTERS.channels:
+        channels = [channel for channel in channels if channel in FILTERS.channels]
+    controls = st.columns(4)
+    product = controls[0].selectbox("Product", [None] + products, format_func=lambda p: p or "All products",
+                                    key="retention_product")
+    channel = controls[1].selectbox("Channel", [None] + sorted(channels), format_func=lambda c: c or "All channels",
+                                    key="retention_channel")
+    cohort_by = controls[2].radio("Cohort by", retention.COHORT_COLUMNS, key="retention_cohort_by",
+                                  format_func={"signup_date": "Sign-up", "first_activation_date": "Activation"}.get)
+    period = controls[3].radio("Period", retention.PERIODS, format_func=str.capitalize, key="retention_period")
+    result = get_retention_matrix(mode, customer_fp, product, channel, cohort_by, period, FILTERS)
+    if result.customers.empty:
+        st.write("No activated customers match.")
+        return
+
+    # Ages no cohort has reached yet are all empty
+    rates = result.rates.dropna(axis=1, how="all")
+    labels = result.customers.index.strftime("%Y-%m-%d" if period == "week" else "%b %Y")
+    fig_retention = go.Figure(
+        go.Heatmap(
+            z=rates.to_numpy(),
+            x=rates.columns.tolist(),
+            y=[f"{label} ({customers:,})" for label, customers in zip(labels, result.customers)],
+            colorscale="Blues",
+            zmin=0,
+            zmax=100,
+            text=[[f"{v:.0f}%" if pd.notna(v) else "" for v in row] for row in rates.to_numpy()],
+            texttemplate="%{text}",
+            hovertemplate="Cohort %{y}<br>" + period.capitalize() + " %{x}: %{z:.1f}% still active<extra></extra>",
+            colorbar=dict(title="Still active (%)"),
+        )
+    )
+    fig_retention.update_layout(
+        title=f"Share of each {period}'s cohort still active, by {period}s since",
+        xaxis_title=f"{period.capitalize()}s since the cohort's {period}",
+        yaxis_title="Cohort (activated customers)",
+        yaxis=dict(autorange="reversed"),
+        template="plotly_white",
+        height=max(400, 22 * len(rates) + 150),
+    )
+    plotly_chart(fig_retention, "retention_heatmap")
+    st.caption(f"Only customers who activated count. Ages a cohort has not reached by "
+               f"{retention.last_date(get_customer_rows(mode, customer_fp)):%Y-%m-%d} are left blank.")
+
+
+for tab, body in ((tab1, overview), (tab2, product_deep_dive), (tab3, churned_users_analysis), (tab4, cohort_retention)):
+    if tab.open:
+        with tab:
+            body()
+
+# Warm the rest of the data and start polling the input files, now that the
+# first page no longer competes with it for the CPU
+refresher.start()
+
+if DEBUG_PANEL:
+    with st.sidebar:
+        st.header("Pipeline stages")
+        timings = pd.DataFrame(instrumentation.records())
+        if timings.empty:
+            st.write("No stages ran.")
+        else:
+            # Nested stages are indented under the stage that called them
+            timings["stage"] = ["\u2003" * depth + name for depth, name in zip(timings["depth"], timings["stage"])]
+            st.metric("Total", f"{timings.loc[timings['depth'] == 0, 'seconds'].sum() * 1000:.0f} ms")
+            st.dataframe(
+                timings[["stage", "seconds", "rows_in", "rows_out", "memory_delta_mib"]],
+                hide_index=True,
+                column_config={"seconds": st.column_config.NumberColumn("seconds", format="%.4f")},
+            )
+        # Everything but the widget state is shared with the other sessions
+        st.header("Memory")
+        st.metric("Process RSS", f"{instrumentation.rss_bytes() / 2**20:,.0f} MiB")
+        st.metric("This session's state", f"{shared.state_bytes(st.session_state.to_dict()):,} bytes")
+        # Rows breaking a rule stay in the KPIs, with their unparsed values missing
+        st.header("Data validation")
+        for path in (loading.CUSTOMER_DATA_PATH, loading.USAGE_DATA_PATH):
+            report = ingest.validation_report(path) if os.path.exists(path) else None
+            if report is None:
+                st.write(f"`{path}` has not been ingested in this mode.")
+                continue
+            st.write(f"`{path}`: {report['rows']:,} rows, {validation.violations(report['checks']):,} rule violations")
+            st.dataframe(validation.report_frame(report["checks"], report["rows"]), hide_index=True)
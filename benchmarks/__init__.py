@@ -0,0 +1 @@
+"""Benchmarks for the dashboard pipeline; run each module with ``python -m``."""
@@ -0,0 +1,134 @@
+"""Synthetic ``customer_data.csv`` and ``usage_data.csv`` at any scale.
+
+The files follow the schema of the real exports: 16-digit customer ids,
+about 45% of sign-ups that never activate a product, the four products in
+equal shares, the five acquisition channels in their observed mix, churn
+around 30% of activated customers, dates formatted like ``6/21/21`` and the
+seven Mailchimp action IDs with a funnel-shaped mix in which churned
+customers log in less. Customers are generated and written in blocks, so
+memory stays flat up to 10M customers.
+
+    python -m benchmarks.generate_data --customers 1000000
+
+The files go to ``benchmarks/data`` unless ``--out`` says otherwise; pointing
+it at ``data`` replaces the real customer export checked in there.
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+PRODUCTS = ["Mailchimp", "Mint", "QuickBooks", "TurboTax"]
+CHANNELS = ["Direct", "PPC", "Other", "Sales", "SEO"]
+CHANNEL_SHARES = [0.30, 0.20, 0.18, 0.17, 0.15]
+
+ACTIVATION_RATE = 0.55
+PURCHASE_RATE = 0.45
+CHURN_RATE = 0.30
+
+# Action mix by id: 5 Log-Ins, 7 Campaigns Created, 4 Subscribers Added,
+# 3 Templates Edited, 2 Email Campaigns Sent, 1 Deleted, 6 Un-sent
+ACTION_IDS = np.array([5, 7, 4, 3, 2, 1, 6])
+ACTION_SHARES = np.array([0.40, 0.25, 0.10, 0.09, 0.06, 0.05, 0.05])
+CHURNED_ACTION_SHARES = np.array([0.28, 0.29, 0.12, 0.11, 0.08, 0.06, 0.06])
+
+START_DATE = pd.Timestamp("2021-06-01")
+END_DATE = pd.Timestamp("2022-06-30")
+SIGNUP_DAYS = 30
+
+BLOCK_SIZE = 1_000_000
+
+# A scratch directory, so a bare run never overwrites the real data/ exports
+DEFAULT_OUT = os.path.join(os.path.dirname(__file__), "data")
+
+# Ids start at the range seen in the real export and stay unique per block
+_ID_BASE = 9_130_350_000_000_000
+_ID_STRIDE = 1_000
+
+
+def _date_strings():
+    days = pd.date_range(START_DATE, END_DATE, freq="D")
+    return np.array([f"{d.month}/{d.day}/{d:%y}" for d in days] + [""], dtype=object)
+
+
+def _format_dates(offsets, valid, date_strings):
+    # Offsets past the window and missing dates map to the trailing ""
+    offsets = np.where(valid, np.minimum(offsets, len(date_strings) - 2), len(date_strings) - 1)
+    return date_strings[offsets]
+
+
+def generate_block(first, n, rng, events_per_customer=10, date_strings=None):
+    """Customers ``first``..``first + n`` and their usage, as CSV-ready frames."""
+    date_strings = _date_strings() if date_strings is None else date_strings
+    last_day = len(date_strings) - 2
+
+    ids = _ID_BASE + (first + np.arange(n)) * _ID_STRIDE + rng.integers(0, _ID_STRIDE, n)
+    activated = rng.random(n) < ACTIVATION_RATE
+    product = rng.integers(0, len(PRODUCTS), n)
+    signup = rng.integers(0, SIGNUP_DAYS, n)
+    activation = signup + rng.geometric(0.5, n) - 1
+    purchase = activation + rng.integers(0, 30, n)
+    cancel = activation + rng.integers(1, 150, n)
+    churned = activated & (rng.random(n) < CHURN_RATE)
+
+    customers = pd.DataFrame({
+        "customerid": ids,
+        "product_name": np.where(activated, np.array(PRODUCTS, dtype=object)[product], ""),
+        "signup_date": _format_dates(signup, True, date_strings),
+        "channel": np.array(CHANNELS, dtype=object)[rng.choice(len(CHANNELS), n, p=CHANNEL_SHARES)],
+        "first_activation_date": _format_dates(activation, activated, date_strings),
+        "first_purchase_date": _format_dates(purchase, activated & (rng.random(n) < PURCHASE_RATE), date_strings),
+        "cancel_date": _format_dates(cancel, churned, date_strings),
+    })
+
+    # Usage events fall between activation and cancellation (or the end date)
+    active = np.flatnonzero(activated)
+    events = rng.poisson(events_per_customer, len(active))
+    owner = np.repeat(active, events)
+    first_day = activation[owner]
+    last = np.where(churned[owner], cancel[owner], last_day)
+    event_day = first_day + (rng.random(len(owner)) * (np.maximum(last, first_day) - first_day + 1)).astype(np.int64)
+    action_draw = rng.random(len(owner))
+    actions = np.where(
+        churned[owner],
+        ACTION_IDS[np.searchsorted(CHURNED_ACTION_SHARES.cumsum(), action_draw * CHURNED_ACTION_SHARES.sum())],
+        ACTION_IDS[np.searchsorted(ACTION_SHARES.cumsum(), action_draw * ACTION_SHARES.sum())],
+    )
+    usage = pd.DataFrame({
+        "customerid": ids[owner],
+        "product_name": np.array(PRODUCTS, dtype=object)[product[owner]],
+        "action_type_id": actions,
+        "usage_count": rng.integers(1, 21, len(owner)),
+        "event_date": _format_dates(event_day, True, date_strings),
+    })
+    return customers, usage
+
+
+def generate(out_dir, customers, events_per_customer=10, seed=0, block_size=BLOCK_SIZE):
+    """Write ``customer_data.csv`` and ``usage_data.csv`` for ``customers`` customers."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    date_strings = _date_strings()
+    paths = os.path.join(out_dir, "customer_data.csv"), os.path.join(out_dir, "usage_data.csv")
+    for first in range(0, customers, block_size):
+        blocks = generate_block(first, min(block_size, customers - first), rng, events_per_customer, date_strings)
+        for block, path in zip(blocks, paths):
+            block.to_csv(path, mode="w" if first == 0 else "a", header=first == 0, index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--events-per-customer", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    args = parser.parse_args()
+    for path in generate(args.out, args.customers, args.events_per_customer, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
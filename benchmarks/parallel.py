@@ -0,0 +1,87 @@
+"""Scaling of :mod:`pipeline.parallel` with the number of worker processes.
+
+    python -m benchmarks.parallel --customers 1000000 --workers 1 4 16
+
+For each worker count, reports the wall time of the aggregation with a
+fresh pool (including worker start-up) and with a warm pool. It also
+checks that every run merges to the same aggregates as the serial run.
+Results are written as JSON next to those of :mod:`benchmarks.pipeline`.
+Speed-up is bounded by the cores of the host, which is recorded with the
+results.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks import generate_data
+from benchmarks.pipeline import RESULTS_DIR, _git_commit
+from pipeline import ingest, parallel
+
+
+def run(customer_path, usage_path, worker_counts, repeat=3):
+    # Build the columnar copies first, so no run pays for parsing the CSVs
+    ingest.customer_columnar(customer_path)
+    ingest.usage_columnar(usage_path)
+    serial = parallel.aggregate(customer_path, usage_path, workers=1)
+
+    records = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        with parallel.executor(workers) as pool:
+            result = parallel.aggregate(customer_path, usage_path, workers, pool=None if workers == 1 else pool)
+            # The first run started every worker, so later runs reuse them
+            cold = time.perf_counter() - start
+            warm = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = parallel.aggregate(customer_path, usage_path, workers, pool=None if workers == 1 else pool)
+                warm.append(time.perf_counter() - start)
+        for merged, expected in zip(result, serial):
+            pd.testing.assert_frame_equal(merged, expected)
+        record = {"workers": workers, "cold_seconds": round(cold, 3), "warm_seconds": round(min(warm), 3)}
+        print(f"{workers:>3} workers  cold {cold:7.2f}s  warm {min(warm):7.2f}s")
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--events-per-customer", type=float, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--data-dir", help="directory with customer_data.csv and usage_data.csv to reuse")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/parallel-<customers>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        customer_path = os.path.join(data_dir, "customer_data.csv")
+        usage_path = os.path.join(data_dir, "usage_data.csv")
+        if not (os.path.exists(customer_path) and os.path.exists(usage_path)):
+            generate_data.generate(data_dir, args.customers, args.events_per_customer)
+        records = run(customer_path, usage_path, args.workers)
+        customers = len(ingest.load_customer_data(customer_path))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"parallel-{customers}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "customers": customers,
+            "cpu_count": os.cpu_count(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "runs": records,
+        }, f, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Wall time and peak memory of each pipeline stage behind app.py.
+
+Generates synthetic data (see :mod:`benchmarks.generate_data`) unless
+``--data-dir`` already holds both CSVs, times every stage on its own and
+writes the results as JSON so runs can be diffed for regressions:
+
+    python -m benchmarks.pipeline --customers 1000000
+
+Peak memory is the rise of the process's resident high-water mark during
+the stage, which the Linux kernel lets us reset between stages; it counts
+pandas, NumPy and Arrow buffers alike and costs nothing while the stage
+runs. On other platforms it is reported as null.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import generate_data
+from pipeline import cube, customer_index, funnel, ingest, loading, metrics, retention, risk, sketches, stages, timeline
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _rss_kib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def _reset_peak_rss():
+    try:
+        # Writing 5 resets the VmHWM high-water mark to the current RSS
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _rss_kib("VmRSS")
+    except OSError:
+        return None
+
+
+def measure(name, stage):
+    """Run ``stage()`` and return its result with a timing record."""
+    rss_before = _reset_peak_rss()
+    start = time.perf_counter()
+    result = stage()
+    seconds = time.perf_counter() - start
+    peak_mib = None if rss_before is None else round((_rss_kib("VmHWM") - rss_before) / 1024, 1)
+    record = {"stage": name, "seconds": round(seconds, 4), "peak_mib": peak_mib}
+    print(f"{name:<28} {seconds:8.3f}s {peak_mib if peak_mib is not None else '-':>9} MiB")
+    return result, record
+
+
+def run(customer_path, usage_path):
+    records = []
+
+    def stage(name, fn):
+        result, record = measure(name, fn)
+        records.append(record)
+        return result
+
+    stage("load_csv", lambda: (loading.read_customer_data(customer_path), loading.read_usage_data(usage_path)))
+    for path in (customer_path, usage_path):
+        if os.path.exists(ingest.columnar_path(path)):
+            os.remove(ingest.columnar_path(path))
+    stage("load_columnar_build", lambda: (ingest.load_customer_data(customer_path), ingest.load_usage_data(usage_path)))
+    customer_data, usage_data = stage(
+        "load_columnar", lambda: (ingest.load_customer_data(customer_path), ingest.load_usage_data(usage_path))
+    )
+
+    stage("action_type_mapping", lambda: metrics.map_action_types(usage_data))
+    stage("customer_summary", lambda: stages.customer_summary(customer_data, usage_data))
+    customer_cube = stage("customer_cube", lambda: cube.customer_cube(customer_data))
+    usage_cube = stage("usage_cube", lambda: cube.usage_cube(customer_data, usage_data))
+    stage("customer_summary_cube", lambda: cube.customer_summary(customer_cube, usage_cube))
+    stage("mailchimp_time_series", lambda: stages.daily_customer_series(customer_data, "Mailchimp"))
+    stage("active_timeline", lambda: timeline.active_timeline(customer_data))
+    stage("retention_matrix", lambda: retention.retention_matrix(customer_data, period="week"))
+    stage("churn_comparison", lambda: stages.action_comparison(customer_data, usage_data, "Mailchimp"))
+    index = stage("customer_index", lambda: customer_index.build_customer_index(customer_data, usage_data))
+    stage("churn_comparison_index", lambda: customer_index.action_comparison(index, "Mailchimp"))
+    stage("ordered_funnel", lambda: funnel.ordered_funnel(usage_data, metrics.funnel_steps["Mailchimp"], "Mailchimp", 30))
+    if os.path.exists(sketches.sketch_path(usage_path)):
+        os.remove(sketches.sketch_path(usage_path))
+    stage("sketches_build", lambda: sketches.build(usage_path))
+    usage_sketches = stage("sketches_load", lambda: sketches.load([usage_path]))
+    stage("distinct_customers_sketch", lambda: sketches.distinct_customers(usage_sketches, "Mailchimp", [5]))
+    stage("distinct_customers_exact", lambda: sketches.exact_distinct([usage_data], "Mailchimp", [5]))
+    if os.path.exists(risk.activity_path(usage_path)):
+        os.remove(risk.activity_path(usage_path))
+    stage("login_activity_build", lambda: risk.build(usage_path))
+    activity = stage("login_activity_load", lambda: risk.load([usage_path]))
+    stage("churn_risk_watchlist", lambda: risk.watchlist(activity, risk.active_customers(customer_data)))
+    return records, len(customer_data), len(usage_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--events-per-customer", type=float, default=10)
+    parser.add_argument("--data-dir", help="directory with customer_data.csv and usage_data.csv to reuse")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/pipeline-<customers>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        customer_path = os.path.join(data_dir, "customer_data.csv")
+        usage_path = os.path.join(data_dir, "usage_data.csv")
+        if not (os.path.exists(customer_path) and os.path.exists(usage_path)):
+            generate_data.generate(data_dir, args.customers, args.events_per_customer)
+        records, customers, usage_rows = run(customer_path, usage_path)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{customers}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "customers": customers,
+            "usage_rows": usage_rows,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "stages": records,
+        }, f, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
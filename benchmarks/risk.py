@@ -0,0 +1,103 @@
+"""Time to score the churn-risk watchlist of :mod:`pipeline.risk` at scale.
+
+    python -m benchmarks.risk --customers 1000000
+
+Generates log-ins of that many active Mailchimp customers over the dates of
+:mod:`benchmarks.generate_data`, a fifth of whom stop logging in at some
+point, and times folding the history, folding one more day's partition into
+it and picking the top of the watchlist from every customer. Checks that the
+heap picks the same customers as a full sort, and writes the results as
+JSON next to those of :mod:`benchmarks.pipeline`.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import generate_data
+from benchmarks.pipeline import RESULTS_DIR, _git_commit, measure
+from pipeline import risk
+
+DROPPING_SHARE = 0.2
+
+
+def login_usage(customers, logins_per_customer=20, seed=0):
+    """Typed usage rows holding only Mailchimp log-ins, ordered by day."""
+    rng = np.random.default_rng(seed)
+    days = (generate_data.END_DATE - generate_data.START_DATE).days + 1
+    ids = np.arange(customers, dtype=np.int64) + 9_130_350_000_000_000
+    # Customers who drop off stop logging in somewhere in the second half
+    last_day = np.where(rng.random(customers) < DROPPING_SHARE, rng.integers(days // 2, days, customers), days - 1)
+    owner = np.repeat(np.arange(customers), rng.poisson(logins_per_customer, customers))
+    event_day = (rng.random(len(owner)) * (last_day[owner] + 1)).astype(np.int64)
+    order = np.argsort(event_day, kind="stable")
+    return pd.DataFrame({
+        "customerid": ids[owner[order]],
+        "product_name": pd.Categorical(["Mailchimp"] * len(owner)),
+        "action_type_id": np.full(len(owner), 5, dtype=np.int8),
+        "usage_count": rng.integers(1, 4, len(owner)).astype(np.int32),
+        "event_date": generate_data.START_DATE + pd.to_timedelta(event_day[order], unit="D"),
+    }), ids
+
+
+def _check(activity, cohort, result):
+    scores = (risk._weekly_rate(activity.baseline, risk.BASELINE_HALF_LIFE)
+              - risk._weekly_rate(activity.recent, risk.RECENT_HALF_LIFE))
+    expected = activity.customerid[np.lexsort((-activity.customerid, -scores))[:len(result.customers)]]
+    assert np.isin(expected, cohort).all()
+    np.testing.assert_array_equal(result.customers["customerid"].to_numpy(), expected)
+
+
+def run(customers, logins_per_customer, top):
+    records = []
+
+    def stage(name, fn):
+        result, record = measure(name, fn)
+        records.append(record)
+        return result
+
+    usage, cohort = login_usage(customers, logins_per_customer)
+    last_day = usage["event_date"].iloc[-1]
+    new_partition = usage["event_date"] == last_day
+    history, partition = usage[~new_partition], usage[new_partition]
+    activity = stage("login_activity_history", lambda: risk.login_activity(history))
+    activity = stage("login_activity_update", lambda: risk.update(activity, partition))
+    result = stage("watchlist", lambda: risk.watchlist(activity, cohort, top))
+    stage("update_and_watchlist", lambda: risk.watchlist(risk.update(activity, partition), cohort, top))
+    _check(activity, cohort, result)
+    return records, result.scored, len(usage), len(partition)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--logins-per-customer", type=float, default=20)
+    parser.add_argument("--top", type=int, default=100)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/risk-<customers>.json)")
+    args = parser.parse_args()
+
+    records, scored, usage_rows, partition_rows = run(args.customers, args.logins_per_customer, args.top)
+    output = args.output or os.path.join(RESULTS_DIR, f"risk-{scored}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "customers": scored,
+            "usage_rows": usage_rows,
+            "partition_rows": partition_rows,
+            "top": args.top,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "stages": records,
+        }, f, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
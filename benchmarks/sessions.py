@@ -0,0 +1,135 @@
+"""Process memory of many dashboard sessions held open at once.
+
+    python -m benchmarks.sessions --sessions 20 --data-dir data
+
+Opens ``--sessions`` sessions of app.py with Streamlit's AppTest in one
+process, the way one server process holds every browser session. Each
+session visits every tab with every product. All sessions stay open, so:
+
+- shared memory is what the process grew by for the first session
+- each further session adds the per-session figure
+- the peak also counts the copies that only live while a page is computed
+
+AppTest keeps a session's widget state and rendered elements, but not the
+websocket buffers of a real browser connection. Treat the per-session
+figure as a lower bound when sizing replicas.
+"""
+
+import argparse
+import ctypes
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import pyarrow as pa
+
+from benchmarks.pipeline import RESULTS_DIR, _git_commit, _reset_peak_rss, _rss_kib
+from pipeline import instrumentation, ingest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABS = ["Intuit Overview", "Product Deep Dive", "Churned Users Analysis"]
+PRODUCT_KEYS = {"Product Deep Dive": "deep_dive_product", "Churned Users Analysis": "churn_product"}
+
+
+def _rss_mib():
+    gc.collect()
+    try:
+        # Hand freed heap back to the OS, so RSS counts live memory only
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except OSError:
+        pass
+    return instrumentation.rss_bytes() / 2**20
+
+
+def _rows(columnar_path):
+    # Counted from the mapped file, so the baseline holds no loaded table
+    with pa.memory_map(columnar_path) as source:
+        return pa.ipc.open_file(source).read_all().num_rows
+
+
+def open_session(app_path):
+    """A session of ``app_path`` that has rendered every tab for every product."""
+    from streamlit.testing.v1 import AppTest
+
+    session = AppTest.from_file(app_path, default_timeout=600)
+    session.run()
+    for tab in TABS:
+        session.session_state["tab"] = tab
+        session.run()
+        if tab in PRODUCT_KEYS:
+            for product in session.selectbox(key=PRODUCT_KEYS[tab]).options:
+                session.selectbox(key=PRODUCT_KEYS[tab]).set_value(product).run()
+        if session.exception:
+            raise RuntimeError(f"{tab}: {session.exception[0].value}")
+    return session
+
+
+def run(app_path, sessions):
+    baseline = _rss_mib()
+    _reset_peak_rss()
+    rss = []
+    opened = []
+    for _ in range(sessions):
+        opened.append(open_session(app_path))
+        rss.append(_rss_mib())
+    # The second session can still warm caches the first did not reach
+    steady = rss[1:] if sessions > 2 else rss
+    record = {
+        "sessions": sessions,
+        "baseline_mib": round(baseline, 1),
+        "shared_mib": round(rss[0] - baseline, 1),
+        "total_mib": round(rss[-1], 1),
+        "per_session_mib": round((steady[-1] - steady[0]) / max(len(steady) - 1, 1), 2),
+        "rss_mib": [round(value, 1) for value in rss],
+        # Pages of memory-mapped files are page cache that other processes share
+        "file_backed_mib": round(_rss_kib("RssFile") / 2**10, 1),
+        # Includes the copies that only live while a page is being computed
+        "peak_mib": round(_rss_kib("VmHWM") / 2**10, 1),
+    }
+    print(f"shared {record['shared_mib']:.1f} MiB, {record['per_session_mib']:.2f} MiB per further session, "
+          f"{record['total_mib']:.1f} MiB for {sessions} sessions "
+          f"({record['file_backed_mib']:.1f} MiB file-backed), peak {record['peak_mib']:.1f} MiB")
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--data-dir", default=os.path.join(REPO, "data"),
+                        help="directory with customer_data.csv and usage_data.csv")
+    parser.add_argument("--app", default=os.path.join(REPO, "app.py"))
+    parser.add_argument("--output", help="results file (default: benchmarks/results/sessions-<customers>.json)")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir)
+    customers = _rows(ingest.customer_columnar(os.path.join(data_dir, "customer_data.csv")))
+    usage_rows = _rows(ingest.usage_columnar(os.path.join(data_dir, "usage_data.csv")))
+    app_path = os.path.abspath(args.app)
+    # The app reads data/ relative to its working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        os.symlink(data_dir, os.path.join(workdir, "data"))
+        os.chdir(workdir)
+        sys.path.insert(0, REPO)
+        record = run(app_path, args.sessions)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"sessions-{customers}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "customers": customers,
+            "usage_rows": usage_rows,
+            "app": os.path.relpath(app_path, REPO),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            **record,
+        }, f, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Query latency of the SQLite backend under the dashboard's filters.
+
+    python -m benchmarks.sql --customers 1000000 --events-per-customer 10
+
+Builds the database of :mod:`pipeline.sql` once, checks that the unfiltered
+queries return the same frames as the cube, then times every query the
+dashboard runs for one filter setting (the summary and, per product, the
+funnel, daily series, channel breakdown, churn comparison and churn by
+channel) under a few filter combinations. Results are written as JSON next
+to those of :mod:`benchmarks.pipeline`.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks import generate_data
+from benchmarks.pipeline import RESULTS_DIR, _git_commit
+from pipeline import cube, ingest, sql
+
+
+def _same(result, expected):
+    # Channels come back as plain strings rather than categoricals
+    result, expected = (frame.set_axis(frame.index.astype(object)) for frame in (result, expected))
+    if isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(result, expected, check_dtype=False)
+    else:
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def _check(database, customer_path, usage_path):
+    customer_data = ingest.load_customer_data(customer_path)
+    customer_cube = cube.customer_cube(customer_data)
+    usage_cube = cube.usage_cube(customer_data, ingest.load_usage_data(usage_path))
+    _same(database.customer_summary(), cube.customer_summary(customer_cube, usage_cube))
+    for product in database.products:
+        _same(database.action_funnel(product), cube.action_funnel(usage_cube, product))
+        _same(database.churn_by_channel(product), cube.churn_by_channel(customer_cube, product))
+
+
+def filter_settings(database):
+    start, end = database.date_window
+    middle = start + (end - start) / 2
+    channels = tuple(database.channels[:2])
+    return {
+        "none": sql.NO_FILTERS,
+        "date range": sql.Filters(start=middle, end=end),
+        "channels": sql.Filters(channels=channels),
+        "date range, channels, product": sql.Filters(middle, end, channels, tuple(database.products[:1])),
+    }
+
+
+def run(database, repeat=5):
+    records = []
+    for name, filters in filter_settings(database).items():
+        products = filters.products or database.products
+        timings = {"customer_summary": []}
+        timings.update({stage: [] for stage in ("action_funnel", "daily_customer_series", "channel_breakdown",
+                                                  "action_comparison", "churn_by_channel")})
+        for _ in range(repeat):
+            start = time.perf_counter()
+            database.customer_summary(filters)
+            timings["customer_summary"].append(time.perf_counter() - start)
+            for stage in list(timings)[1:]:
+                # One product's query, as a tab runs it
+                start = time.perf_counter()
+                getattr(database, stage)(products[0], filters)
+                timings[stage].append(time.perf_counter() - start)
+        record = {"filters": name, "ms": {stage: round(statistics.median(t) * 1000, 2) for stage, t in timings.items()}}
+        record["tab_ms"] = {
+            "overview": record["ms"]["customer_summary"],
+            "deep dive": round(sum(record["ms"][stage] for stage in
+                                   ("customer_summary", "action_funnel", "daily_customer_series", "channel_breakdown")), 2),
+            "churn": round(record["ms"]["action_comparison"] + record["ms"]["churn_by_channel"], 2),
+        }
+        print(f"{name:<32}" + "  ".join(f"{tab} {ms:6.1f}ms" for tab, ms in record["tab_ms"].items()))
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--events-per-customer", type=float, default=10)
+    parser.add_argument("--data-dir", help="directory with customer_data.csv and usage_data.csv to reuse")
+    parser.add_argument("--usage-data", help="usage CSV to use instead of the one in --data-dir")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/sql-<usage rows>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        customer_path = os.path.join(data_dir, "customer_data.csv")
+        usage_path = args.usage_data or os.path.join(data_dir, "usage_data.csv")
+        if not (os.path.exists(customer_path) and os.path.exists(usage_path)):
+            generate_data.generate(data_dir, args.customers, args.events_per_customer)
+        start = time.perf_counter()
+        database = sql.Database(sql.build(customer_path, usage_path, os.path.join(tmp, "pipeline.sqlite")))
+        build_seconds = time.perf_counter() - start
+        print(f"built in {build_seconds:.1f}s")
+        _check(database, customer_path, usage_path)
+        records = run(database)
+        customers = database.query("SELECT COUNT(*) AS n FROM customers")["n"].iloc[0]
+        usage_rows = database.query("SELECT COUNT(*) AS n FROM usage")["n"].iloc[0]
+        database_bytes = os.path.getsize(database.path)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"sql-{usage_rows}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "customers": int(customers),
+            "usage_rows": int(usage_rows),
+            "build_seconds": round(build_seconds, 3),
+            "database_mib": round(database_bytes / 2**20, 1),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "runs": records,
+        }, f, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Scaling of the active-customer timeline engine with customer count.
+
+    python -m benchmarks.timeline 100000 1000000 10000000
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from pipeline import timeline
+
+PRODUCTS = ["Mailchimp", "Mint", "QuickBooks", "TurboTax"]
+CHANNELS = ["Direct", "Other", "PPC", "SEO", "Sales"]
+
+
+def synthetic_customers(n, seed=0):
+    rng = np.random.default_rng(seed)
+    activation = pd.Timestamp("2021-05-01") + pd.to_timedelta(rng.integers(0, 425, n), unit="D")
+    # Roughly 30% of customers cancel within a year of activating
+    cancel = activation + pd.to_timedelta(rng.integers(1, 365, n), unit="D")
+    cancel = cancel.where(rng.random(n) < 0.3)
+    return pd.DataFrame({
+        "product_name": pd.Categorical.from_codes(rng.integers(0, len(PRODUCTS), n), PRODUCTS),
+        "channel": pd.Categorical.from_codes(rng.integers(0, len(CHANNELS), n), CHANNELS),
+        "first_activation_date": activation,
+        "cancel_date": cancel,
+    })
+
+
+def main(sizes):
+    for n in sizes:
+        customers = synthetic_customers(n)
+        start = time.perf_counter()
+        timeline.active_timeline(customers)
+        elapsed = time.perf_counter() - start
+        print(f"{n:>11,} customers: {elapsed:7.3f}s  {elapsed / n * 1e9:6.1f} ns/customer")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000])
@@ -0,0 +1,9 @@
+"""Data pipeline behind the case study dashboard."""
+
+from pipeline.metrics import (
+    action_keys,
+    action_lookup,
+    map_action_types,
+    north_star_actuals,
+    north_star_metrics,
+)
@@ -0,0 +1,101 @@
+"""Chart-sized views of long time series.
+
+A daily series spanning years (or one line per product and channel) has
+far more points than a chart is pixels wide. :func:`chart_series` cuts a
+series to the visible date range and downsamples what is left to a point
+budget, so the figure sent to the browser stays small while peaks, dips
+and the overall shape survive. Narrow ranges fit the budget and are drawn
+at full resolution.
+"""
+
+import numpy as np
+import pandas as pd
+
+# About two points per pixel of a half-width chart
+MAX_CHART_POINTS = 1_500
+
+# Above this many points charts are drawn with WebGL (go.Scattergl)
+WEBGL_THRESHOLD = 1_000
+
+
+def lttb(x, y, n_out):
+    """Indices of ``n_out`` points chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points in between are
+    split into ``n_out - 2`` buckets and each bucket keeps the point forming
+    the largest triangle with the previously kept point and the mean of the
+    next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of each bucket, with the last point as the bucket after the last
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    next_x = np.append((sums_x / sizes)[1:], x[-1])
+    next_y = np.append((sums_y / sizes)[1:], y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    kept = 0
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        area = np.abs(
+            (x[kept] - next_x[bucket]) * (y[lo:hi] - y[kept])
+            - (x[kept] - x[lo:hi]) * (next_y[bucket] - y[kept])
+        )
+        kept = lo + int(area.argmax())
+        indices[bucket + 1] = kept
+    return indices
+
+
+def minmax(y, n_out):
+    """Indices of the minimum and maximum of equal buckets, and of both ends, in order.
+
+    There are ``(n_out - 2) // 2`` buckets, so the ends added to them stay
+    within ``n_out`` points.
+    """
+    n = len(y)
+    buckets = (n_out - 2) // 2
+    if n_out >= n:
+        return np.arange(n)
+    if buckets < 1:
+        return np.array([0, n - 1])
+    y = np.asarray(y, dtype=np.float64)
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, width)
+    # Trailing buckets may be padding only
+    filled = ~np.isnan(padded).all(axis=1)
+    starts = np.arange(buckets)[filled] * width
+    lows = starts + np.nanargmin(padded[filled], axis=1)
+    highs = starts + np.nanargmax(padded[filled], axis=1)
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def downsample(series, max_points=MAX_CHART_POINTS, method="lttb"):
+    """``series`` reduced to at most about ``max_points`` points."""
+    if len(series) <= max_points:
+        return series
+    if method == "lttb":
+        x = series.index.to_numpy(dtype=np.int64) if isinstance(series.index, pd.DatetimeIndex) else series.index
+        indices = lttb(x, series.to_numpy(), max_points)
+    elif method == "minmax":
+        indices = minmax(series.to_numpy(), max_points)
+    else:
+        raise ValueError(f"unknown downsampling method {method!r}")
+    return series.iloc[indices]
+
+
+def chart_series(series, start=None, end=None, max_points=MAX_CHART_POINTS, method="lttb"):
+    """The part of ``series`` between ``start`` and ``end``, downsampled for drawing."""
+    return downsample(series.loc[start:end], max_points, method)
+
+
+def use_webgl(series):
+    return len(series) > WEBGL_THRESHOLD
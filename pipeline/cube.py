@@ -0,0 +1,87 @@
+"""KPI cube built with one grouped pass over each table.
+
+``customer_cube`` counts customers per product, channel, activation date and
+cancel date; ``usage_cube`` counts usage rows and sums ``usage_count`` per
+product, channel, action and day. Every tile, funnel, channel breakdown and
+daily series of any product is then a slice of these small frames instead of
+a fresh scan of the full tables. Both expect the typed frames from
+:mod:`pipeline.ingest`.
+"""
+
+import pandas as pd
+
+from pipeline import metrics, stages
+
+CUSTOMER_KEYS = ["product_name", "channel", "first_activation_date", "cancel_date"]
+USAGE_KEYS = ["product_name", "channel", "action_type_id", "event_date"]
+
+
+def customer_cube(customer_data):
+    """Customer counts per product x channel x activation day x cancel day."""
+    # dropna=False keeps never-activated and still-active customers
+    return customer_data.groupby(CUSTOMER_KEYS, observed=True, dropna=False).size().rename("customers").reset_index()
+
+
+def usage_cube(customer_data, usage_data):
+    """Usage rows and ``usage_count`` per product x channel x action x day."""
+    # Usage rows take the channel the customer signed up through for that product
+    channels = customer_data[["customerid", "product_name", "channel"]].drop_duplicates(["customerid", "product_name"])
+    usage = usage_data.merge(channels, how="left", on=["customerid", "product_name"])
+    by_key = usage.groupby(USAGE_KEYS, observed=True, dropna=False)["usage_count"]
+    return by_key.agg(rows="size", usage_count="sum").reset_index()
+
+
+def _product(cube, product):
+    return cube[cube["product_name"] == product]
+
+
+def customer_summary(customer_cube, usage_cube):
+    """Same frame as :func:`pipeline.stages.customer_summary`."""
+    activated = customer_cube["first_activation_date"].notna()
+    cancelled = customer_cube["cancel_date"].notna()
+
+    def by_product(mask):
+        return customer_cube[mask].groupby("product_name", observed=True)["customers"].sum()
+
+    action_sums = usage_cube.groupby(["product_name", "action_type_id"], observed=True)["usage_count"].sum()
+    return stages.summary_frame(
+        by_product(activated),
+        by_product(activated & ~cancelled),
+        by_product(cancelled),
+        metrics.select_north_star(action_sums),
+    )
+
+
+def action_funnel(usage_cube, product="Mailchimp", actions_key=None):
+    """Same series as :func:`pipeline.stages.action_funnel`."""
+    actions_key = metrics.action_names(product) if actions_key is None else actions_key
+    action_counts = _product(usage_cube, product).groupby("action_type_id")["rows"].sum().rename("count")
+    return stages.name_funnel(action_counts.sort_values(ascending=False), actions_key)
+
+
+def daily_customer_series(customer_cube, product="Mailchimp", start_date=stages.START_DATE, end_date=stages.END_DATE):
+    """Same frame as :func:`pipeline.stages.daily_customer_series`."""
+    product_cube = _product(customer_cube, product)
+    full_date_range = pd.date_range(start=start_date, end=end_date, freq="D")
+    cumulative_activated = product_cube.groupby("first_activation_date")["customers"].sum().reindex(full_date_range, fill_value=0).cumsum()
+    cumulative_cancelled = product_cube.groupby("cancel_date")["customers"].sum().reindex(full_date_range, fill_value=0).cumsum()
+    return pd.DataFrame({
+        "Cumulative_Activated": cumulative_activated,
+        "Cumulative_Cancelled": cumulative_cancelled,
+        "Active": cumulative_activated - cumulative_cancelled,
+    })
+
+
+def channel_breakdown(customer_cube, product="Mailchimp"):
+    """Same frame as :func:`pipeline.stages.channel_breakdown`."""
+    breakdown = _product(customer_cube, product).groupby("channel", observed=True)["customers"].sum()
+    breakdown = breakdown.reset_index(name="Customer_Count")
+    return breakdown.sort_values(by="Customer_Count", ascending=False)
+
+
+def churn_by_channel(customer_cube, product="Mailchimp"):
+    """Same frame as :func:`pipeline.stages.churn_by_channel`."""
+    product_cube = _product(customer_cube, product)
+    lifetime_activated_by_channel = product_cube[product_cube["first_activation_date"].notna()].groupby("channel", observed=True)["customers"].sum()
+    churned_users_by_channel = product_cube[product_cube["cancel_date"].notna()].groupby("channel", observed=True)["customers"].sum()
+    return stages.channel_churn(churned_users_by_channel, lifetime_activated_by_channel)
@@ -0,0 +1,131 @@
+"""Usage indexed by customer for cohort comparisons without joins.
+
+Usage rows are grouped by ``customerid`` once, with ``offsets`` counting
+each customer's rows, and reduced to a customers x actions matrix of row
+counts and ``usage_count`` totals; the rows themselves are not kept. Every
+row of the customer table is mapped to its position in that index and
+carries a ``churned`` flag. Splitting customers into any set of cohorts
+(churned/active, by channel, by product, or combinations) is then one
+``np.bincount`` over cohort x action, whatever the number of cohorts, and
+never materializes a merged copy of the usage table.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics, stages
+
+# Stand-in for unparseable ids, which the pandas merges match to each other
+_MISSING_ID = np.iinfo(np.int64).min
+
+
+class CustomerIndex(NamedTuple):
+    # Sorted unique customer ids that have usage
+    customer_ids: np.ndarray
+    # Customer i had offsets[i + 1] - offsets[i] usage rows
+    offsets: np.ndarray
+    # Action ids of the columns of the per-customer matrices
+    actions: pd.Index
+    # Usage rows and usage_count totals, shaped (customers, actions)
+    action_rows: np.ndarray
+    action_totals: np.ndarray
+    # One row per customer table row: index position (-1 without usage),
+    # product_name, channel and churned flag
+    customers: pd.DataFrame
+
+
+def _ids(values):
+    return pd.array(values, dtype="Int64").fillna(_MISSING_ID).to_numpy(dtype=np.int64)
+
+
+def build_customer_index(customer_data, usage_data):
+    """Group usage by customer and map every customer row into it."""
+    usage = usage_data[usage_data["action_type_id"].notna()]
+    ids = _ids(usage["customerid"])
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    customer_ids, starts = np.unique(ids, return_index=True)
+    offsets = np.append(starts, len(ids))
+
+    action_type_id = usage["action_type_id"].to_numpy()[order]
+    usage_count = usage["usage_count"].to_numpy(dtype=np.int64)[order]
+    action_codes, actions = pd.factorize(action_type_id, sort=True)
+
+    shape = (len(customer_ids), len(actions))
+    cell = np.repeat(np.arange(shape[0]), np.diff(offsets)) * shape[1] + action_codes
+    action_rows = np.bincount(cell, minlength=shape[0] * shape[1]).reshape(shape)
+    action_totals = np.bincount(cell, weights=usage_count, minlength=shape[0] * shape[1])
+    action_totals = np.rint(action_totals).astype(np.int64).reshape(shape)
+
+    row_ids = _ids(customer_data["customerid"])
+    position = np.searchsorted(customer_ids, row_ids).clip(max=max(len(customer_ids) - 1, 0))
+    found = len(customer_ids) > 0 and customer_ids[position] == row_ids
+    customers = pd.DataFrame({
+        "position": np.where(found, position, -1),
+        "product_name": customer_data["product_name"].reset_index(drop=True),
+        "channel": customer_data["channel"].reset_index(drop=True),
+        "churned": customer_data["cancel_date"].notna().to_numpy(),
+    })
+
+    return CustomerIndex(
+        customer_ids, offsets, pd.Index(actions, name="action_type_id"), action_rows, action_totals, customers,
+    )
+
+
+def cohort_action_totals(index, cohorts):
+    """Usage rows and ``usage_count`` per cohort and action.
+
+    ``cohorts`` labels each row of ``index.customers``; rows labelled NaN are
+    left out. Customers listed twice count twice, as they do in a merge.
+    """
+    codes, labels = pd.factorize(pd.Series(cohorts), sort=True)
+    labels = np.asarray(labels)
+    keep = (codes >= 0) & (index.customers["position"].to_numpy() >= 0)
+    positions = index.customers["position"].to_numpy()[keep]
+
+    n_actions = len(index.actions)
+    cell = (codes[keep][:, None] * n_actions + np.arange(n_actions)).ravel()
+    size = len(labels) * n_actions
+    rows = np.bincount(cell, weights=index.action_rows[positions].ravel(), minlength=size)
+    totals = np.bincount(cell, weights=index.action_totals[positions].ravel(), minlength=size)
+
+    result = pd.DataFrame({
+        "cohort": np.repeat(labels, n_actions),
+        "action_type_id": np.tile(index.actions, len(labels)),
+        "rows": np.rint(rows).astype(np.int64),
+        "usage_count": np.rint(totals).astype(np.int64),
+    })
+    # Only actions a cohort actually performed, as after a merge and groupby
+    return result[result["rows"] > 0].reset_index(drop=True)
+
+
+def churn_cohorts(index, product="Mailchimp", by=None):
+    """Label customers of ``product`` churned/non-churned, optionally split by another column."""
+    customers = index.customers
+    # Built from integer codes, since string labels per customer row would
+    # cost more than the aggregation itself
+    codes = customers["churned"].to_numpy().astype(np.int64)
+    labels = np.array(["Non_Churned", "Churned"], dtype=object)
+    if by is not None:
+        by_codes, by_labels = pd.factorize(customers[by], sort=True, use_na_sentinel=False)
+        codes = codes * len(by_labels) + by_codes
+        labels = np.array([f"{churn} | {value}" for churn in labels for value in by_labels], dtype=object)
+    codes = np.where(customers["product_name"] == product, codes, -1)
+    return pd.Categorical.from_codes(codes, labels)
+
+
+def compare_churn_cohorts(totals, product="Mailchimp", action_names=None):
+    """Churned vs non-churned action mix from :func:`cohort_action_totals` of :func:`churn_cohorts`."""
+    action_names = metrics.comparison_action_names(product) if action_names is None else action_names
+
+    def cohort_actions(cohort):
+        return totals.loc[totals["cohort"] == cohort, ["action_type_id", "usage_count"]].reset_index(drop=True)
+
+    return stages.compare_action_mix(cohort_actions("Churned"), cohort_actions("Non_Churned"), action_names)
+
+
+def action_comparison(index, product="Mailchimp", action_names=None):
+    """Same frame as :func:`pipeline.stages.action_comparison`."""
+    return compare_churn_cohorts(cohort_action_totals(index, churn_cohorts(index, product)), product, action_names)
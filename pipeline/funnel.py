@@ -0,0 +1,120 @@
+"""Ordered funnels: distinct customers who took each step after the previous one.
+
+    python -m pipeline.funnel --product Mailchimp --window 30
+
+Unlike :func:`pipeline.stages.action_funnel`, which counts usage rows per
+action, a customer reaches step k here on the first day with an event of
+that step, on or after the day they reached step k - 1 (and, with a
+conversion window, at most that many days later). Events only carry a date,
+so two steps on the same day count as in order.
+
+No step loops over customers. Each step's events are reduced to sorted
+unique (customer, day) keys. The first step is then a grouped min: the
+first key of each customer. Every later step is one ``np.searchsorted`` of
+the (customer, day reached) keys of the previous step into those of this
+step, which finds each customer's first qualifying day.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from pipeline import ingest, loading, metrics
+
+
+def _days(dates):
+    return dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+
+
+def _windows(windows, steps):
+    if windows is None or np.ndim(windows) == 0:
+        return [windows] * (len(steps) - 1)
+    if len(windows) != len(steps) - 1:
+        raise ValueError(f"{len(steps)} steps need {len(steps) - 1} conversion windows, got {len(windows)}")
+    return list(windows)
+
+
+def ordered_funnel(usage_data, steps, product=None, windows=None, step_names=None):
+    """Distinct customers reaching each of ``steps`` in order, and the days between steps.
+
+    ``windows`` is the most days allowed from one step to the next, either
+    one number for every step or one per step after the first; ``None``
+    allows any gap. Returns one row per step with the action ID, the
+    customers who reached it, their share of the first step and of the
+    previous step, and the median days they took from the previous step.
+    """
+    if not steps:
+        raise ValueError("a funnel needs at least one step")
+    windows = _windows(windows, steps)
+    if step_names is None:
+        step_names = metrics.action_names(product) if product is not None else {}
+    usage = usage_data
+    if product is not None:
+        usage = usage[(usage["product_name"] == product).to_numpy(dtype=bool, na_value=False)]
+    usage = usage[
+        usage["customerid"].notna().to_numpy() & usage["event_date"].notna().to_numpy()
+        & usage["action_type_id"].isin(steps).to_numpy(dtype=bool, na_value=False)
+    ]
+
+    customers, _ = pd.factorize(usage["customerid"])
+    days = _days(usage["event_date"])
+    first_day = days.min() if len(days) else 0
+    days = days - first_day
+    # Keys order by customer, then day
+    span = int(days.max()) + 1 if len(days) else 1
+    keys = customers.astype(np.int64) * span + days
+    action_type_id = usage["action_type_id"].to_numpy()
+
+    reached = np.empty(0, dtype=np.int64)
+    counts, medians = [], []
+    for step, (action, window) in enumerate(zip(steps, [None] + windows)):
+        step_keys = np.unique(keys[action_type_id == action])
+        if step == 0:
+            # First day per customer, the grouped min of the sorted keys
+            customer = step_keys // span
+            reached = step_keys[np.r_[True, customer[1:] != customer[:-1]][:len(step_keys)]]
+            medians.append(np.nan)
+        elif len(step_keys) and len(reached):
+            # First key of this step at or after the customer's previous step;
+            # a customer with none lands on another customer's key, or on an
+            # earlier key of their own at the very end
+            following = step_keys[np.minimum(np.searchsorted(step_keys, reached), len(step_keys) - 1)]
+            gaps = following - reached
+            found = (following // span == reached // span) & (gaps >= 0)
+            if window is not None:
+                found &= gaps <= window
+            medians.append(float(np.median(gaps[found])) if found.any() else np.nan)
+            reached = following[found]
+        else:
+            reached = reached[:0]
+            medians.append(np.nan)
+        counts.append(len(reached))
+
+    counts = np.array(counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        conversion = counts / counts[0] * 100
+        step_conversion = counts / np.r_[counts[0], counts[:-1]] * 100
+    return pd.DataFrame({
+        "action_type_id": list(steps),
+        "customers": counts,
+        "conversion_pct": conversion,
+        "step_conversion_pct": step_conversion,
+        "median_days_from_previous": medians,
+    }, index=pd.Index([step_names.get(action, action) for action in steps], name="step"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usage-data", default=loading.USAGE_DATA_PATH)
+    parser.add_argument("--product", default="Mailchimp")
+    parser.add_argument("--steps", type=int, nargs="+", help="action IDs in order (default: the product's funnel)")
+    parser.add_argument("--window", type=float, help="most days from one step to the next")
+    args = parser.parse_args()
+    steps = args.steps or metrics.funnel_steps[args.product]
+    funnel = ordered_funnel(ingest.load_usage_data(args.usage_data), steps, args.product, args.window)
+    print(funnel.to_string(float_format="{:.1f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Typed columnar copies of the CSV inputs.
+
+The first load of a CSV parses it once into proper dtypes and writes an
+uncompressed Arrow IPC file next to it. Later loads memory-map that file
+instead of re-parsing the CSV, and it is rebuilt whenever the fingerprint
+of the source CSV changes. Building it also checks every row against the
+rules of :mod:`pipeline.validation` and stores the report in the file's
+metadata, where :func:`validation_report` reads it back.
+
+Run ``python -m pipeline.ingest`` to compare load time and resident memory
+of the CSV path against the columnar copy.
+"""
+
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+from pipeline import instrumentation, loading, validation
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%m/%d/%y"
+
+CUSTOMER_DATE_COLUMNS = ["signup_date", "first_activation_date", "first_purchase_date", "cancel_date"]
+USAGE_DATE_COLUMNS = ["event_date"]
+
+_FINGERPRINT_KEY = b"source_fingerprint"
+_VALIDATION_KEY = b"validation"
+
+
+def _customer_ids(values):
+    # Ids are 16+ digit integers; going through strings keeps them exact,
+    # and spreadsheet junk like "#REF!" becomes <NA>
+    ids = values.astype("string")
+    return ids.where(ids.str.fullmatch(r"\d+")).astype("Int64")
+
+
+def _small_int(values, dtype):
+    values = pd.to_numeric(values, errors="coerce")
+    return values.astype(dtype if values.notna().all() else dtype.capitalize())
+
+
+def _dates(values):
+    return pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+
+
+def type_customer_data(customer_data):
+    """Cast a raw customer frame to the columnar schema."""
+    typed = pd.DataFrame({
+        "customerid": _customer_ids(customer_data["customerid"]),
+        "product_name": customer_data["product_name"].astype("category"),
+        "channel": customer_data["channel"].astype("category"),
+    })
+    for column in CUSTOMER_DATE_COLUMNS:
+        typed[column] = _dates(customer_data[column])
+    return typed[["customerid", "product_name", "signup_date", "channel"] + CUSTOMER_DATE_COLUMNS[1:]]
+
+
+def type_usage_data(usage_data):
+    """Cast a raw usage frame to the columnar schema."""
+    return pd.DataFrame({
+        "customerid": _customer_ids(usage_data["customerid"]),
+        "product_name": usage_data["product_name"].astype("category"),
+        "action_type_id": _small_int(usage_data["action_type_id"], "int8"),
+        "usage_count": _small_int(usage_data["usage_count"], "int32"),
+        "event_date": _dates(usage_data["event_date"]),
+    })
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def _metadata(path):
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+    return {key: json.loads(metadata[key]) for key in (_FINGERPRINT_KEY, _VALIDATION_KEY) if key in metadata}
+
+
+def built_from(path, fingerprint):
+    """Whether the Arrow file at ``path`` was written from the source with ``fingerprint``."""
+    return _metadata(path).get(_FINGERPRINT_KEY) == fingerprint._asdict()
+
+
+def write_columnar(frame, path, fingerprint=None, report=None):
+    """Atomically write ``frame`` as an Arrow IPC file."""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if report is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[_VALIDATION_KEY] = json.dumps(report).encode()
+        table = table.replace_schema_metadata(metadata)
+    write_table(table, path, fingerprint)
+
+
+def write_table(table, path, fingerprint=None):
+    """Atomically write an Arrow ``table`` as an IPC file, tagged with the ``fingerprint`` of its source."""
+    if fingerprint is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[_FINGERPRINT_KEY] = json.dumps(fingerprint._asdict()).encode()
+        table = table.replace_schema_metadata(metadata)
+    # Write to a temporary file and rename, so a concurrent reader never
+    # maps a half-written copy
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path):
+    """Memory-map an Arrow IPC file written by :func:`write_columnar`."""
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas()
+
+
+def _columnar(csv_path, type_frame, check):
+    fingerprint = loading.file_fingerprint(csv_path)
+    path = columnar_path(csv_path)
+    metadata = _metadata(path)
+    # Copies written before validation existed, or before a rule was renamed,
+    # are rebuilt once to get a current report
+    if (metadata.get(_FINGERPRINT_KEY) != fingerprint._asdict() or _VALIDATION_KEY not in metadata
+            or not validation.known(metadata[_VALIDATION_KEY])):
+        raw = pd.read_csv(csv_path, low_memory=False)
+        typed = type_frame(raw)
+        report = {"rows": len(raw), "checks": check(raw, typed)}
+        del raw
+        violations = validation.violations(report["checks"])
+        if violations:
+            logger.warning("%s: %d rule violations in %d rows, see python -m pipeline.validation",
+                           csv_path, violations, report["rows"])
+        write_columnar(typed, path, fingerprint, report)
+    return path
+
+
+def customer_columnar(path=loading.CUSTOMER_DATA_PATH):
+    """Path of the up-to-date columnar copy of the customer CSV, built if needed."""
+    return _columnar(path, type_customer_data, validation.check_customers)
+
+
+def usage_columnar(path=loading.USAGE_DATA_PATH):
+    """Path of the up-to-date columnar copy of the usage CSV, built if needed."""
+    return _columnar(path, type_usage_data, validation.check_usage)
+
+
+def validation_report(csv_path):
+    """Validation report of ``csv_path`` from its columnar copy, or ``None`` if that is missing or stale.
+
+    A dict with the CSV's ``rows`` and the ``checks`` of
+    :mod:`pipeline.validation`.
+    """
+    metadata = _metadata(columnar_path(csv_path))
+    if metadata.get(_FINGERPRINT_KEY) != loading.file_fingerprint(csv_path)._asdict():
+        return None
+    report = metadata.get(_VALIDATION_KEY)
+    return report if report is None or validation.known(report) else None
+
+
+def load_customer_data(path=loading.CUSTOMER_DATA_PATH):
+    """Typed customer frame, memory-mapped from its columnar copy."""
+    return read_columnar(customer_columnar(path))
+
+
+def load_usage_data(path=loading.USAGE_DATA_PATH):
+    """Typed usage frame, memory-mapped from its columnar copy."""
+    return read_columnar(usage_columnar(path))
+
+
+def _read_csv(path):
+    return pd.read_csv(path, low_memory=False)
+
+
+def measure_load(load, path):
+    """Seconds taken and resident memory added by ``load(path)``."""
+    gc.collect()
+    rss_before = instrumentation.rss_bytes()
+    start = time.perf_counter()
+    frame = load(path)
+    elapsed = time.perf_counter() - start
+    rss_added = instrumentation.rss_bytes() - rss_before
+    del frame
+    return elapsed, rss_added
+
+
+def report(paths=(loading.CUSTOMER_DATA_PATH, loading.USAGE_DATA_PATH)):
+    loaders = {
+        loading.CUSTOMER_DATA_PATH: load_customer_data,
+        loading.USAGE_DATA_PATH: load_usage_data,
+    }
+    # Each measurement runs in a fresh process so memory freed by one load
+    # is not reused by the next and hidden from its RSS delta
+    context = multiprocessing.get_context("spawn")
+    for path in paths:
+        # Build the columnar copy up front so only the mapped read is timed
+        loaders[path](path)
+        results = {}
+        for name, load in (("csv", _read_csv), ("columnar", loaders[path])):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results[name] = pool.submit(measure_load, load, path).result()
+        print(f"{path}: " + " | ".join(
+            f"{name} {seconds:.2f}s {rss / 2**20:.0f} MiB" for name, (seconds, rss) in results.items()
+        ))
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,121 @@
+"""Opt-in per-stage timing, row counts and memory deltas.
+
+A script run calls :func:`start_run` once. While a run is enabled, every
+function wrapped with :func:`timed` and every :func:`stage` block records its
+elapsed time, rows out (for pandas and NumPy results), rows in (the rows out
+of the stages nested inside it) and the change in process RSS, and logs the
+record as one JSON line on the ``pipeline.instrumentation`` logger. When the
+run is disabled the wrappers cost one context variable lookup.
+
+Records are kept per run in a context variable, so concurrent sessions
+(each running in its own thread) never see each other's stages. The RSS
+delta is process-wide and therefore only indicative under concurrent load.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_run = contextvars.ContextVar("instrumentation_run", default=None)
+
+
+def rss_bytes():
+    """Resident memory of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(result)
+    return None
+
+
+class _Run:
+    def __init__(self):
+        self.records = []
+        # Records of the finished children of each open stage
+        self._children = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {"stage": name, "depth": len(self._children), "rows_out": None}
+        self.records.append(record)
+        self._children.append([])
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            record["memory_delta_mib"] = round((rss_bytes() - rss_before) / 2**20, 2)
+            children = self._children.pop()
+            rows_in = [child["rows_out"] for child in children if child["rows_out"] is not None]
+            record["rows_in"] = sum(rows_in) if rows_in else None
+            if self._children:
+                self._children[-1].append(record)
+            logger.info(json.dumps(record))
+
+
+def start_run(enabled):
+    """Begin recording the stages of this script run, or turn recording off."""
+    _run.set(_Run() if enabled else None)
+
+
+def enabled():
+    return _run.get() is not None
+
+
+def records():
+    """Records of the current run, in the order the stages started."""
+    run = _run.get()
+    return list(run.records) if run is not None else []
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record a block of code; yields the record (``None`` when disabled)."""
+    run = _run.get()
+    if run is None:
+        yield None
+        return
+    with run.stage(name) as record:
+        yield record
+
+
+def timed(name):
+    """Decorator recording each call of the wrapped function as a stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _run.get()
+            if run is None:
+                return fn(*args, **kwargs)
+            with run.stage(name) as record:
+                result = fn(*args, **kwargs)
+                record["rows_out"] = _rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def configure_logging(level=logging.INFO):
+    """Send stage records to stderr, once per process."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
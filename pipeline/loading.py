@@ -0,0 +1,46 @@
+"""Reading the input files and fingerprinting them for cache keys."""
+
+import hashlib
+import os
+from functools import lru_cache
+from typing import NamedTuple
+
+import pandas as pd
+
+CUSTOMER_DATA_PATH = "data/customer_data.csv"
+USAGE_DATA_PATH = "data/usage_data.csv"
+# Daily usage exports, e.g. data/usage/2022-07-01.csv
+USAGE_PARTITIONS_DIR = "data/usage"
+
+
+class FileFingerprint(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+
+
+@lru_cache(maxsize=64)
+def _content_hash(path, size, mtime_ns):
+    # size and mtime_ns are only part of the memo key, so the file is
+    # re-hashed once per change instead of on every lookup
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """Identify the current version of ``path`` by size, mtime and content."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return FileFingerprint(path, stat.st_size, stat.st_mtime_ns, _content_hash(path, stat.st_size, stat.st_mtime_ns))
+
+
+def read_customer_data(path=CUSTOMER_DATA_PATH):
+    return pd.read_csv(path, low_memory=False)
+
+
+def read_usage_data(path=USAGE_DATA_PATH):
+    return pd.read_csv(path, low_memory=False)
@@ -0,0 +1,119 @@
+"""Metric definitions and the vectorized lookups built from them."""
+
+import pandas as pd
+
+# Define the North Star Metrics for each product
+north_star_metrics = {
+    "TurboTax": "Tax Filings Completed",
+    "Mailchimp": "Email Campaigns Successfully Sent",
+    "Mint": "Active Budget Plans",
+    "QuickBooks": "Invoices Paid"
+}
+
+# Map the North Star metric actions for easier aggregation
+action_keys = {
+    (3, "TurboTax"): "Filing Completed",
+    (2, "Mailchimp"): "Email Campaigns Sent",
+    (5, "Mint"): "Budget Created",
+    (5, "QuickBooks"): "Invoice Created"
+}
+
+UNKNOWN_ACTION = "Unknown Action"
+
+# Action IDs the usage exports use. Only Mailchimp's are all named, and which
+# of them the other products log is not recorded here, so pipeline.validation
+# can only report usage rows outside the range, not per product
+ACTION_IDS = range(1, 8)
+
+
+def action_lookup(keys=None):
+    """Turn an ``action_keys`` style dict into a joinable lookup table."""
+    keys = action_keys if keys is None else keys
+    return pd.DataFrame(
+        [(action_id, product, name) for (action_id, product), name in keys.items()],
+        columns=["action_type_id", "product_name", "Action_Type"],
+    )
+
+
+def map_action_types(usage_data, keys=None):
+    """Resolve the action name of every usage row with one left join."""
+    lookup = action_lookup(keys)
+    if isinstance(usage_data["product_name"].dtype, pd.CategoricalDtype):
+        # Joining on matching categoricals compares codes instead of strings;
+        # products missing from the categories would turn into NaN keys, so drop them
+        lookup["product_name"] = lookup["product_name"].astype(usage_data["product_name"].dtype)
+        lookup = lookup.dropna(subset=["product_name"])
+    mapped = usage_data[["action_type_id", "product_name"]].merge(
+        lookup, how="left", on=["action_type_id", "product_name"]
+    )
+    # A left join on a lookup with unique keys keeps the row order of usage_data
+    return pd.Series(
+        mapped["Action_Type"].fillna(UNKNOWN_ACTION).to_numpy(),
+        index=usage_data.index,
+        name="Action_Type",
+    )
+
+
+def north_star_actuals(usage_data, keys=None):
+    """Sum ``usage_count`` for each product's North Star action."""
+    # Action_Type is fully determined by (action_type_id, product_name), so the
+    # group keys can skip it
+    action_sums = usage_data.groupby(["product_name", "action_type_id"], observed=True)["usage_count"].sum()
+    return select_north_star(action_sums, keys)
+
+
+def select_north_star(action_sums, keys=None):
+    """Keep the North Star rows of ``usage_count`` sums per product and action."""
+    lookup = action_lookup(keys)
+    # The inner join against the lookup does the North Star filtering
+    north_star_values = action_sums.reset_index().merge(
+        lookup[["action_type_id", "product_name"]], on=["action_type_id", "product_name"]
+    )
+    return north_star_values[["product_name", "usage_count"]]
+
+
+# Mailchimp action names shown in the funnel
+mailchimp_actions_key = {
+    5: "Log-Ins",
+    7: "Campaigns Created",
+    4: "Subscribers Added",
+    3: "Templates Edited",
+    2: "Email Campaigns Sent",
+    1: "Email Campaigns Deleted",
+    6: "Email Campaigns Un-sent"
+}
+
+# Ordered steps of each product's funnel, by action ID
+funnel_steps = {
+    # Log-Ins, Campaigns Created, Subscribers Added, Email Campaigns Sent
+    "Mailchimp": [5, 7, 4, 2],
+}
+
+# Action ID of each product's log-ins, by the funnel's action names;
+# pipeline.risk scores customers on how often they log in
+login_actions = {"Mailchimp": 5}
+
+# Mailchimp action names shown in the churned vs active comparison
+action_type_mapping = {
+    5: "Campaigns Created ",
+    7: "Log-Ins",
+    4: "Subscribers Added",
+    3: "Templates Edited",
+    2: "Email Campaigns Sent",
+    1: "Email Campaigns Deleted",
+    6: "Email Campaigns Un-sent"
+}
+
+
+def action_names(product):
+    """Display names of a product's action IDs."""
+    if product == "Mailchimp":
+        return mailchimp_actions_key
+    return {action_id: name for (action_id, key_product), name in action_keys.items() if key_product == product}
+
+
+def comparison_action_names(product):
+    """Display names of a product's action IDs in the churned vs active comparison."""
+    if product == "Mailchimp":
+        return action_type_mapping
+    return action_names(product)
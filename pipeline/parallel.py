@@ -0,0 +1,172 @@
+"""The usage-heavy stages spread over a process pool by customer hash.
+
+Customers and their usage rows are split into partitions by a hash of
+``customerid``. Every customer-keyed join (channel lookup, churn status)
+therefore stays within one partition. Each worker memory-maps the Arrow
+copies written by :mod:`pipeline.ingest`, keeps only its partition's
+rows and returns small partial aggregates:
+
+- the customer cube and usage cube of :mod:`pipeline.cube`
+- usage per product, churn cohort and action from :mod:`pipeline.customer_index`
+
+All of these are sums, so merging is a grouped sum of the concatenated
+partials. The merged frames are sorted by their keys and come out the
+same whatever order the workers finish in and however many partitions
+there are. ``workers=1`` runs everything in this process, without a pool.
+
+Streamlit runs app.py as ``__main__``, which spawned workers would import
+again, so the app calls :func:`aggregate_in_subprocess`. It runs the pool
+under ``python -m pipeline.parallel`` and reads the merged aggregates back
+from Arrow files.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from pipeline import cube, customer_index, ingest, loading, timeline
+
+# PIPELINE_WORKERS=1 forces serial execution
+DEFAULT_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 0)) or os.cpu_count() or 1
+
+CHURN_TOTAL_KEYS = ["product_name", "cohort", "action_type_id"]
+
+# Unparseable ids all hash to the same partition, so they still match each other
+_MISSING_ID = np.iinfo(np.int64).min
+# Fibonacci hashing spreads sequential or strided ids evenly over partitions
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class PartialAggregates(NamedTuple):
+    customer_cube: pd.DataFrame
+    usage_cube: pd.DataFrame
+    # rows and usage_count per product, churn cohort and action
+    churn_totals: pd.DataFrame
+
+
+def partition_of(ids, partitions):
+    """Partition number of each id in an Arrow array of customer ids."""
+    values = pc.fill_null(ids, _MISSING_ID).to_numpy().view(np.uint64)
+    return ((values * _HASH_MULTIPLIER) >> np.uint64(32)) % np.uint64(partitions)
+
+
+def _read_partition(path, part, partitions):
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    if partitions > 1:
+        # Filter before converting, so a worker only copies its own rows
+        table = table.filter(pa.array(partition_of(table["customerid"], partitions) == part))
+    return table.to_pandas()
+
+
+def partial_aggregates(customer_path, usage_path, part=0, partitions=1):
+    """Aggregates of the customers in one partition, read from columnar copies."""
+    customers = _read_partition(customer_path, part, partitions)
+    usage = _read_partition(usage_path, part, partitions)
+    index = customer_index.build_customer_index(customers, usage)
+    churn_totals = pd.concat(
+        {
+            product: customer_index.cohort_action_totals(index, customer_index.churn_cohorts(index, product))
+            for product in customers["product_name"].cat.categories
+        },
+        names=["product_name"],
+    ).reset_index(level=0).reset_index(drop=True)
+    return PartialAggregates(cube.customer_cube(customers), cube.usage_cube(customers, usage), churn_totals)
+
+
+def merge(partials):
+    """Sum partial aggregates of disjoint partitions."""
+    customer_cubes, usage_cubes, churn_totals = zip(*partials)
+    return PartialAggregates(
+        pd.concat(customer_cubes).groupby(cube.CUSTOMER_KEYS, observed=True, dropna=False)["customers"].sum().reset_index(),
+        pd.concat(usage_cubes).groupby(cube.USAGE_KEYS, observed=True, dropna=False)[["rows", "usage_count"]].sum().reset_index(),
+        pd.concat(churn_totals).groupby(CHURN_TOTAL_KEYS, observed=True)[["rows", "usage_count"]].sum().reset_index(),
+    )
+
+
+def executor(workers=DEFAULT_WORKERS):
+    # Spawned rather than forked, since callers may be multithreaded
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def aggregate(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH,
+              workers=DEFAULT_WORKERS, partitions=None, pool=None):
+    """Merged aggregates of both CSVs, computed over ``partitions`` (default: one per worker)."""
+    paths = ingest.customer_columnar(customer_path), ingest.usage_columnar(usage_path)
+    partitions = partitions or workers
+    tasks = (itertools.repeat(paths[0]), itertools.repeat(paths[1]), range(partitions), itertools.repeat(partitions))
+    if workers == 1 and pool is None:
+        return merge(list(map(partial_aggregates, *tasks)))
+    if pool is not None:
+        return merge(list(pool.map(partial_aggregates, *tasks)))
+    with executor(workers) as pool:
+        return merge(list(pool.map(partial_aggregates, *tasks)))
+
+
+def aggregate_in_subprocess(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH,
+                            workers=DEFAULT_WORKERS, partitions=None):
+    """:func:`aggregate` run in a child process, for callers that cannot start a pool."""
+    with tempfile.TemporaryDirectory() as out:
+        subprocess.run(
+            [sys.executable, "-m", "pipeline.parallel", "--customer-data", os.path.abspath(customer_path),
+             "--usage-data", os.path.abspath(usage_path), "--workers", str(workers),
+             "--partitions", str(partitions or workers), "--out", out],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True,
+        )
+        # Read into memory rather than mapping, since the files go away
+        return PartialAggregates(*(
+            pa.ipc.open_file(pa.OSFile(os.path.join(out, f"{name}.arrow"))).read_all().to_pandas()
+            for name in PartialAggregates._fields
+        ))
+
+
+def churn_comparison(aggregates, product="Mailchimp"):
+    """Same frame as :func:`pipeline.stages.action_comparison`."""
+    totals = aggregates.churn_totals
+    return customer_index.compare_churn_cohorts(totals[totals["product_name"] == product], product)
+
+
+def compute(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH,
+            workers=DEFAULT_WORKERS, partitions=None, pool=None):
+    """Every result the dashboard renders, keyed by stage and product; what a snapshot holds."""
+    aggregates = aggregate(customer_path, usage_path, workers, partitions, pool)
+    start_date, end_date = timeline.date_window(aggregates.customer_cube)
+    summary = cube.customer_summary(aggregates.customer_cube, aggregates.usage_cube)
+    results = {"customer_summary": summary}
+    for product in summary["product_name"]:
+        results[product] = {
+            "action_funnel": cube.action_funnel(aggregates.usage_cube, product),
+            "daily_customer_series": cube.daily_customer_series(aggregates.customer_cube, product, start_date, end_date),
+            "channel_breakdown": cube.channel_breakdown(aggregates.customer_cube, product),
+            "action_comparison": churn_comparison(aggregates, product),
+            "churn_by_channel": cube.churn_by_channel(aggregates.customer_cube, product),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the merged aggregates of both CSVs as Arrow files.")
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--usage-data", default=loading.USAGE_DATA_PATH)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--partitions", type=int)
+    parser.add_argument("--out", required=True, help="directory for customer_cube.arrow, usage_cube.arrow and churn_totals.arrow")
+    args = parser.parse_args()
+    aggregates = aggregate(args.customer_data, args.usage_data, args.workers, args.partitions)
+    os.makedirs(args.out, exist_ok=True)
+    for name, frame in aggregates._asdict().items():
+        ingest.write_columnar(frame, os.path.join(args.out, f"{name}.arrow"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Rebuilding the dashboard's data in the background when the input files change.
+
+A :class:`Refresher` polls the input files with ``os.stat``. Once a change
+has settled (the files looked the same on two polls in a row, so a copy in
+progress is not read half-written), it calls ``rebuild`` with the new file
+fingerprints on its own thread. ``rebuild`` brings what the app reads up to
+date and returns the cache key for it along with the mode to read it in,
+and ``warm`` then computes what its pages show. Only then does the
+refresher replace :attr:`Refresher.current`. That is a single reference
+assignment, so every run sees either the old version or the new one, never
+a mix.
+
+The first version has nothing older to show meanwhile, so ``rebuild`` runs
+on the caller's thread. Its ``warm`` waits for :meth:`Refresher.start`,
+which the caller can put off until its first pages are out; until then
+they compute what they show as they need it.
+
+Until the swap, sessions keep rendering the previous version. A failed
+rebuild is logged and the previous version stays; it is retried once the
+files change again.
+"""
+
+import datetime
+import logging
+import os
+import threading
+from typing import Any, NamedTuple, Optional, Tuple
+
+from pipeline import loading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+
+
+class Version(NamedTuple):
+    # What rebuild returned: the cache key of every stage, and how the data
+    # behind it is read, fixed for as long as the version is served
+    key: Any
+    mode: Any
+    # (path, size, mtime_ns) of each input file it was built from
+    inputs: Tuple
+    # What rebuild was called with: the fingerprints of the files, or None
+    fingerprints: Tuple
+    # Newest modification time of the input files
+    as_of: datetime.datetime
+    built: datetime.datetime
+
+
+def _signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((path, None, None))
+            continue
+        signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def _utc(mtime_ns):
+    return datetime.datetime.fromtimestamp(mtime_ns / 1e9, tz=datetime.timezone.utc)
+
+
+class Refresher:
+    """Calls ``rebuild`` with the fingerprints of ``paths`` whenever they change, then swaps in its result.
+
+    ``rebuild`` returns a ``(key, mode)`` pair. ``warm``, if given, is called
+    with each new :class:`Version`. ``directories`` are watched too, for
+    files added to them, but are not passed to ``rebuild``.
+    """
+
+    def __init__(self, paths, rebuild, interval=DEFAULT_INTERVAL, directories=(), warm=None):
+        self.paths = list(paths)
+        self.directories = list(directories)
+        self.interval = interval
+        self._rebuild = rebuild
+        self._warm = warm
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Signature seen on the previous poll, and the last one that failed
+        self._pending = None
+        self._failed = None
+        self.error = None
+        self.refreshing = False
+        # The first version is built on the caller's thread, since there
+        # is nothing older to show meanwhile; start() warms it
+        self.current = self._build(_signature(self.paths + self.directories))
+
+    def _build(self, signature):
+        fingerprints = [
+            loading.file_fingerprint(path) if size is not None else None
+            for path, size, _ in signature[:len(self.paths)]
+        ]
+        key, mode = self._rebuild(*fingerprints)
+        as_of = max((mtime_ns for _, _, mtime_ns in signature if mtime_ns is not None), default=None)
+        return Version(
+            key, mode, signature, tuple(fingerprints), _utc(as_of) if as_of is not None else None,
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+
+    def _warm_first(self):
+        version = self.current
+        try:
+            self._warm(version)
+        except Exception:
+            # Pages compute whatever is missing themselves
+            logger.exception("Warming %s failed", version.key)
+
+    def refresh(self, settle=True):
+        """Rebuild and swap in a new version if the input files changed; returns whether it did."""
+        with self._lock:
+            signature = _signature(self.paths + self.directories)
+            if signature in (self.current.inputs, self._failed):
+                self._pending = None
+                return False
+            if settle and signature != self._pending:
+                # Changed since the last poll; wait for the writer to finish
+                self._pending = signature
+                return False
+            self.refreshing = True
+            try:
+                version = self._build(signature)
+                if self._warm is not None:
+                    self._warm(version)
+            except Exception as error:
+                logger.exception("Rebuilding from %s failed; still serving %s", self.paths, self.current.key)
+                self.error = error
+                self._failed = signature
+                return False
+            finally:
+                self.refreshing = False
+            self.current = version
+            self.error = None
+            self._pending = None
+            logger.info("Swapped in data as of %s", version.as_of)
+            return True
+
+    def _run(self):
+        if self._warm is not None:
+            self._warm_first()
+        # Without an interval the caller polls with refresh() itself
+        while self.interval and not self._stop.wait(self.interval):
+            self.refresh()
+
+    def start(self):
+        """Warm the first version, then poll every ``interval`` seconds, on a daemon thread; returns ``self``."""
+        if self._thread is None:
+            # Every session's run calls this; the first one starts the thread
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="data-refresh", daemon=True)
+                    self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,136 @@
+"""Cohort retention: the share of each signup cohort still active N periods later.
+
+    python -m pipeline.retention --product Mailchimp --period month
+
+Customers are binned into cohorts by the period (month or week) of their
+sign-up or activation, and only those who activated count. A customer
+cancelling in period k after their cohort's period churns at age k; one who
+never cancelled survives every age. One ``np.bincount`` over (cohort, churn
+age) pairs gives the churn histogram of every cohort at once, and a reverse
+cumulative sum along the ages turns it into the customers still active
+after each age. The cost is one pass over the customers plus the size of
+the matrix, however many cohorts there are.
+
+Ages a cohort has not lived through yet, by the last date in the customer
+data, are left empty rather than counted as retained.
+"""
+
+import argparse
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import ingest, loading
+
+PERIODS = ("month", "week")
+COHORT_COLUMNS = ("signup_date", "first_activation_date")
+
+# 1970-01-05 was the first Monday after the epoch
+_FIRST_MONDAY = 4
+
+
+class Retention(NamedTuple):
+    # Percent of each cohort still active after each age, cohorts by start
+    # date as rows and ages in periods as columns; NaN past the data's end
+    rates: pd.DataFrame
+    # Activated customers in each cohort
+    customers: pd.Series
+
+
+def _periods(dates, period):
+    days = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    if period == "month":
+        return days.astype("datetime64[M]").astype(np.int64)
+    return (days.astype(np.int64) - _FIRST_MONDAY) // 7
+
+
+def _period_start(periods, period):
+    if period == "month":
+        return np.asarray(periods, dtype=np.int64).astype("datetime64[M]").astype("datetime64[ns]")
+    return (np.asarray(periods, dtype=np.int64) * 7 + _FIRST_MONDAY).astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def last_date(customer_data):
+    """Last date of any kind in ``customer_data``, the end of what it has observed."""
+    return max(customer_data[column].max() for column in ingest.CUSTOMER_DATE_COLUMNS)
+
+
+def retention_matrix(customer_data, product=None, channel=None, cohort_by="signup_date", period="month", as_of=None):
+    """Percent of each cohort of activated customers still active after each age.
+
+    ``product`` and ``channel`` narrow the customers, ``None`` keeps all.
+    ``as_of`` is the last observed date, by default :func:`last_date` of
+    the whole ``customer_data`` so that narrowing it leaves the horizon as it is.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}, got {period!r}")
+    if cohort_by not in COHORT_COLUMNS:
+        raise ValueError(f"cohort_by must be one of {COHORT_COLUMNS}, got {cohort_by!r}")
+    as_of = last_date(customer_data) if as_of is None else pd.Timestamp(as_of)
+    keep = customer_data["first_activation_date"].notna().to_numpy() & customer_data[cohort_by].notna().to_numpy()
+    if product is not None:
+        keep &= (customer_data["product_name"] == product).to_numpy(dtype=bool, na_value=False)
+    if channel is not None:
+        keep &= (customer_data["channel"] == channel).to_numpy(dtype=bool, na_value=False)
+    customers = customer_data[keep]
+    if customers.empty or pd.isna(as_of):
+        empty = pd.Index([], dtype="datetime64[ns]", name="cohort")
+        return Retention(pd.DataFrame(index=empty, columns=pd.RangeIndex(0, name="age"), dtype=float),
+                         pd.Series(dtype=np.int64, index=empty, name="customers"))
+
+    cohort = _periods(customers[cohort_by], period)
+    first_cohort = int(cohort.min())
+    cohort -= first_cohort
+    # The last period is observed up to ``as_of``, and a cohort reaches at
+    # most as many ages as there are periods from its own to that one
+    last_period = int(_periods(pd.Series([as_of]), period)[0]) - first_cohort
+    cohorts = max(last_period, int(cohort.max())) + 1
+    ages = cohorts
+
+    # Churn age per customer; those who never cancelled, or cancelled after
+    # the horizon, land in the extra bucket at ``ages``. Cancelling before
+    # the cohort's period, which only bad dates do, counts as age 0.
+    cancel = customers["cancel_date"]
+    churn_age = np.full(len(customers), ages, dtype=np.int64)
+    cancelled = cancel.notna().to_numpy()
+    churn_age[cancelled] = np.clip(_periods(cancel[cancelled], period) - first_cohort - cohort[cancelled], 0, ages)
+
+    churned = np.bincount(cohort * (ages + 1) + churn_age, minlength=cohorts * (ages + 1)).reshape(cohorts, ages + 1)
+    sizes = churned.sum(axis=1)
+    # Still active after age a: everyone churning at a later age, the
+    # reverse cumulative sum from a + 1 on
+    survivors = churned[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = survivors / sizes[:, None] * 100
+    # Cohort c has lived through ages 0..last_period - c
+    observed = np.arange(ages)[None, :] <= (last_period - np.arange(cohorts))[:, None]
+    rates = np.where(observed & (sizes[:, None] > 0), rates, np.nan)
+
+    index = pd.DatetimeIndex(_period_start(np.arange(cohorts) + first_cohort, period), name="cohort")
+    has_customers = sizes > 0
+    return Retention(
+        pd.DataFrame(rates[has_customers], index=index[has_customers], columns=pd.RangeIndex(ages, name="age")),
+        pd.Series(sizes[has_customers], index=index[has_customers], name="customers"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--product")
+    parser.add_argument("--channel")
+    parser.add_argument("--cohort-by", choices=COHORT_COLUMNS, default="signup_date")
+    parser.add_argument("--period", choices=PERIODS, default="month")
+    args = parser.parse_args()
+    retention = retention_matrix(
+        ingest.load_customer_data(args.customer_data), args.product, args.channel, args.cohort_by, args.period
+    )
+    table = retention.rates.dropna(axis=1, how="all")
+    table.insert(0, "customers", retention.customers)
+    table.index = table.index.strftime("%Y-%m-%d")
+    print(table.to_string(float_format="{:.1f}".format, na_rep=""))
+
+
+if __name__ == "__main__":
+    main()
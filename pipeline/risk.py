@@ -0,0 +1,258 @@
+"""Churn-risk watchlist: active customers whose log-ins dropped below their own baseline.
+
+    python -m pipeline.risk --product Mailchimp --top 20
+
+Every customer's log-ins are kept as two exponentially decaying sums, one
+with a half-life of RECENT_HALF_LIFE days (their recent login rate) and one
+with a half-life of BASELINE_HALF_LIFE days (their own baseline). Both are
+sums of ``usage_count * 2 ** (-age / half_life)`` over login events, so the
+sums of two sets of events, brought to the same day, just add. New usage
+partitions fold in without revisiting older ones, in any order, and the
+sums of each usage CSV are written to ``<csv>.logins.arrow`` when it is
+ingested, like its sketches.
+
+A customer's risk is how many fewer times a week they log in now than their
+baseline says they did. :func:`watchlist` scores the active customers of a
+product in chunks and keeps the top ones in a bounded heap, so picking them
+never sorts the whole customer base.
+"""
+
+import argparse
+import datetime
+import heapq
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from pipeline import ingest, loading, metrics, sketches, stages
+
+RECENT_HALF_LIFE = 7
+BASELINE_HALF_LIFE = 56
+
+# Customers listed by default, and scored per heap pass
+TOP = 25
+CHUNKSIZE = 1 << 16
+
+_PARAMETERS_KEY = b"login_activity"
+
+
+class LoginActivity(NamedTuple):
+    # Sorted ids of the customers with any log-in
+    customerid: np.ndarray
+    # Decayed log-in sums as of the day ``as_of``
+    recent: np.ndarray
+    baseline: np.ndarray
+    # Day of each customer's last log-in
+    last_login: np.ndarray
+    # Days since the epoch; -1 when there are no log-ins
+    as_of: int
+
+
+class Watchlist(NamedTuple):
+    customers: pd.DataFrame
+    # Active customers of the product, and those of them with log-ins to score
+    cohort: int
+    scored: int
+    # Day the rates are as of, the last day with a log-in; None without any
+    as_of: datetime.date | None
+
+
+def _days(dates):
+    return dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+
+
+def _decay(days, half_life):
+    return np.exp2(-np.asarray(days, dtype=np.float64) / half_life)
+
+
+def _weekly_rate(total, half_life):
+    # A steady rate r per day decays to a sum of r / (1 - 2 ** (-1 / half_life))
+    return total * (1 - np.exp2(-1 / half_life)) * 7
+
+
+def empty():
+    ids = np.empty(0, dtype=np.int64)
+    return LoginActivity(ids, np.empty(0), np.empty(0), ids.copy(), -1)
+
+
+def login_activity(usage):
+    """The decayed log-in sums of every customer in the ``usage`` frame."""
+    is_login = np.zeros(len(usage), dtype=bool)
+    for product, action in metrics.login_actions.items():
+        is_login |= ((usage["product_name"] == product) & (usage["action_type_id"] == action)).to_numpy(
+            dtype=bool, na_value=False
+        )
+    logins = usage[
+        is_login & usage["customerid"].notna().to_numpy() & usage["event_date"].notna().to_numpy()
+        & usage["usage_count"].notna().to_numpy()
+    ]
+    if logins.empty:
+        return empty()
+    days = _days(logins["event_date"])
+    as_of = int(days.max())
+    ids, customers = np.unique(logins["customerid"].to_numpy(dtype=np.int64), return_inverse=True)
+    counts = logins["usage_count"].to_numpy(dtype=np.float64)
+    last_login = np.full(len(ids), np.iinfo(np.int64).min)
+    np.maximum.at(last_login, customers, days)
+    return LoginActivity(
+        ids,
+        np.bincount(customers, counts * _decay(as_of - days, RECENT_HALF_LIFE), len(ids)),
+        np.bincount(customers, counts * _decay(as_of - days, BASELINE_HALF_LIFE), len(ids)),
+        last_login,
+        as_of,
+    )
+
+
+def merge(parts):
+    """One set of log-in sums from several, brought to the latest ``as_of`` among them."""
+    parts = [part for part in parts if len(part.customerid)]
+    if not parts:
+        return empty()
+    if len(parts) == 1:
+        return parts[0]
+    as_of = max(part.as_of for part in parts)
+    ids, customers = np.unique(np.concatenate([part.customerid for part in parts]), return_inverse=True)
+
+    def total(field, half_life):
+        decayed = [getattr(part, field) * _decay(as_of - part.as_of, half_life) for part in parts]
+        return np.bincount(customers, np.concatenate(decayed), len(ids))
+
+    last_login = np.full(len(ids), np.iinfo(np.int64).min)
+    np.maximum.at(last_login, customers, np.concatenate([part.last_login for part in parts]))
+    return LoginActivity(
+        ids, total("recent", RECENT_HALF_LIFE), total("baseline", BASELINE_HALF_LIFE), last_login, as_of
+    )
+
+
+def update(activity, usage):
+    """``activity`` with the log-ins of a new ``usage`` frame or partition folded in."""
+    return merge([activity, login_activity(usage)])
+
+
+def watchlist(activity, cohort, top=TOP, chunksize=CHUNKSIZE):
+    """The ``top`` customers of ``cohort`` whose weekly log-ins fell furthest below their baseline.
+
+    ``cohort`` holds the customer ids to score, such as a product's active
+    customers; those who never logged in have no baseline and are skipped.
+    """
+    # Sorted and deduplicated by hand; np.unique hashes first, which is
+    # several times slower on a million ids
+    cohort = np.sort(np.asarray(cohort, dtype=np.int64))
+    cohort = cohort[np.r_[True, cohort[1:] != cohort[:-1]][:len(cohort)]]
+    positions = np.searchsorted(activity.customerid, cohort)
+    found = positions < len(activity.customerid)
+    found[found] = activity.customerid[positions[found]] == cohort[found]
+    positions = positions[found]
+
+    # A min-heap of (score, customerid) holding the top scores so far; once
+    # it is full, only scores above its smallest one get pushed
+    heap = []
+    for start in range(0, len(positions), chunksize):
+        chunk = positions[start:start + chunksize]
+        scores = (_weekly_rate(activity.baseline[chunk], BASELINE_HALF_LIFE)
+                  - _weekly_rate(activity.recent[chunk], RECENT_HALF_LIFE))
+        candidates = scores > 0
+        if len(heap) == top:
+            candidates &= scores > heap[0][0]
+        for score, customer in zip(scores[candidates].tolist(), activity.customerid[chunk][candidates].tolist()):
+            if len(heap) < top:
+                heapq.heappush(heap, (score, customer))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, customer))
+
+    ranked = sorted(heap, reverse=True)
+    chosen = np.searchsorted(activity.customerid, np.array([customer for _, customer in ranked], dtype=np.int64))
+    baseline = _weekly_rate(activity.baseline[chosen], BASELINE_HALF_LIFE)
+    recent = _weekly_rate(activity.recent[chosen], RECENT_HALF_LIFE)
+    customers = pd.DataFrame({
+        "customerid": activity.customerid[chosen],
+        "baseline_logins_per_week": baseline,
+        "recent_logins_per_week": recent,
+        "drop_pct": (1 - recent / baseline) * 100,
+        "last_login": activity.last_login[chosen].astype("datetime64[D]").astype("datetime64[ns]"),
+    }, index=pd.RangeIndex(1, len(ranked) + 1, name="rank"))
+    as_of = datetime.date(1970, 1, 1) + datetime.timedelta(days=activity.as_of) if activity.as_of >= 0 else None
+    return Watchlist(customers, len(cohort), len(positions), as_of)
+
+
+def activity_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".logins.arrow"
+
+
+def _parameters():
+    return {"half_lives": [RECENT_HALF_LIFE, BASELINE_HALF_LIFE], "login_actions": metrics.login_actions}
+
+
+def _write(activity, path, fingerprint):
+    table = pa.table({
+        "customerid": activity.customerid,
+        "recent": activity.recent,
+        "baseline": activity.baseline,
+        "last_login": activity.last_login,
+    }).replace_schema_metadata({
+        _PARAMETERS_KEY: json.dumps(dict(_parameters(), as_of=activity.as_of)).encode(),
+    })
+    ingest.write_table(table, path, fingerprint)
+
+
+def _read(path):
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    parameters = json.loads(table.schema.metadata[_PARAMETERS_KEY])
+    return LoginActivity(
+        *(table.column(name).to_numpy() for name in ("customerid", "recent", "baseline", "last_login")),
+        parameters["as_of"],
+    )
+
+
+def _current(path, fingerprint):
+    if not ingest.built_from(path, fingerprint):
+        return False
+    with pa.memory_map(path) as source:
+        parameters = json.loads(pa.ipc.open_file(source).schema.metadata[_PARAMETERS_KEY])
+    # Sums decayed with other half-lives, or of other actions, do not add up
+    return {key: parameters[key] for key in ("half_lives", "login_actions")} == json.loads(json.dumps(_parameters()))
+
+
+def build(path=loading.USAGE_DATA_PATH, chunksize=None):
+    """Path of the up-to-date log-in sums of the usage CSV at ``path``, built if needed."""
+    fingerprint = loading.file_fingerprint(path)
+    out = activity_path(path)
+    if not _current(out, fingerprint):
+        activity = empty()
+        for usage in sketches.usage_frames(path, chunksize):
+            activity = update(activity, usage)
+        _write(activity, out, fingerprint)
+    return out
+
+
+def load(paths=(loading.USAGE_DATA_PATH,), chunksize=None):
+    """The merged log-in sums of the usage CSVs at ``paths``, building any that are out of date."""
+    return merge(_read(build(path, chunksize)) for path in paths)
+
+
+def active_customers(customer_data, product="Mailchimp"):
+    """Ids of the customers of ``product`` who have not cancelled."""
+    _, non_churned = stages.churn_split(customer_data, product)
+    return non_churned["customerid"].dropna().to_numpy(dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--usage-data", nargs="+", default=[loading.USAGE_DATA_PATH])
+    parser.add_argument("--product", default="Mailchimp")
+    parser.add_argument("--top", type=int, default=TOP)
+    args = parser.parse_args()
+    activity = load(args.usage_data)
+    result = watchlist(activity, active_customers(ingest.load_customer_data(args.customer_data), args.product), args.top)
+    print(f"{result.scored:,} of {result.cohort:,} active {args.product} customers have log-ins to score, "
+          f"as of {result.as_of}")
+    print(result.customers.to_string(float_format="{:.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Read-only results shared by every session of the app.
+
+The loaded tables and the structures derived from them are held once per
+process. When a result is cached, :func:`freeze` marks its bare NumPy arrays
+read-only, such as those of the customer index. :func:`view` hands each
+caller shallow copy-on-write copies of its frames; this relies on pandas 3,
+where copy-on-write is always on. A caller that assigns to a view gets a
+private copy of the columns it touches, and the shared frame never changes.
+"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+def _fields(value):
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return list(value)
+    if isinstance(value, dict):
+        return list(value.values())
+    return []
+
+
+def freeze(value):
+    """Make the NumPy arrays in ``value`` (and in named tuples and dicts of them) read-only."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    for field in _fields(value):
+        freeze(field)
+    return value
+
+
+def view(value):
+    """``value`` with every frame replaced by a copy-on-write view of it."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return type(value)(*map(view, value))
+    if isinstance(value, dict):
+        return {key: view(field) for key, field in value.items()}
+    return value
+
+
+def state_bytes(state):
+    """Pickled size of a session's state, skipping values that cannot be pickled."""
+    size = 0
+    for value in state.values():
+        try:
+            size += len(pickle.dumps(value))
+        except Exception:
+            continue
+    return size
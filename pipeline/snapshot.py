@@ -0,0 +1,232 @@
+"""Precomputed KPI snapshots for the dashboard, built without Streamlit.
+
+    python -m pipeline.snapshot --out data/snapshots
+
+runs the dashboard's stages once over the input files and writes every
+result the app renders to a new versioned directory:
+
+    data/snapshots/
+        LATEST                          name of the newest snapshot
+        20221001T120000Z-3f9c2a1b/
+            metadata.json               inputs, products, stages
+            customer_summary.parquet
+            action_funnel/Mailchimp.parquet
+            ...
+
+A snapshot directory is complete before it appears under its final name and
+``LATEST`` is replaced atomically, so readers never see a partial snapshot.
+Each build then deletes all but the newest KEEP snapshots.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import pandas as pd
+
+from pipeline import loading, parallel
+
+SNAPSHOT_DIR = "data/snapshots"
+LATEST = "LATEST"
+METADATA = "metadata.json"
+# Bumped whenever the layout of a snapshot changes
+FORMAT_VERSION = 1
+# Snapshots kept by each build. The app may still be rendering the one
+# before the latest, so keep at least two
+KEEP = 3
+
+# Stages computed per product, all but action_funnel returning a DataFrame
+PRODUCT_STAGES = ("action_funnel", "daily_customer_series", "channel_breakdown", "action_comparison", "churn_by_channel")
+
+
+def _file_name(product):
+    return urllib.parse.quote(product, safe="") + ".parquet"
+
+
+def _write(frame, path):
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    if frame.index.dtype == object:
+        # Funnels of products with only some actions named mix names and
+        # bare ids, which Parquet cannot store in one column; both render
+        # the same as text
+        frame = frame.set_axis(frame.index.astype(str))
+    frame.to_parquet(path)
+
+
+def build(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH, out=SNAPSHOT_DIR,
+          workers=parallel.DEFAULT_WORKERS, keep=KEEP):
+    """Compute a snapshot of ``customer_path`` and ``usage_path`` under ``out``; returns its path.
+
+    The results are those of :func:`pipeline.parallel.compute`. Snapshots
+    beyond the newest ``keep`` are deleted afterwards.
+    """
+    inputs = [loading.file_fingerprint(path) for path in (customer_path, usage_path)]
+    start = time.perf_counter()
+    results = parallel.compute(customer_path, usage_path, workers)
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    inputs_hash = hashlib.blake2b("".join(fp.content_hash for fp in inputs).encode(), digest_size=4).hexdigest()
+    version = f"{created:%Y%m%dT%H%M%SZ}-{inputs_hash}"
+    products = results["customer_summary"]["product_name"].tolist()
+
+    os.makedirs(out, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=out, prefix=".building-")
+    try:
+        _write(results["customer_summary"], os.path.join(staging, "customer_summary.parquet"))
+        for stage in PRODUCT_STAGES:
+            os.makedirs(os.path.join(staging, stage))
+            for product in products:
+                _write(results[product][stage], os.path.join(staging, stage, _file_name(product)))
+        with open(os.path.join(staging, METADATA), "w") as f:
+            json.dump({
+                "format_version": FORMAT_VERSION,
+                "version": version,
+                "created": created.isoformat(timespec="seconds"),
+                "build_seconds": round(time.perf_counter() - start, 3),
+                "workers": workers,
+                "inputs": {name: fp._asdict() for name, fp in zip(("customer_data", "usage_data"), inputs)},
+                "products": products,
+                "stages": ["customer_summary", *PRODUCT_STAGES],
+            }, f, indent=2)
+        path = os.path.join(out, version)
+        os.replace(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(out, LATEST)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version + "\n")
+    os.replace(pointer + ".tmp", pointer)
+    prune(out, keep)
+    return path
+
+
+def versions(root=SNAPSHOT_DIR):
+    """Names of the complete snapshots under ``root``, oldest first."""
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    # Staging directories are hidden until they are complete. Names only
+    # carry the build time to the second, so order by when each was written
+    complete = [name for name in names
+                if not name.startswith(".") and os.path.isfile(os.path.join(root, name, METADATA))]
+    return sorted(complete, key=lambda name: (os.stat(os.path.join(root, name, METADATA)).st_mtime_ns, name))
+
+
+def prune(root=SNAPSHOT_DIR, keep=KEEP):
+    """Delete all but the newest ``keep`` snapshots under ``root``, never the one ``LATEST`` names."""
+    latest_path = latest(root)
+    for name in versions(root)[:-keep] if keep > 0 else versions(root):
+        path = os.path.join(root, name)
+        if path != latest_path:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_in_subprocess(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH,
+                        out=SNAPSHOT_DIR, workers=parallel.DEFAULT_WORKERS):
+    """:func:`build` run in a child process, for callers that cannot start a pool."""
+    subprocess.run(
+        [sys.executable, "-m", "pipeline.snapshot", "--customer-data", os.path.abspath(customer_path),
+         "--usage-data", os.path.abspath(usage_path), "--out", os.path.abspath(out), "--workers", str(workers),
+         "--keep", str(KEEP)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True, stdout=subprocess.DEVNULL,
+    )
+    return latest(out)
+
+
+def latest(root=SNAPSHOT_DIR):
+    """Path of the newest snapshot under ``root``, or ``None``."""
+    try:
+        with open(os.path.join(root, LATEST)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, version)
+
+
+def current(root=SNAPSHOT_DIR, input_paths=(loading.CUSTOMER_DATA_PATH, loading.USAGE_DATA_PATH)):
+    """Newest snapshot under ``root`` unless an input file present here changed since it was built.
+
+    Inputs are compared by size and mtime only, and one that is missing
+    here does not count as changed. The snapshot holds the aggregated
+    stages but not the typed customer or usage rows, which the deep-dive,
+    retention and churn tabs still read from the input files, so it does
+    not stand in for them.
+    """
+    path = latest(root)
+    if path is None:
+        return None
+    with open(os.path.join(path, METADATA)) as f:
+        metadata = json.load(f)
+    if metadata["format_version"] != FORMAT_VERSION:
+        return None
+    for built, input_path in zip(metadata["inputs"].values(), input_paths):
+        try:
+            stat = os.stat(input_path)
+        except FileNotFoundError:
+            continue
+        if (stat.st_size, stat.st_mtime_ns) != (built["size"], built["mtime_ns"]):
+            return None
+    return path
+
+
+class Snapshot:
+    """Read side of one snapshot directory, with the stage functions' signatures."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, METADATA)) as f:
+            self.metadata = json.load(f)
+
+    @property
+    def version(self):
+        return self.metadata["version"]
+
+    def _read(self, stage, product):
+        if product not in self.metadata["products"]:
+            raise KeyError(f"{product!r} is not in snapshot {self.version}")
+        return pd.read_parquet(os.path.join(self.path, stage, _file_name(product)))
+
+    def customer_summary(self):
+        return pd.read_parquet(os.path.join(self.path, "customer_summary.parquet"))
+
+    def action_funnel(self, product="Mailchimp"):
+        return self._read("action_funnel", product).iloc[:, 0]
+
+    def daily_customer_series(self, product="Mailchimp"):
+        return self._read("daily_customer_series", product)
+
+    def channel_breakdown(self, product="Mailchimp"):
+        return self._read("channel_breakdown", product)
+
+    def action_comparison(self, product="Mailchimp"):
+        return self._read("action_comparison", product)
+
+    def churn_by_channel(self, product="Mailchimp"):
+        return self._read("churn_by_channel", product)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--usage-data", default=loading.USAGE_DATA_PATH)
+    parser.add_argument("--out", default=SNAPSHOT_DIR)
+    parser.add_argument("--workers", type=int, default=parallel.DEFAULT_WORKERS, help="processes to use; 1 runs serially")
+    parser.add_argument("--keep", type=int, default=KEEP, help="snapshots to keep, the new one included")
+    args = parser.parse_args()
+    print(build(args.customer_data, args.usage_data, args.out, args.workers, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""SQLite query backend for filtering the dashboard by date, channel and product.
+
+    python -m pipeline.sql --out data/pipeline.sqlite
+
+loads both CSVs into one SQLite file (Python's built-in ``sqlite3``, so no
+server and no extra dependency):
+
+- ``customers`` and ``usage``: the typed rows of :mod:`pipeline.ingest`
+- ``customer_daily``: customers per product, channel, activation day and
+  cancel day (the customer cube of :mod:`pipeline.cube`)
+- ``usage_daily``: usage rows and ``usage_count`` per product, channel,
+  action and day (the usage cube)
+- ``churn_usage``: the same, for the usage of each product's churned and
+  non-churned customers, with the customer's channel and churn status
+
+Dates are stored as days since 1970-01-01. The row tables are indexed on
+``customerid``, ``product_name``, ``channel`` and each date for ad hoc
+queries. The dashboard queries read the rollups, which are grouped by every
+column a filter can touch, so a query over 10M usage rows reads at most
+days x channels x actions rows of the product it asks about.
+
+Every filter value is bound as a query parameter. Without filters the
+:class:`Database` methods return the same frames as the cube functions.
+With a date range:
+
+- activations and cancellations count when they fall inside the range
+- current active customers activated in the range and had not cancelled by its end
+- usage counts when it happened inside the range; churn status is the current one
+- daily series keep their lifetime running totals and are cut to the range
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from pipeline import cube, ingest, loading, metrics, stages
+
+DATABASE_PATH = "data/pipeline.sqlite"
+# Bumped whenever the schema changes
+FORMAT_VERSION = 1
+
+_EPOCH = pd.Timestamp("1970-01-01")
+# Rows per INSERT batch while loading the row tables
+_BATCH_ROWS = 500_000
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE customers (
+    customerid INTEGER, product_name TEXT, signup_date INTEGER, channel TEXT,
+    first_activation_date INTEGER, first_purchase_date INTEGER, cancel_date INTEGER
+);
+CREATE TABLE usage (
+    customerid INTEGER, product_name TEXT, action_type_id INTEGER, usage_count INTEGER, event_date INTEGER
+);
+CREATE TABLE customer_daily (
+    product_name TEXT, channel TEXT, first_activation_date INTEGER, cancel_date INTEGER, customers INTEGER NOT NULL
+);
+CREATE TABLE usage_daily (
+    product_name TEXT, channel TEXT, action_type_id INTEGER, event_date INTEGER,
+    rows INTEGER NOT NULL, usage_count INTEGER NOT NULL
+);
+CREATE TABLE churn_usage (
+    product_name TEXT, channel TEXT, churned INTEGER NOT NULL, action_type_id INTEGER, event_date INTEGER,
+    rows INTEGER NOT NULL, usage_count INTEGER NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX customers_customerid ON customers (customerid);
+CREATE INDEX customers_product ON customers (product_name, channel);
+CREATE INDEX customers_channel ON customers (channel);
+CREATE INDEX customers_activation ON customers (first_activation_date);
+CREATE INDEX customers_cancel ON customers (cancel_date);
+CREATE INDEX usage_customerid ON usage (customerid);
+CREATE INDEX usage_product ON usage (product_name, event_date);
+CREATE INDEX usage_event_date ON usage (event_date);
+"""
+
+# The rollups are only read through these covering indexes, which lead with
+# the group keys of the queries so that neither table rows nor a temporary
+# b-tree are needed for them
+_ROLLUP_INDEXES = """
+CREATE INDEX customer_daily_product ON customer_daily (
+    product_name, channel, first_activation_date, cancel_date, customers
+);
+CREATE INDEX usage_daily_product ON usage_daily (
+    product_name, action_type_id, event_date, channel, rows, usage_count
+);
+CREATE INDEX churn_usage_product ON churn_usage (
+    product_name, churned, action_type_id, event_date, channel, rows, usage_count
+);
+"""
+
+
+class Filters(NamedTuple):
+    """Sidebar filters; ``None`` leaves a dimension unfiltered."""
+    start: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+    channels: Optional[Tuple[str, ...]] = None
+    products: Optional[Tuple[str, ...]] = None
+
+
+NO_FILTERS = Filters()
+
+
+def _day(date):
+    return (pd.Timestamp(date) - _EPOCH).days
+
+
+def _days(dates):
+    days = (dates - _EPOCH) // pd.Timedelta(days=1)
+    return days.astype("Int64").to_numpy(dtype=object, na_value=None)
+
+
+def _values(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return _days(column)
+    return column.astype(object).where(column.notna(), None).to_numpy()
+
+
+def _insert(connection, table, frame):
+    """Append ``frame`` to ``table`` in batches, dates as day numbers and NA as NULL."""
+    statement = f"INSERT INTO {table} ({', '.join(frame.columns)}) VALUES ({', '.join('?' * len(frame.columns))})"
+    for start in range(0, len(frame), _BATCH_ROWS):
+        batch = frame.iloc[start:start + _BATCH_ROWS]
+        connection.executemany(statement, zip(*(_values(batch[column]) for column in batch.columns)))
+
+
+def churn_usage(customer_data, usage_data):
+    """Usage of each product's churned and non-churned customers per channel, action and day."""
+    frames = []
+    for product in customer_data["product_name"].cat.categories:
+        product_data = customer_data.loc[customer_data["product_name"] == product, ["customerid", "channel", "cancel_date"]]
+        cohorts = pd.DataFrame({
+            "customerid": product_data["customerid"],
+            "channel": product_data["channel"],
+            "churned": product_data["cancel_date"].notna().astype("int8"),
+        })
+        # All of the customer's usage, of any product, as in stages.action_comparison
+        usage = usage_data[["customerid", "action_type_id", "event_date", "usage_count"]].merge(cohorts, on="customerid")
+        by_key = usage.groupby(["channel", "churned", "action_type_id", "event_date"], observed=True, dropna=False)["usage_count"]
+        frame = by_key.agg(rows="size", usage_count="sum").reset_index()
+        frame.insert(0, "product_name", product)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def build(customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH, out=DATABASE_PATH):
+    """Load both input files into a new database at ``out``; returns its path."""
+    inputs = [loading.file_fingerprint(path) for path in (customer_path, usage_path)]
+    start = time.perf_counter()
+    customer_data = ingest.load_customer_data(customer_path)
+    usage_data = ingest.load_usage_data(usage_path)
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    inputs_hash = hashlib.blake2b("".join(fp.content_hash for fp in inputs).encode(), digest_size=4).hexdigest()
+    window = [customer_data[column] for column in ("first_activation_date", "cancel_date")]
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    staging = f"{out}.building-{os.getpid()}"
+    if os.path.exists(staging):
+        os.remove(staging)
+    try:
+        connection = sqlite3.connect(staging)
+        # A half-built file is thrown away, so it needs no journal
+        connection.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + _SCHEMA)
+        with connection:
+            _insert(connection, "customers", customer_data)
+            _insert(connection, "usage", usage_data)
+            _insert(connection, "customer_daily", cube.customer_cube(customer_data))
+            _insert(connection, "usage_daily", cube.usage_cube(customer_data, usage_data))
+            _insert(connection, "churn_usage", churn_usage(customer_data, usage_data))
+        connection.executescript(_INDEXES + _ROLLUP_INDEXES + "ANALYZE;")
+        with connection:
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [(key, json.dumps(value)) for key, value in {
+                "format_version": FORMAT_VERSION,
+                "version": f"{created:%Y%m%dT%H%M%SZ}-{inputs_hash}",
+                "created": created.isoformat(timespec="seconds"),
+                "build_seconds": round(time.perf_counter() - start, 3),
+                "inputs": {name: fp._asdict() for name, fp in zip(("customer_data", "usage_data"), inputs)},
+                "products": sorted(customer_data["product_name"].dropna().unique().tolist()),
+                "channels": sorted(customer_data["channel"].dropna().unique().tolist()),
+                "date_window": [str(min(dates.min() for dates in window).date()), str(max(dates.max() for dates in window).date())],
+            }.items()])
+        connection.close()
+        os.replace(staging, out)
+    except BaseException:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    return out
+
+
+def _metadata(path):
+    connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        return {key: json.loads(value) for key, value in connection.execute("SELECT key, value FROM meta")}
+    finally:
+        connection.close()
+
+
+def _built_from(metadata, input_paths):
+    # Inputs are compared by size and mtime, like snapshots
+    if metadata is None or metadata.get("format_version") != FORMAT_VERSION:
+        return False
+    for built, input_path in zip(metadata["inputs"].values(), input_paths):
+        stat = os.stat(input_path)
+        if (stat.st_size, stat.st_mtime_ns) != (built["size"], built["mtime_ns"]):
+            return False
+    return True
+
+
+def _where(filters, product=None, date_column=None):
+    """SQL conditions and named parameters for ``filters``."""
+    clauses, params = [], {}
+
+    def bind_list(column, values):
+        names = [f"{column}_{i}" for i in range(len(values))]
+        params.update(zip(names, values))
+        clauses.append(f"{column} IN ({', '.join(':' + name for name in names)})")
+
+    if product is not None:
+        clauses.append("product_name = :product")
+        params["product"] = product
+    elif filters.products is not None:
+        bind_list("product_name", filters.products)
+    if filters.channels is not None:
+        bind_list("channel", filters.channels)
+    if date_column is not None and filters.start is not None:
+        clauses.append(f"{date_column} >= :start")
+    if date_column is not None and filters.end is not None:
+        clauses.append(f"{date_column} <= :end")
+    params.update(_range(filters))
+    return " AND ".join(clauses) or "1", params
+
+
+def _range(filters):
+    # Open ends stand in as far-off days, so "inside the range" means "not NULL"
+    return {
+        "start": _day(filters.start) if filters.start is not None else -2**62,
+        "end": _day(filters.end) if filters.end is not None else 2**62,
+    }
+
+
+# Counts of customer_daily rows by the date range
+_ACTIVATED = "SUM(CASE WHEN first_activation_date BETWEEN :start AND :end THEN customers ELSE 0 END)"
+_CURRENT_ACTIVE = (
+    "SUM(CASE WHEN first_activation_date BETWEEN :start AND :end "
+    "AND (cancel_date IS NULL OR cancel_date > :end) THEN customers ELSE 0 END)"
+)
+_CANCELLED = "SUM(CASE WHEN cancel_date BETWEEN :start AND :end THEN customers ELSE 0 END)"
+
+
+def _counts(frame, column):
+    # A groupby size never yields zero counts, so neither do these
+    counts = frame.set_index(frame.columns[0])[column]
+    return counts[counts > 0]
+
+
+class Database:
+    """Read side of a database written by :func:`build`, with the cube functions' signatures.
+
+    Each thread gets its own read-only connection, so one instance can serve
+    every session of the app.
+    """
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        try:
+            self.metadata = _metadata(self.path)
+        except sqlite3.Error:
+            self.metadata = None
+
+    @property
+    def version(self):
+        return self.metadata["version"]
+
+    def sync(self, customer_path=loading.CUSTOMER_DATA_PATH, usage_path=loading.USAGE_DATA_PATH):
+        """Rebuild the database if it is missing or older than the input files; returns its version."""
+        with self._lock:
+            if not _built_from(self.metadata, (customer_path, usage_path)):
+                build(customer_path, usage_path, self.path)
+                self.metadata = _metadata(self.path)
+        return self.version
+
+    @property
+    def products(self):
+        return self.metadata["products"]
+
+    @property
+    def channels(self):
+        return self.metadata["channels"]
+
+    @property
+    def date_window(self):
+        return tuple(datetime.date.fromisoformat(day) for day in self.metadata["date_window"])
+
+    def query(self, sql, params=None):
+        """Run a read-only query and return the result as a DataFrame."""
+        connection, version = getattr(self._local, "connection", (None, None))
+        if version != self.version:
+            # A rebuild replaces the file, which open connections would keep reading
+            if connection is not None:
+                connection.close()
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection, self.version
+        cursor = connection.execute(sql, params or {})
+        return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+    def customer_summary(self, filters=NO_FILTERS):
+        where, params = _where(filters)
+        counts = self.query(
+            f"SELECT product_name, {_ACTIVATED} AS activated, {_CURRENT_ACTIVE} AS current_active, "
+            f"{_CANCELLED} AS cancelled FROM customer_daily WHERE {where} AND product_name IS NOT NULL "
+            "GROUP BY product_name ORDER BY product_name",
+            params,
+        )
+        where, params = _where(filters, date_column="event_date")
+        action_sums = self.query(
+            f"SELECT product_name, action_type_id, SUM(usage_count) AS usage_count FROM usage_daily "
+            f"WHERE {where} GROUP BY product_name, action_type_id ORDER BY product_name, action_type_id",
+            params,
+        ).set_index(["product_name", "action_type_id"])["usage_count"]
+        return stages.summary_frame(
+            _counts(counts, "activated"),
+            _counts(counts, "current_active"),
+            _counts(counts, "cancelled"),
+            metrics.select_north_star(action_sums),
+        )
+
+    def action_funnel(self, product="Mailchimp", filters=NO_FILTERS, actions_key=None):
+        actions_key = metrics.action_names(product) if actions_key is None else actions_key
+        where, params = _where(filters, product, "event_date")
+        action_counts = self.query(
+            f"SELECT action_type_id, SUM(rows) AS count FROM usage_daily WHERE {where} "
+            "GROUP BY action_type_id ORDER BY action_type_id",
+            params,
+        ).set_index("action_type_id")["count"]
+        return stages.name_funnel(action_counts.sort_values(ascending=False), actions_key)
+
+    def daily_customer_series(self, product="Mailchimp", filters=NO_FILTERS):
+        # Running totals start at the first day of the data, not of the range
+        where, params = _where(filters._replace(start=None, end=None), product)
+        full_date_range = pd.date_range(*self.date_window, freq="D")
+        cumulative = {}
+        for name, column in (("Cumulative_Activated", "first_activation_date"), ("Cumulative_Cancelled", "cancel_date")):
+            counts = self.query(
+                f"SELECT {column} AS day, SUM(customers) AS customers FROM customer_daily "
+                f"WHERE {where} AND {column} IS NOT NULL GROUP BY day",
+                params,
+            )
+            days = _EPOCH + pd.to_timedelta(counts["day"].astype("int64"), unit="D")
+            by_day = pd.Series(counts["customers"].astype("int64").to_numpy(), index=days)
+            cumulative[name] = by_day.reindex(full_date_range, fill_value=0).cumsum()
+        series = pd.DataFrame(cumulative)
+        series["Active"] = series["Cumulative_Activated"] - series["Cumulative_Cancelled"]
+        start = pd.Timestamp(filters.start) if filters.start is not None else None
+        end = pd.Timestamp(filters.end) if filters.end is not None else None
+        return series.loc[start:end]
+
+    def channel_breakdown(self, product="Mailchimp", filters=NO_FILTERS):
+        where, params = _where(filters, product, "first_activation_date")
+        breakdown = self.query(
+            f"SELECT channel, SUM(customers) AS Customer_Count FROM customer_daily "
+            f"WHERE {where} AND channel IS NOT NULL GROUP BY channel ORDER BY channel",
+            params,
+        )
+        return breakdown.sort_values(by="Customer_Count", ascending=False)
+
+    def action_comparison(self, product="Mailchimp", filters=NO_FILTERS, action_names=None):
+        action_names = metrics.comparison_action_names(product) if action_names is None else action_names
+        where, params = _where(filters, product, "event_date")
+        totals = self.query(
+            f"SELECT churned, action_type_id, SUM(usage_count) AS usage_count FROM churn_usage WHERE {where} "
+            "GROUP BY churned, action_type_id HAVING SUM(rows) > 0 ORDER BY churned, action_type_id",
+            params,
+        )
+
+        def cohort_actions(churned):
+            return totals.loc[totals["churned"] == churned, ["action_type_id", "usage_count"]].reset_index(drop=True)
+
+        return stages.compare_action_mix(cohort_actions(1), cohort_actions(0), action_names)
+
+    def active_customers(self, product="Mailchimp", filters=NO_FILTERS):
+        """Ids of the customers of ``product`` who have not cancelled, in the filtered channels."""
+        where, params = _where(filters, product)
+        ids = self.query(
+            f"SELECT customerid FROM customers WHERE {where} AND customerid IS NOT NULL AND cancel_date IS NULL", params
+        )
+        return ids["customerid"].to_numpy(dtype="int64")
+
+    def churn_by_channel(self, product="Mailchimp", filters=NO_FILTERS):
+        where, params = _where(filters, product)
+        counts = self.query(
+            f"SELECT channel, {_ACTIVATED} AS activated, {_CANCELLED} AS cancelled FROM customer_daily "
+            f"WHERE {where} AND channel IS NOT NULL GROUP BY channel ORDER BY channel",
+            params,
+        )
+        return stages.channel_churn(_counts(counts, "cancelled"), _counts(counts, "activated"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--usage-data", default=loading.USAGE_DATA_PATH)
+    parser.add_argument("--out", default=DATABASE_PATH)
+    args = parser.parse_args()
+    print(build(args.customer_data, args.usage_data, args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""KPI computations behind each section of the dashboard.
+
+Every stage is a plain function of the loaded frames, so it can be cached,
+benchmarked or run outside Streamlit.
+"""
+
+import pandas as pd
+
+from pipeline import metrics
+
+# Window of the daily time series
+START_DATE = pd.Timestamp("2021-05-01")
+END_DATE = pd.Timestamp("2022-06-30")
+
+
+def customer_summary(customer_data, usage_data):
+    """Lifetime activated, current active, churn rate and North Star value per product."""
+    return summarize_customers(customer_data, metrics.north_star_actuals(usage_data))
+
+
+def summarize_customers(customer_data, north_star_actuals):
+    """``customer_summary`` from precomputed North Star actuals."""
+    # Calculate lifetime activated customers (first_activation_date is not null)
+    lifetime_activated_customers = customer_data[~customer_data['first_activation_date'].isna()]
+    lifetime_activated_by_product = lifetime_activated_customers.groupby('product_name', observed=True).size()
+
+    # Calculate current active customers (first_activation_date is not null and cancel_date is null)
+    current_active_customers = customer_data[
+        (~customer_data['first_activation_date'].isna()) & (customer_data['cancel_date'].isna())
+    ]
+    current_active_by_product = current_active_customers.groupby('product_name', observed=True).size()
+
+    # Calculate churned users by product
+    churned_users_by_product = customer_data[~customer_data['cancel_date'].isna()].groupby('product_name', observed=True).size()
+
+    return summary_frame(
+        lifetime_activated_by_product, current_active_by_product, churned_users_by_product, north_star_actuals
+    )
+
+
+def summary_frame(lifetime_activated_by_product, current_active_by_product, churned_users_by_product, north_star_actuals):
+    """Assemble ``customer_summary`` from per-product customer counts."""
+    # Calculate churn rate: churned users / lifetime activated customers
+    churn_rate_by_product = (churned_users_by_product / lifetime_activated_by_product * 100).fillna(0)
+
+    summary = pd.DataFrame({
+        "Lifetime_Activated_Customers": lifetime_activated_by_product,
+        "Current_Active_Customers": current_active_by_product,
+        "Churn_Rate (%)": churn_rate_by_product
+    }).fillna(0).astype({
+        "Lifetime_Activated_Customers": int,
+        "Current_Active_Customers": int,
+        "Churn_Rate (%)": float
+    })
+    summary.reset_index(inplace=True)
+
+    # Merge the North Star actuals on product_name, keeping every product
+    summary = pd.merge(summary, north_star_actuals, how="left", on="product_name")
+    summary.rename(columns={"usage_count": "NorthStar_Metric_Value"}, inplace=True)
+    summary["NorthStar_Metric_Value"] = summary["NorthStar_Metric_Value"].fillna(0).astype(int)
+    summary.reset_index(inplace=True)
+    return summary
+
+
+def product_customers(customer_data, product="Mailchimp"):
+    """Customers of one product with activation and cancel dates parsed."""
+    product_data = customer_data[customer_data["product_name"] == product].copy()
+    product_data["first_activation_date"] = pd.to_datetime(product_data["first_activation_date"], errors="coerce")
+    product_data["cancel_date"] = pd.to_datetime(product_data["cancel_date"], errors="coerce")
+    return product_data
+
+
+def action_funnel(usage_data, product="Mailchimp", actions_key=None):
+    """Count usage rows per action, named and sorted by frequency."""
+    actions_key = metrics.action_names(product) if actions_key is None else actions_key
+    action_counts = usage_data.loc[usage_data["product_name"] == product, "action_type_id"].value_counts()
+    return name_funnel(action_counts, actions_key)
+
+
+def name_funnel(action_counts, actions_key):
+    """Name the steps of per-action row counts and sort them by frequency."""
+    return action_counts.rename(index=actions_key).sort_values(ascending=False)
+
+
+def daily_customer_series(customer_data, product="Mailchimp", start_date=START_DATE, end_date=END_DATE):
+    """Cumulative activated, cumulative cancelled and active customers per day."""
+    product_data = product_customers(customer_data, product)
+    full_date_range = pd.date_range(start=start_date, end=end_date, freq="D")
+
+    cumulative_activated = product_data.groupby("first_activation_date").size().reindex(full_date_range, fill_value=0).cumsum()
+    cumulative_cancelled = product_data.groupby("cancel_date").size().reindex(full_date_range, fill_value=0).cumsum()
+
+    return pd.DataFrame({
+        "Cumulative_Activated": cumulative_activated,
+        "Cumulative_Cancelled": cumulative_cancelled,
+        "Active": cumulative_activated - cumulative_cancelled,
+    })
+
+
+def channel_breakdown(customer_data, product="Mailchimp"):
+    """Customer count per acquisition channel, largest first."""
+    product_data = customer_data[customer_data["product_name"] == product]
+    breakdown = product_data.groupby("channel", observed=True).size().reset_index(name="Customer_Count")
+    return breakdown.sort_values(by="Customer_Count", ascending=False)
+
+
+def action_comparison(customer_data, usage_data, product="Mailchimp", action_names=None):
+    """Share of each action in the usage of churned vs non-churned customers."""
+    action_names = metrics.comparison_action_names(product) if action_names is None else action_names
+    churned_users, non_churned_users = churn_split(customer_data, product)
+    churned_usage = usage_data.merge(churned_users, on="customerid")
+    non_churned_usage = usage_data.merge(non_churned_users, on="customerid")
+
+    # Group and calculate action counts for churned and non-churned users
+    churned_actions = churned_usage.groupby("action_type_id")["usage_count"].sum().reset_index()
+    non_churned_actions = non_churned_usage.groupby("action_type_id")["usage_count"].sum().reset_index()
+    return compare_action_mix(churned_actions, non_churned_actions, action_names)
+
+
+def churn_split(customer_data, product="Mailchimp"):
+    """Customer ids of one product that churned and that are still active."""
+    product_data = product_customers(customer_data, product)
+    churned = product_data["cancel_date"].notna()
+    return product_data.loc[churned, ["customerid"]], product_data.loc[~churned, ["customerid"]]
+
+
+def compare_action_mix(churned_actions, non_churned_actions, action_names):
+    """Percentage of each action within the churned and non-churned totals."""
+    churned_actions = churned_actions.copy()
+    non_churned_actions = non_churned_actions.copy()
+
+    # Normalize to percentages of each group's total actions
+    churned_actions["Percentage"] = churned_actions["usage_count"] / churned_actions["usage_count"].sum() * 100
+    non_churned_actions["Percentage"] = non_churned_actions["usage_count"] / non_churned_actions["usage_count"].sum() * 100
+
+    comparison = pd.merge(
+        churned_actions.rename(columns={"Percentage": "Churned_Percentage"}),
+        non_churned_actions.rename(columns={"Percentage": "Non_Churned_Percentage"}),
+        on="action_type_id",
+        how="outer"
+    ).fillna(0)
+    comparison["Action_Type"] = comparison["action_type_id"].map(action_names).fillna(
+        "Action " + comparison["action_type_id"].astype(str)
+    )
+    return comparison
+
+
+def churn_by_channel(customer_data, product="Mailchimp"):
+    """Churned customers and churn rate (churned / lifetime activated) per channel."""
+    product_data = product_customers(customer_data, product)
+    lifetime_activated_by_channel = product_data[~product_data['first_activation_date'].isna()].groupby('channel', observed=True).size()
+    churned_users_by_channel = product_data[~product_data['cancel_date'].isna()].groupby('channel', observed=True).size()
+    return channel_churn(churned_users_by_channel, lifetime_activated_by_channel)
+
+
+def channel_churn(churned_users_by_channel, lifetime_activated_by_channel):
+    """Combine per-channel churned and lifetime activated counts into churn rates."""
+    churn_rate_by_channel = (churned_users_by_channel / lifetime_activated_by_channel * 100).fillna(0)
+    return pd.DataFrame({
+        "Churned_Users": churned_users_by_channel,
+        "Churn_Rate": churn_rate_by_channel,
+    }).fillna(0).astype({"Churned_Users": int})
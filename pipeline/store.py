@@ -0,0 +1,163 @@
+"""Persistent, incrementally updated aggregates.
+
+Usage is append-only: ``data/usage_data.csv`` holds the history and new days
+land as partitions like ``data/usage/2022-07-01.csv``. Each partition is
+folded into the store exactly once:
+
+- ``usage_daily``: usage rows and ``usage_count`` per day, product and action
+- ``customer_actions``: ``usage_count`` per customer and action
+
+The customer export is a small snapshot that is replaced wholesale whenever it
+changes, together with ``customer_daily`` (activations and cancellations per
+day, product and channel). Churn status is looked up against that snapshot at
+query time, so a customer who cancels later moves from the non-churned to the
+churned bucket without rescanning any usage.
+
+Every sync writes its tables under a new generation number and then swaps the
+manifest, so a crash mid-sync never leaves a partition half counted.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+from pipeline import ingest, loading, stages, streaming
+
+MANIFEST = "manifest.json"
+TABLES = ("usage_daily", "customer_actions", "customers", "customer_daily")
+
+
+def _customer_daily(customers):
+    counts = {}
+    for name, column in (("activated", "first_activation_date"), ("cancelled", "cancel_date")):
+        dated = customers[customers[column].notna()]
+        counts[name] = dated.groupby([column, "product_name", "channel"], observed=True, dropna=False).size()
+        counts[name].index = counts[name].index.set_names("date", level=0)
+    return pd.DataFrame(counts).fillna(0).astype(int).reset_index()
+
+
+class AggregateStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {"generation": 0, "partitions": {}, "customers": None}
+        self.tables = {
+            name: ingest.read_columnar(self._table_path(name, self.manifest["generation"]))
+            for name in TABLES if self.manifest["generation"]
+        }
+
+    def _table_path(self, name, generation):
+        return os.path.join(self.path, f"{name}-{generation}.arrow")
+
+    @property
+    def version(self):
+        """Token that changes whenever the stored aggregates change."""
+        return hashlib.blake2b(json.dumps(self.manifest, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def sync(self, customer_path=loading.CUSTOMER_DATA_PATH, usage_paths=None, chunksize=streaming.DEFAULT_CHUNKSIZE):
+        """Fold new usage partitions and the latest customer snapshot into the store."""
+        if usage_paths is None:
+            usage_paths = [loading.USAGE_DATA_PATH] + sorted(glob.glob(os.path.join(loading.USAGE_PARTITIONS_DIR, "*.csv")))
+        with self._lock:
+            tables = dict(self.tables)
+            manifest = {**self.manifest, "partitions": dict(self.manifest["partitions"])}
+
+            for path in usage_paths:
+                fingerprint = loading.file_fingerprint(path)
+                merged = manifest["partitions"].get(fingerprint.path)
+                if merged == fingerprint._asdict():
+                    continue
+                if merged is not None:
+                    raise ValueError(f"{path} changed after it was merged into the aggregate store; rebuild the store")
+                self._merge_usage(tables, path, chunksize)
+                manifest["partitions"][fingerprint.path] = fingerprint._asdict()
+
+            fingerprint = loading.file_fingerprint(customer_path)
+            if manifest["customers"] != fingerprint._asdict():
+                tables["customers"] = ingest.load_customer_data(customer_path)
+                tables["customer_daily"] = _customer_daily(tables["customers"])
+                manifest["customers"] = fingerprint._asdict()
+
+            if manifest != self.manifest:
+                self._commit(tables, manifest)
+        return self.version
+
+    def _merge_usage(self, tables, path, chunksize):
+        usage_daily = customer_actions = None
+        if "usage_daily" in tables:
+            usage_daily = tables["usage_daily"].set_index(["event_date", "product_name", "action_type_id"])
+            customer_actions = tables["customer_actions"].set_index(["customerid", "action_type_id"])["usage_count"]
+        for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+            chunk = ingest.type_usage_data(chunk)
+            by_day = chunk.groupby(["event_date", "product_name", "action_type_id"], observed=True)["usage_count"]
+            usage_daily = streaming.fold(usage_daily, by_day.agg(rows="size", usage_count="sum"))
+            by_customer = chunk.groupby(["customerid", "action_type_id"], dropna=False)["usage_count"]
+            customer_actions = streaming.fold(customer_actions, by_customer.sum())
+        tables["usage_daily"] = usage_daily.reset_index()
+        tables["customer_actions"] = customer_actions.reset_index()
+
+    def _commit(self, tables, manifest):
+        os.makedirs(self.path, exist_ok=True)
+        previous = self.manifest["generation"]
+        manifest["generation"] = previous + 1
+        for name in TABLES:
+            ingest.write_columnar(tables[name], self._table_path(name, manifest["generation"]))
+        tmp_path = os.path.join(self.path, f"{MANIFEST}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+        for name in TABLES:
+            if previous:
+                os.remove(self._table_path(name, previous))
+        self.manifest = manifest
+        self.tables = {name: ingest.read_columnar(self._table_path(name, manifest["generation"])) for name in TABLES}
+
+    def usage_aggregates(self):
+        """The store's usage tables as :class:`pipeline.streaming.UsageAggregates`."""
+        by_action = self.tables["usage_daily"].groupby(["product_name", "action_type_id"], observed=True)
+        return streaming.UsageAggregates(
+            action_sums=by_action["usage_count"].sum(),
+            action_rows=by_action["rows"].sum(),
+            customer_action_sums=self.tables["customer_actions"].set_index(["customerid", "action_type_id"])["usage_count"],
+        )
+
+    def customer_summary(self):
+        return streaming.customer_summary(self.tables["customers"], self.usage_aggregates())
+
+    def action_funnel(self, product="Mailchimp"):
+        return streaming.action_funnel(self.usage_aggregates(), product)
+
+    def action_comparison(self, product="Mailchimp"):
+        return streaming.action_comparison(self.tables["customers"], self.usage_aggregates(), product)
+
+    def daily_customer_series(self, product="Mailchimp", start_date=stages.START_DATE, end_date=stages.END_DATE):
+        customer_daily = self.tables["customer_daily"]
+        daily = customer_daily[customer_daily["product_name"] == product].groupby("date")[["activated", "cancelled"]].sum()
+        full_date_range = pd.date_range(start=start_date, end=end_date, freq="D")
+        cumulative_activated = daily["activated"].reindex(full_date_range, fill_value=0).cumsum()
+        cumulative_cancelled = daily["cancelled"].reindex(full_date_range, fill_value=0).cumsum()
+        return pd.DataFrame({
+            "Cumulative_Activated": cumulative_activated,
+            "Cumulative_Cancelled": cumulative_cancelled,
+            "Active": cumulative_activated - cumulative_cancelled,
+        })
+
+    def churn_by_channel(self, product="Mailchimp"):
+        customer_daily = self.tables["customer_daily"]
+        by_channel = customer_daily[customer_daily["product_name"] == product].groupby("channel", observed=True)
+        lifetime_activated_by_channel = by_channel["activated"].sum()
+        churned_users_by_channel = by_channel["cancelled"].sum()
+        # Channels with no activations or churn are absent from the
+        # per-customer groupbys, so drop their zero rows before dividing
+        return stages.channel_churn(
+            churned_users_by_channel[churned_users_by_channel > 0],
+            lifetime_activated_by_channel[lifetime_activated_by_channel > 0],
+        )
@@ -0,0 +1,74 @@
+"""Chunked aggregation of usage files too large to load in one piece.
+
+The usage file is read ``chunksize`` rows at a time and each chunk is folded
+into running partial aggregates, so peak memory is bounded by the chunk size
+plus the aggregates themselves (products x actions and customers x actions),
+never by the length of the file. The KPI helpers below rebuild the in-memory
+stage outputs from those aggregates.
+"""
+
+from typing import NamedTuple
+
+import pandas as pd
+
+from pipeline import ingest, loading, metrics, stages
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+class UsageAggregates(NamedTuple):
+    # usage_count summed per (product_name, action_type_id)
+    action_sums: pd.Series
+    # usage rows per (product_name, action_type_id)
+    action_rows: pd.Series
+    # usage_count summed per (customerid, action_type_id)
+    customer_action_sums: pd.Series
+
+
+def fold(total, part):
+    """Add the partial aggregate ``part`` into the running ``total``."""
+    if total is None:
+        return part
+    # dropna=False keeps unparseable customer ids, which the in-memory
+    # merges also match against each other
+    return pd.concat([total, part]).groupby(level=list(range(part.index.nlevels)), dropna=False).sum()
+
+
+def aggregate_usage(path=loading.USAGE_DATA_PATH, chunksize=DEFAULT_CHUNKSIZE):
+    """Fold the usage file into :class:`UsageAggregates` one chunk at a time."""
+    action_sums = action_rows = customer_action_sums = None
+    for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+        chunk = ingest.type_usage_data(chunk)
+        by_action = chunk.groupby(["product_name", "action_type_id"], observed=True)["usage_count"]
+        action_sums = fold(action_sums, by_action.sum())
+        action_rows = fold(action_rows, by_action.size())
+        by_customer = chunk.groupby(["customerid", "action_type_id"], dropna=False)["usage_count"]
+        customer_action_sums = fold(customer_action_sums, by_customer.sum())
+    return UsageAggregates(action_sums, action_rows, customer_action_sums)
+
+
+def customer_summary(customer_data, aggregates):
+    """Same frame as :func:`pipeline.stages.customer_summary`."""
+    return stages.summarize_customers(customer_data, metrics.select_north_star(aggregates.action_sums))
+
+
+def action_funnel(aggregates, product="Mailchimp", actions_key=None):
+    """Same series as :func:`pipeline.stages.action_funnel`."""
+    actions_key = metrics.action_names(product) if actions_key is None else actions_key
+    action_rows = aggregates.action_rows
+    action_counts = action_rows[action_rows.index.get_level_values("product_name") == product]
+    action_counts = action_counts.droplevel("product_name").rename("count")
+    return stages.name_funnel(action_counts.sort_values(ascending=False), actions_key)
+
+
+def action_comparison(customer_data, aggregates, product="Mailchimp", action_names=None):
+    """Same frame as :func:`pipeline.stages.action_comparison`."""
+    action_names = metrics.comparison_action_names(product) if action_names is None else action_names
+    churned_users, non_churned_users = stages.churn_split(customer_data, product)
+    customer_action_sums = aggregates.customer_action_sums.reset_index()
+
+    churned_actions = customer_action_sums.merge(churned_users, on="customerid")
+    churned_actions = churned_actions.groupby("action_type_id")["usage_count"].sum().reset_index()
+    non_churned_actions = customer_action_sums.merge(non_churned_users, on="customerid")
+    non_churned_actions = non_churned_actions.groupby("action_type_id")["usage_count"].sum().reset_index()
+    return stages.compare_action_mix(churned_actions, non_churned_actions, action_names)
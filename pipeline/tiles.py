@@ -0,0 +1,63 @@
+"""KPI tile grid rendered as a single HTML block.
+
+One header row, then one row per product: a white tile with the product
+name followed by a tile in the product's color for each metric. Building
+the whole grid as one string lets the app send it as one element, however
+many products and metrics it holds.
+"""
+
+import html
+from typing import NamedTuple
+
+# Tile color of products missing from the app's color map
+DEFAULT_COLOR = "#808080"
+
+
+class TileMetric(NamedTuple):
+    column: str
+    label: str
+    format: str
+    # Show the product's description under the value
+    describe: bool = False
+
+
+KPI_TILES = (
+    TileMetric("Lifetime_Activated_Customers", "👥 Lifetime Activated", "{:,}"),
+    TileMetric("Current_Active_Customers", "⚡Current Active", "{:,}"),
+    TileMetric("Churn_Rate (%)", "📉Churn Rate", "{:.2f}%"),
+    TileMetric("NorthStar_Metric_Value", "⭐ Lifetime NorthStar Metric", "{:,}", describe=True),
+)
+
+_HEADER = "<p style='text-align:center; font-weight:bold; font-size:16px; margin:0;'>{}</p>"
+_NAME_TILE = (
+    "<div style='background-color:#FFFFFF; display: flex; justify-content: center; align-items: center; "
+    "border-radius: 10px; border: 1px solid #d3d3d3; height:150px; padding:20px;'>"
+    "<h3 style='text-align:center; color:black; font-size:{size}px;'>{name}</h3></div>"
+)
+_METRIC_TILE = (
+    "<div style='background-color:{color}; display: flex; justify-content: center; align-items: center; "
+    "flex-direction: column; border-radius: 10px; height:150px; padding:20px;'>"
+    "<h3 style='text-align:center; color:white; font-size:22px; font-weight:bold; "
+    "text-shadow: 0px 0px 1px black;'>{value}</h3>{description}</div>"
+)
+_DESCRIPTION = "<h6 style='text-align:center; color:white; font-size:14px; margin-top:0.5px;'>{}</h6>"
+
+
+def tile_grid_html(summary, colors, descriptions, metrics=KPI_TILES, product_font_size=16, row_gap=20):
+    """HTML of the tile grid for each row of ``summary`` (a customer summary frame)."""
+    cells = [_HEADER.format("Product")] + [_HEADER.format(html.escape(metric.label)) for metric in metrics]
+    columns = [summary[metric.column].tolist() for metric in metrics]
+    for i, product in enumerate(summary["product_name"].tolist()):
+        color = html.escape(colors.get(product, DEFAULT_COLOR))
+        description = _DESCRIPTION.format(html.escape(descriptions.get(product, "")))
+        cells.append(_NAME_TILE.format(size=product_font_size, name=html.escape(product)))
+        for metric, values in zip(metrics, columns):
+            cells.append(_METRIC_TILE.format(
+                color=color,
+                value=html.escape(metric.format.format(values[i])),
+                description=description if metric.describe else "",
+            ))
+    return (
+        f"<div style='display:grid; grid-template-columns:repeat({len(metrics) + 1}, minmax(0, 1fr)); "
+        f"column-gap:1rem; row-gap:{row_gap}px; align-items:center;'>" + "".join(cells) + "</div>"
+    )
@@ -0,0 +1,87 @@
+"""Daily active customers for every product and channel in one sweep.
+
+Each activation is a +1 event and each cancellation a -1 event on its day.
+Events are flattened into a single product x channel x day offset, counted
+with one ``np.bincount`` per event type and turned into running totals with
+one ``cumsum`` along the day axis, so the cost is linear in the number of
+customers and independent of how many lines are drawn from the result.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class ActiveTimeline(NamedTuple):
+    dates: pd.DatetimeIndex
+    products: pd.Index
+    channels: pd.Index
+    # Cumulative counts shaped (products, channels, days)
+    activated: np.ndarray
+    cancelled: np.ndarray
+
+    @property
+    def active(self):
+        return self.activated - self.cancelled
+
+
+def date_window(customer_data):
+    """First and last activation or cancel day in ``customer_data``."""
+    dates = customer_data[["first_activation_date", "cancel_date"]]
+    return dates.min().min(), dates.max().max()
+
+
+def _day_offsets(dates, start_date, days):
+    offsets = ((dates - start_date) // pd.Timedelta(days=1)).to_numpy(dtype="float64", na_value=np.nan)
+    # Events outside the window are dropped, like reindexing onto it does
+    valid = ~np.isnan(offsets) & (offsets >= 0) & (offsets < days)
+    return offsets, valid
+
+
+def active_timeline(customer_data, start_date=None, end_date=None):
+    """Cumulative activated, cancelled and active customers per product, channel and day.
+
+    The window defaults to the span of the data's activation and cancel dates.
+    """
+    if start_date is None or end_date is None:
+        data_start, data_end = date_window(customer_data)
+        start_date = data_start if start_date is None else start_date
+        end_date = data_end if end_date is None else end_date
+    dates = pd.date_range(start=start_date, end=end_date, freq="D")
+
+    # Missing products and channels get their own code, so per-product totals
+    # still count customers whose channel is unknown
+    product_codes, products = pd.factorize(customer_data["product_name"], sort=True, use_na_sentinel=False)
+    channel_codes, channels = pd.factorize(customer_data["channel"], sort=True, use_na_sentinel=False)
+    shape = (len(products), len(channels), len(dates))
+    cell = (product_codes.astype(np.int64) * shape[1] + channel_codes) * shape[2]
+
+    counts = []
+    for column in ("first_activation_date", "cancel_date"):
+        offsets, valid = _day_offsets(customer_data[column], dates[0], shape[2])
+        events = np.bincount(cell[valid] + offsets[valid].astype(np.int64), minlength=np.prod(shape))
+        counts.append(events.reshape(shape).cumsum(axis=2))
+    return ActiveTimeline(dates, pd.Index(products), pd.Index(channels), *counts)
+
+
+def _select(timeline, values, product=None, channel=None):
+    if product is not None:
+        values = values[timeline.products.get_indexer([product])] if product in timeline.products else values[:0]
+    if channel is not None:
+        values = values[:, timeline.channels.get_indexer([channel])] if channel in timeline.channels else values[:, :0]
+    return values.sum(axis=(0, 1))
+
+
+def daily_customer_series(timeline, product=None, channel=None):
+    """Daily series of one product and/or channel, summed over the rest.
+
+    Same columns as :func:`pipeline.stages.daily_customer_series`.
+    """
+    cumulative_activated = pd.Series(_select(timeline, timeline.activated, product, channel), index=timeline.dates)
+    cumulative_cancelled = pd.Series(_select(timeline, timeline.cancelled, product, channel), index=timeline.dates)
+    return pd.DataFrame({
+        "Cumulative_Activated": cumulative_activated,
+        "Cumulative_Cancelled": cumulative_cancelled,
+        "Active": cumulative_activated - cumulative_cancelled,
+    })
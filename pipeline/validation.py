@@ -0,0 +1,117 @@
+"""Row-level checks of the input CSVs, run once when they are ingested.
+
+    python -m pipeline.validation
+
+Every rule is one vectorized mask over the raw frame read from the CSV and
+the typed frame built from it. Rows that break a rule stay in the data as
+before, where unparseable values are <NA> or NaT. The number of such rows
+and the CSV lines of the first few are recorded in a report stored with the
+columnar copy (see :func:`pipeline.ingest.validation_report`), so they no
+longer drop out of the KPIs unnoticed.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from pipeline import loading, metrics
+
+# CSV lines listed per rule
+EXAMPLES = 5
+
+RULES = {
+    "cancel_before_activation": "cancel_date is before first_activation_date",
+    "duplicate_customerid": "customerid is on more than one row",
+    "action_id_out_of_range": f"action_type_id is outside {metrics.ACTION_IDS[0]}-{metrics.ACTION_IDS[-1]}",
+}
+
+
+def describe(rule):
+    """One-line description of ``rule``."""
+    if rule.startswith("unparsed_"):
+        return f"{rule.removeprefix('unparsed_')} could not be parsed"
+    return RULES[rule]
+
+
+def known(report):
+    """Whether every rule in ``report`` is still one of these."""
+    return all(rule.startswith("unparsed_") or rule in RULES for rule in report["checks"])
+
+
+def _unparsed(raw, typed):
+    # read_csv already turns empty cells into NaN, so anything else that
+    # ended up missing did not parse
+    return raw.notna().to_numpy() & typed.isna().to_numpy()
+
+
+def _rule(mask):
+    mask = np.asarray(mask, dtype=bool)
+    # Row i of the frame is line i + 2 of the CSV, after the header
+    return {"rows": int(mask.sum()), "lines": (np.flatnonzero(mask)[:EXAMPLES] + 2).tolist()}
+
+
+def check_customers(raw, typed):
+    """Rule violations of a raw customer frame and its typed copy, keyed by rule."""
+    checks = {f"unparsed_{column}": _rule(_unparsed(raw[column], typed[column]))
+              for column in typed.columns if column == "customerid" or column.endswith("_date")}
+    # Comparisons with NaT are False, so customers never activated or
+    # cancelled pass
+    checks["cancel_before_activation"] = _rule(typed["cancel_date"] < typed["first_activation_date"])
+    # The churn comparison joins usage on customerid alone, so a customer on
+    # several rows, even of different products, counts their usage once per row
+    ids = typed["customerid"]
+    checks["duplicate_customerid"] = _rule(ids.duplicated(keep=False) & ids.notna())
+    return checks
+
+
+def check_usage(raw, typed):
+    """Rule violations of a raw usage frame and its typed copy, keyed by rule."""
+    checks = {f"unparsed_{column}": _rule(_unparsed(raw[column], typed[column]))
+              for column in typed.columns if column != "product_name"}
+    action_ids = typed["action_type_id"]
+    # Unparsed IDs are already reported above
+    checks["action_id_out_of_range"] = _rule(
+        ((action_ids < metrics.ACTION_IDS[0]) | (action_ids > metrics.ACTION_IDS[-1])).to_numpy(
+            dtype=bool, na_value=False
+        )
+    )
+    return checks
+
+
+def violations(checks):
+    """Total rule violations in ``checks``; a row breaking two rules counts twice."""
+    return sum(check["rows"] for check in checks.values())
+
+
+def report_frame(checks, rows=None):
+    """``checks`` as a table of the rules that any row breaks."""
+    report = pd.DataFrame(
+        [(rule, describe(rule), check["rows"], check["lines"]) for rule, check in checks.items() if check["rows"]],
+        columns=["rule", "description", "rows", "csv_lines"],
+    )
+    if rows:
+        report.insert(3, "share_pct", (report["rows"] / rows * 100).round(3))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customer-data", default=loading.CUSTOMER_DATA_PATH)
+    parser.add_argument("--usage-data", default=loading.USAGE_DATA_PATH)
+    args = parser.parse_args()
+
+    from pipeline import ingest
+
+    for path, columnar in ((args.customer_data, ingest.customer_columnar), (args.usage_data, ingest.usage_columnar)):
+        # Ingesting runs the checks if the columnar copy is out of date
+        columnar(path)
+        report = ingest.validation_report(path)
+        print(f"{path}: {report['rows']} rows, {violations(report['checks'])} rule violations")
+        frame = report_frame(report["checks"], report["rows"])
+        if not frame.empty:
+            print(frame.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
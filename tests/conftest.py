@@ -0,0 +1,34 @@
+"""Small synthetic inputs shared by the tests, in the schema of the real exports."""
+
+import numpy as np
+import pytest
+
+from benchmarks import generate_data
+from pipeline import ingest
+
+CUSTOMERS = 3_000
+
+
+@pytest.fixture(scope="session")
+def raw_data():
+    """Raw customer and usage frames, as read from the CSVs."""
+    return generate_data.generate_block(0, CUSTOMERS, np.random.default_rng(0), events_per_customer=8)
+
+
+@pytest.fixture(scope="session")
+def customer_data(raw_data):
+    return ingest.type_customer_data(raw_data[0])
+
+
+@pytest.fixture(scope="session")
+def usage_data(raw_data):
+    return ingest.type_usage_data(raw_data[1])
+
+
+@pytest.fixture
+def data_dir(tmp_path, raw_data):
+    """A directory holding ``customer_data.csv`` and ``usage_data.csv``."""
+    customers, usage = raw_data
+    customers.to_csv(tmp_path / "customer_data.csv", index=False)
+    usage.to_csv(tmp_path / "usage_data.csv", index=False)
+    return tmp_path
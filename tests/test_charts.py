@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import charts
+
+
+def loop_lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets one point at a time, with the buckets of charts.lttb
+    n = len(y)
+    edges = [int(edge) for edge in np.linspace(1, n - 1, n_out - 1)]
+    kept = [0]
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following = range(edges[bucket + 1], edges[bucket + 2])
+            next_x = sum(x[i] for i in following) / len(following)
+            next_y = sum(y[i] for i in following) / len(following)
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        a = kept[-1]
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            area = abs((x[a] - next_x) * (y[i] - y[a]) - (x[a] - x[i]) * (next_y - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+    return np.array(kept + [n - 1])
+
+
+def loop_minmax(y, n_out):
+    n, buckets = len(y), (n_out - 2) // 2
+    kept = {0, n - 1}
+    if buckets < 1:
+        return np.array(sorted(kept))
+    width = -(-n // buckets)
+    for start in range(0, n, width):
+        bucket = list(y[start:start + width])
+        kept.update((start + bucket.index(min(bucket)), start + bucket.index(max(bucket))))
+    return np.array(sorted(kept))
+
+
+@pytest.mark.parametrize("n, n_out", [(1_000, 100), (997, 37), (5_000, 1_500), (50, 3)])
+def test_lttb_matches_loop(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.choice(10 * n, n, replace=False)).astype(np.float64)
+    y = rng.normal(size=n).cumsum()
+    np.testing.assert_array_equal(charts.lttb(x, y, n_out), loop_lttb(x, y, n_out))
+
+
+@pytest.mark.parametrize("n, n_out", [(1_000, 100), (997, 37), (10, 6), (10, 3)])
+def test_minmax_matches_loop(n, n_out):
+    y = np.random.default_rng(n).normal(size=n)
+    np.testing.assert_array_equal(charts.minmax(y, n_out), loop_minmax(y, n_out))
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_keeps_the_ends_and_the_budget(method):
+    dates = pd.date_range("2021-05-01", periods=5_000, freq="D")
+    series = pd.Series(np.random.default_rng(1).normal(size=len(dates)).cumsum(), index=dates)
+    sampled = charts.downsample(series, 500, method)
+    assert len(sampled) <= 500
+    assert sampled.index[0] == dates[0] and sampled.index[-1] == dates[-1]
+    assert sampled.index.is_monotonic_increasing
+    pd.testing.assert_series_equal(sampled, series.loc[sampled.index])
+
+
+def test_short_series_are_left_alone():
+    series = pd.Series(range(10), index=pd.date_range("2021-05-01", periods=10))
+    assert charts.downsample(series, 500) is series
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from pipeline import funnel, metrics
+
+STEPS = metrics.funnel_steps["Mailchimp"]
+
+
+def loop_funnel(usage, steps, product, window):
+    # Walk each customer's events step by step
+    usage = usage[(usage["product_name"] == product) & usage["customerid"].notna() & usage["event_date"].notna()]
+    counts, gaps = [0] * len(steps), [[] for _ in steps]
+    for _, events in usage.groupby("customerid"):
+        day = None
+        for step, action in enumerate(steps):
+            dates = events.loc[events["action_type_id"] == action, "event_date"]
+            if day is not None:
+                dates = dates[dates >= day]
+            if dates.empty:
+                break
+            if day is not None:
+                gap = (dates.min() - day).days
+                if window is not None and gap > window:
+                    break
+                gaps[step].append(gap)
+            day = dates.min()
+            counts[step] += 1
+    return counts, [np.nan] + [np.median(step_gaps) if step_gaps else np.nan for step_gaps in gaps[1:]]
+
+
+@pytest.mark.parametrize("window", [None, 30, 0])
+def test_ordered_funnel_matches_a_loop_over_customers(usage_data, window):
+    result = funnel.ordered_funnel(usage_data, STEPS, "Mailchimp", window)
+    counts, medians = loop_funnel(usage_data, STEPS, "Mailchimp", window)
+    assert result["customers"].tolist() == counts
+    np.testing.assert_allclose(result["median_days_from_previous"], medians)
+    np.testing.assert_allclose(result["conversion_pct"], np.array(counts) / counts[0] * 100)
+
+
+def test_windows_per_step(usage_data):
+    result = funnel.ordered_funnel(usage_data, STEPS, "Mailchimp", [60, 30, 90])
+    assert (result["customers"].diff().dropna() <= 0).all()
+    with pytest.raises(ValueError, match="conversion windows"):
+        funnel.ordered_funnel(usage_data, STEPS, "Mailchimp", [60, 30])
+
+
+def test_steps_nobody_reached(usage_data):
+    result = funnel.ordered_funnel(usage_data.iloc[:0], STEPS, "Mailchimp")
+    assert result["customers"].tolist() == [0] * len(STEPS)
+    result = funnel.ordered_funnel(usage_data, [5, 99, 2], "Mailchimp")
+    assert result["customers"].tolist()[1:] == [0, 0]
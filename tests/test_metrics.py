@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from pipeline import metrics
+
+
+def apply_action_types(usage_data):
+    # The row-wise mapping map_action_types replaced
+    return usage_data.apply(
+        lambda row: metrics.action_keys.get((row["action_type_id"], row["product_name"]), metrics.UNKNOWN_ACTION), axis=1
+    )
+
+
+def apply_north_star_actuals(usage_data):
+    # The row-wise North Star filter north_star_actuals replaced
+    usage_data = usage_data.assign(Action_Type=apply_action_types(usage_data))
+    values = usage_data.groupby(["product_name", "Action_Type", "action_type_id"])["usage_count"].sum().reset_index()
+    valid_combinations = set(metrics.action_keys)
+    actuals = values[values.apply(lambda row: (row["action_type_id"], row["product_name"]) in valid_combinations, axis=1)]
+    return actuals[["product_name", "usage_count"]]
+
+
+@pytest.fixture(params=["raw", "typed"])
+def usage(request, raw_data, usage_data):
+    return raw_data[1] if request.param == "raw" else usage_data
+
+
+def test_map_action_types_matches_apply(usage):
+    mapped = metrics.map_action_types(usage)
+    expected = apply_action_types(usage)
+    assert mapped.index.equals(usage.index)
+    assert mapped.tolist() == expected.tolist()
+    assert (mapped != metrics.UNKNOWN_ACTION).any() and (mapped == metrics.UNKNOWN_ACTION).any()
+
+
+def test_map_action_types_keeps_a_custom_index(raw_data):
+    usage = raw_data[1].iloc[::-3]
+    assert metrics.map_action_types(usage).tolist() == apply_action_types(usage).tolist()
+
+
+def test_north_star_actuals_matches_apply(usage):
+    def normalized(frame):
+        frame = frame.astype({"product_name": str, "usage_count": "int64"})
+        return frame.sort_values("product_name").reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(
+        normalized(metrics.north_star_actuals(usage)), normalized(apply_north_star_actuals(usage))
+    )
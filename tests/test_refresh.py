@@ -0,0 +1,33 @@
+import threading
+
+from pipeline import refresh
+
+
+def test_versions_keep_their_mode_and_are_warmed_before_the_swap(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("a\n1\n")
+    modes = iter(["live", "snapshot"])
+    warmed, started = [], threading.Event()
+
+    def rebuild(fingerprint):
+        return fingerprint.size, next(modes)
+
+    def warm(version):
+        warmed.append((version.key, version.mode))
+        started.set()
+
+    refresher = refresh.Refresher([str(path)], rebuild, interval=0, warm=warm)
+    first = refresher.current
+    assert (first.key, first.mode) == (4, "live")
+    # The first version is only warmed once started
+    assert warmed == []
+    refresher.start()
+    assert started.wait(5)
+    refresher.stop(5)
+    assert warmed == [(4, "live")]
+
+    path.write_text("a\n1\n2\n")
+    assert refresher.refresh(settle=False)
+    assert (refresher.current.key, refresher.current.mode) == (6, "snapshot")
+    assert warmed == [(4, "live"), (6, "snapshot")]
+    assert refresher.current.fingerprints[0].size == 6
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import retention
+
+FREQUENCIES = {"month": "M", "week": "W-SUN"}
+
+
+def loop_retention(customer_data, product, channel, cohort_by, period):
+    # Count each cohort's survivors age by age with calendar periods
+    freq = FREQUENCIES[period]
+    last = pd.Period(retention.last_date(customer_data), freq)
+    customers = customer_data[customer_data["first_activation_date"].notna() & customer_data[cohort_by].notna()]
+    if product is not None:
+        customers = customers[customers["product_name"] == product]
+    if channel is not None:
+        customers = customers[customers["channel"] == channel]
+    cohorts = {}
+    for _, customer in customers.iterrows():
+        cohort = pd.Period(customer[cohort_by], freq)
+        cancel = customer["cancel_date"]
+        churn_age = None if pd.isna(cancel) else max((pd.Period(cancel, freq) - cohort).n, 0)
+        cohorts.setdefault(cohort, []).append(churn_age)
+    rates = {}
+    for cohort, churn_ages in cohorts.items():
+        lived = (last - cohort).n
+        rates[cohort.start_time] = {
+            age: sum(churn_age is None or churn_age > age for churn_age in churn_ages) / len(churn_ages) * 100
+            for age in range(lived + 1)
+        }
+    return rates, {cohort.start_time: len(churn_ages) for cohort, churn_ages in cohorts.items()}
+
+
+@pytest.mark.parametrize("period", retention.PERIODS)
+@pytest.mark.parametrize("cohort_by", retention.COHORT_COLUMNS)
+@pytest.mark.parametrize("product, channel", [(None, None), ("Mailchimp", None), ("Mint", "SEO")])
+def test_retention_matches_a_loop_over_customers(customer_data, product, channel, cohort_by, period):
+    result = retention.retention_matrix(customer_data, product, channel, cohort_by, period)
+    rates, sizes = loop_retention(customer_data, product, channel, cohort_by, period)
+    assert result.customers.to_dict() == sizes
+    assert sorted(result.rates.index) == sorted(rates)
+    for cohort, expected in rates.items():
+        row = result.rates.loc[cohort]
+        np.testing.assert_allclose(row.iloc[:len(expected)], list(expected.values()))
+        assert row.iloc[len(expected):].isna().all()
+
+
+def test_cohorts_start_on_period_boundaries(customer_data):
+    weekly = retention.retention_matrix(customer_data, period="week")
+    assert (weekly.rates.index.dayofweek == 0).all()
+    monthly = retention.retention_matrix(customer_data, period="month")
+    assert (monthly.rates.index.day == 1).all()
+
+
+def test_no_customers(customer_data):
+    result = retention.retention_matrix(customer_data, product="Nobody")
+    assert result.rates.empty and result.customers.empty
+    with pytest.raises(ValueError, match="period"):
+        retention.retention_matrix(customer_data, period="day")
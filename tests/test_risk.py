@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import metrics, risk
+
+
+def grouped_activity(usage):
+    # Sum each customer's decayed log-ins with a groupby
+    is_login = pd.Series(False, index=usage.index)
+    for product, action in metrics.login_actions.items():
+        is_login |= (usage["product_name"] == product) & (usage["action_type_id"] == action)
+    logins = usage[is_login.fillna(False) & usage["customerid"].notna() & usage["event_date"].notna()
+                   & usage["usage_count"].notna()]
+    age = (logins["event_date"].max() - logins["event_date"]).dt.days
+    frame = pd.DataFrame({
+        "customerid": logins["customerid"].astype(np.int64),
+        "recent": logins["usage_count"] * 2.0 ** (-age / risk.RECENT_HALF_LIFE),
+        "baseline": logins["usage_count"] * 2.0 ** (-age / risk.BASELINE_HALF_LIFE),
+        "last_login": logins["event_date"],
+    })
+    return frame.groupby("customerid").agg({"recent": "sum", "baseline": "sum", "last_login": "max"})
+
+
+def assert_activity_equal(activity, expected):
+    np.testing.assert_array_equal(activity.customerid, expected.index.to_numpy())
+    np.testing.assert_allclose(activity.recent, expected["recent"])
+    np.testing.assert_allclose(activity.baseline, expected["baseline"])
+    np.testing.assert_array_equal(activity.last_login.astype("datetime64[D]"),
+                                  expected["last_login"].to_numpy().astype("datetime64[D]"))
+
+
+def test_login_activity_matches_a_groupby(usage_data):
+    assert_activity_equal(risk.login_activity(usage_data), grouped_activity(usage_data))
+
+
+@pytest.mark.parametrize("pieces", [2, 7])
+def test_partitions_fold_in_any_order(usage_data, pieces):
+    parts = np.array_split(np.random.default_rng(0).permutation(len(usage_data)), pieces)
+    activity = risk.empty()
+    for part in parts[::-1]:
+        activity = risk.update(activity, usage_data.iloc[np.sort(part)])
+    assert_activity_equal(activity, grouped_activity(usage_data))
+
+
+@pytest.mark.parametrize("top, chunksize", [(10, risk.CHUNKSIZE), (25, 50), (10_000, 64)])
+def test_watchlist_matches_a_full_sort(usage_data, customer_data, top, chunksize):
+    activity = risk.login_activity(usage_data)
+    cohort = risk.active_customers(customer_data)
+    result = risk.watchlist(activity, cohort, top, chunksize)
+
+    scored = np.isin(activity.customerid, cohort)
+    ids = activity.customerid[scored]
+    scores = (risk._weekly_rate(activity.baseline[scored], risk.BASELINE_HALF_LIFE)
+              - risk._weekly_rate(activity.recent[scored], risk.RECENT_HALF_LIFE))
+    order = np.lexsort((-ids, -scores))
+    expected = ids[order][scores[order] > 0][:top]
+    np.testing.assert_array_equal(result.customers["customerid"].to_numpy(), expected)
+    assert result.cohort == len(np.unique(cohort))
+    assert result.scored == scored.sum()
+    assert (result.customers["drop_pct"] > 0).all()
+
+
+def test_empty_watchlist(customer_data):
+    result = risk.watchlist(risk.empty(), risk.active_customers(customer_data))
+    assert result.customers.empty and result.scored == 0 and result.as_of is None
+
+
+def test_load_round_trips_and_reuses_the_file(data_dir, usage_data):
+    path = str(data_dir / "usage_data.csv")
+    activity = risk.load([path])
+    assert_activity_equal(activity, grouped_activity(usage_data))
+    built = os.stat(risk.activity_path(path)).st_mtime_ns
+    assert_activity_equal(risk.load([path], chunksize=500), grouped_activity(usage_data))
+    assert os.stat(risk.activity_path(path)).st_mtime_ns == built
@@ -0,0 +1,12 @@
+import pandas as pd
+
+from pipeline import shared
+
+
+def test_writes_to_a_view_leave_the_shared_frame_alone(customer_data):
+    frozen = customer_data.copy()
+    copy = shared.view({"customers": customer_data})["customers"]
+    copy.loc[copy.index[0], "channel"] = copy["channel"].iloc[-1]
+    copy["product_name"] = "Changed"
+    copy.iloc[:, 0] = 0
+    pd.testing.assert_frame_equal(customer_data, frozen)
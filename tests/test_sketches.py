@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import ingest, sketches
+
+
+def dense_reference(usage, precision=sketches.PRECISION):
+    # Every sketch as its full registers, one usage row at a time
+    usage = usage.dropna(subset=["customerid", "event_date", "action_type_id", "product_name"])
+    groups = usage.groupby(sketches.KEYS, observed=True, sort=True)
+    registers = np.zeros((groups.ngroups, 1 << precision), dtype=np.uint8)
+    for code, customer in zip(groups.ngroup(), usage["customerid"]):
+        value = int(sketches._hash(np.array([customer], dtype=np.int64))[0])
+        # The top bits pick the register, which keeps the position of the
+        # first 1 bit in the rest
+        register, rest = value >> (64 - precision), value & ((1 << (64 - precision)) - 1)
+        rank = 64 - precision - rest.bit_length() + 1
+        registers[code, register] = max(registers[code, register], rank)
+    return groups.size().index.to_frame(index=False), registers
+
+
+@pytest.fixture(scope="module")
+def usage(usage_data):
+    # One busy day, so that some sketches are dense
+    rng = np.random.default_rng(0)
+    busy = pd.DataFrame({
+        "customerid": pd.array(rng.integers(0, 2**53, 5_000), dtype="Int64"),
+        "product_name": pd.Categorical(["Mailchimp"] * 5_000, categories=usage_data["product_name"].cat.categories),
+        "action_type_id": np.full(5_000, 5, dtype=np.int8),
+        "usage_count": np.ones(5_000, dtype=np.int32),
+        "event_date": pd.Timestamp("2021-07-01"),
+    })
+    return pd.concat([usage_data, busy], ignore_index=True)
+
+
+def test_sparse_and_dense_sketches_hold_the_same_registers(usage):
+    result = sketches.sketch(usage)
+    keys, registers = dense_reference(usage)
+    pd.testing.assert_frame_equal(result.keys, keys)
+    np.testing.assert_array_equal(sketches.to_dense(result), registers)
+    assert 0 < (result.dense >= 0).sum() < len(result.keys)
+    assert np.diff(result.offsets)[result.dense >= 0].sum() == 0
+
+
+def test_merging_parts_equals_sketching_them_together(usage):
+    whole = sketches.sketch(usage)
+    # Pieces of the busy day are sparse on their own and dense once merged
+    parts = [sketches.sketch(usage.iloc[start:start + 800]) for start in range(0, len(usage), 800)]
+    assert not any((part.dense >= 0).any() for part in parts)
+    merged = sketches.merge(parts)
+    pd.testing.assert_frame_equal(merged.keys, whole.keys)
+    np.testing.assert_array_equal(merged.dense, whole.dense)
+    np.testing.assert_array_equal(sketches.to_dense(merged), sketches.to_dense(whole))
+    assert sketches.distinct_customers(merged) == sketches.distinct_customers(whole)
+
+
+@pytest.mark.parametrize("customers", [100, 5_000, 200_000])
+def test_estimates_are_within_the_error_bound(customers):
+    ids = np.random.default_rng(customers).choice(2**53, customers, replace=False)
+    usage = pd.DataFrame({
+        "customerid": pd.array(ids, dtype="Int64"),
+        "product_name": pd.Categorical(["Mailchimp"] * customers),
+        "action_type_id": np.full(customers, 5, dtype=np.int8),
+        "event_date": pd.Timestamp("2021-07-01") + pd.to_timedelta(ids % 30, unit="D"),
+    })
+    result = sketches.distinct_customers(sketches.sketch(usage))
+    assert abs(result.customers - customers) <= 3 * result.relative_error * customers
+
+
+def test_selections_match_the_exact_counts(data_dir, usage_data):
+    path = str(data_dir / "usage_data.csv")
+    loaded = sketches.load([path])
+    np.testing.assert_array_equal(sketches.to_dense(loaded), sketches.to_dense(sketches.sketch(usage_data)))
+    for selection in [dict(), dict(product="Mailchimp", actions=[5]), dict(product="Mint", start="2021-09-01", end="2021-09-30")]:
+        estimate = sketches.distinct_customers(loaded, **selection)
+        exact = sketches.exact_distinct([ingest.load_usage_data(path)], **selection)
+        assert abs(estimate.customers - exact) <= max(3 * estimate.relative_error * exact, 2)
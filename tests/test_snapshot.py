@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+
+from pipeline import ingest, snapshot, stages
+
+
+def build(data_dir, keep=snapshot.KEEP):
+    return snapshot.build(str(data_dir / "customer_data.csv"), str(data_dir / "usage_data.csv"),
+                          str(data_dir / "snapshots"), workers=1, keep=keep)
+
+
+def test_snapshot_holds_what_the_stages_compute(data_dir):
+    path = build(data_dir)
+    assert snapshot.latest(str(data_dir / "snapshots")) == path
+    saved = snapshot.Snapshot(path)
+    customer_data = ingest.load_customer_data(str(data_dir / "customer_data.csv"))
+    usage_data = ingest.load_usage_data(str(data_dir / "usage_data.csv"))
+    plain = lambda frame: frame.astype({"product_name": object})
+    pd.testing.assert_frame_equal(
+        plain(saved.customer_summary()), plain(stages.customer_summary(customer_data, usage_data)), check_dtype=False
+    )
+    pd.testing.assert_frame_equal(
+        saved.action_comparison("Mailchimp"), stages.action_comparison(customer_data, usage_data, "Mailchimp"),
+        check_dtype=False,
+    )
+
+
+def test_builds_keep_only_the_newest_snapshots(data_dir):
+    paths = []
+    for day in range(4):
+        # New usage each time, so every build gets a version of its own
+        with open(data_dir / "usage_data.csv", "a") as f:
+            f.write(f"9130350000000001,Mailchimp,5,1,7/{day + 1}/22\n")
+        paths.append(build(data_dir, keep=2))
+    root = str(data_dir / "snapshots")
+    assert snapshot.versions(root) == [os.path.basename(path) for path in paths[-2:]]
+    assert snapshot.latest(root) == paths[-1]
+    assert not any(os.path.exists(path) for path in paths[:2])
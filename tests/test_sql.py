@@ -0,0 +1,87 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from pipeline import metrics, sql, stages
+
+
+def assert_frames_equal(left, right, **kwargs):
+    plain = lambda frame: frame.astype({column: object for column in frame.columns
+                                        if isinstance(frame[column].dtype, (pd.CategoricalDtype, pd.StringDtype, str))})
+    pd.testing.assert_frame_equal(plain(left), plain(right), check_dtype=False, check_index_type=False, **kwargs)
+
+
+@pytest.fixture
+def database(data_dir):
+    path = sql.build(str(data_dir / "customer_data.csv"), str(data_dir / "usage_data.csv"), str(data_dir / "db.sqlite"))
+    return sql.Database(path)
+
+
+def test_unfiltered_queries_match_the_stages(database, customer_data, usage_data):
+    assert_frames_equal(database.customer_summary(), stages.customer_summary(customer_data, usage_data))
+    first_day, last_day = database.date_window
+    for product in database.products:
+        # Equal counts may sort either way
+        assert database.action_funnel(product).to_dict() == stages.action_funnel(usage_data, product).to_dict()
+        assert_frames_equal(
+            database.daily_customer_series(product),
+            stages.daily_customer_series(customer_data, product, first_day, last_day), check_freq=False,
+        )
+        assert_frames_equal(
+            database.channel_breakdown(product).reset_index(drop=True),
+            stages.channel_breakdown(customer_data, product).reset_index(drop=True),
+        )
+        assert_frames_equal(database.action_comparison(product), stages.action_comparison(customer_data, usage_data, product))
+        assert_frames_equal(
+            database.churn_by_channel(product), stages.churn_by_channel(customer_data, product), check_categorical=False
+        )
+
+
+def test_filters_match_the_rows_they_select(database, customer_data, usage_data):
+    start, end = pd.Timestamp("2021-09-01"), pd.Timestamp("2022-03-31")
+    channels, products = tuple(database.channels[:3]), tuple(database.products[1:])
+    filters = sql.Filters(start.date(), end.date(), channels, products)
+
+    # Each usage row takes the channel of its customer's sign-up for that product
+    channel_of = {}
+    for customer, product, channel in customer_data[["customerid", "product_name", "channel"]].itertuples(index=False):
+        channel_of.setdefault((customer, product), channel)
+    usage_channel = pd.Series([channel_of.get(key) for key in zip(usage_data["customerid"], usage_data["product_name"])],
+                              index=usage_data.index)
+    usage = usage_data[usage_data["event_date"].between(start, end) & usage_channel.isin(channels)
+                       & usage_data["product_name"].isin(products)]
+    customers = customer_data[customer_data["channel"].isin(channels) & customer_data["product_name"].isin(products)]
+    activated = customers["first_activation_date"].between(start, end)
+    cancelled = customers["cancel_date"].between(start, end)
+    still_active = activated & ~(customers["cancel_date"] <= end)
+
+    def by_product(mask):
+        return customers[mask].groupby("product_name", observed=True).size()
+
+    action_sums = usage.groupby(["product_name", "action_type_id"], observed=True)["usage_count"].sum()
+    assert_frames_equal(
+        database.customer_summary(filters),
+        stages.summary_frame(by_product(activated), by_product(still_active), by_product(cancelled),
+                             metrics.select_north_star(action_sums)),
+    )
+    for product in products:
+        assert database.action_funnel(product, filters).to_dict() == stages.action_funnel(usage, product).to_dict()
+        assert_frames_equal(
+            database.channel_breakdown(product, filters).reset_index(drop=True),
+            stages.channel_breakdown(customers[activated], product).reset_index(drop=True),
+        )
+        first_day, last_day = database.date_window
+        assert_frames_equal(
+            database.daily_customer_series(product, filters),
+            stages.daily_customer_series(customers, product, first_day, last_day).loc[start:end], check_freq=False,
+        )
+
+
+def test_a_single_day_filter(database, usage_data):
+    day = datetime.date(2021, 6, 7)
+    series = database.daily_customer_series("Mailchimp", sql.Filters(start=day, end=day))
+    assert list(series.index) == [pd.Timestamp(day)]
+    funnel = database.action_funnel("Mailchimp", sql.Filters(start=day, end=day))
+    on_day = usage_data[(usage_data["event_date"] == pd.Timestamp(day)) & (usage_data["product_name"] == "Mailchimp")]
+    assert funnel.sum() == len(on_day)
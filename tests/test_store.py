@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from pipeline import ingest, stages, store
+
+
+def assert_matches_stages(aggregate_store, customer_path, usage_paths):
+    # The store against the in-memory stages over all the rows at once
+    customer_data = ingest.type_customer_data(pd.read_csv(customer_path, low_memory=False))
+    usage_data = ingest.type_usage_data(pd.concat([pd.read_csv(path) for path in usage_paths], ignore_index=True))
+    plain = lambda frame: frame.astype({"product_name": object})
+    pd.testing.assert_frame_equal(
+        plain(aggregate_store.customer_summary()), plain(stages.customer_summary(customer_data, usage_data)), check_dtype=False
+    )
+    for product in ("Mailchimp", "Mint"):
+        pd.testing.assert_series_equal(
+            aggregate_store.action_funnel(product), stages.action_funnel(usage_data, product),
+            check_dtype=False, check_index_type=False,
+        )
+        pd.testing.assert_frame_equal(
+            aggregate_store.action_comparison(product), stages.action_comparison(customer_data, usage_data, product),
+            check_dtype=False,
+        )
+        pd.testing.assert_frame_equal(
+            aggregate_store.daily_customer_series(product), stages.daily_customer_series(customer_data, product),
+            check_dtype=False, check_freq=False,
+        )
+        pd.testing.assert_frame_equal(
+            aggregate_store.churn_by_channel(product), stages.churn_by_channel(customer_data, product),
+            check_dtype=False, check_index_type=False, check_categorical=False,
+        )
+
+
+@pytest.fixture
+def partitions(data_dir):
+    # The usage history split into the main CSV and two daily partitions
+    usage = pd.read_csv(data_dir / "usage_data.csv")
+    (data_dir / "usage").mkdir()
+    paths = [data_dir / "usage_data.csv", data_dir / "usage" / "2022-07-01.csv", data_dir / "usage" / "2022-07-02.csv"]
+    for path, rows in zip(paths, (slice(0, len(usage) // 2), slice(len(usage) // 2, -500), slice(-500, None))):
+        usage.iloc[rows].to_csv(path, index=False)
+    return [str(path) for path in paths]
+
+
+def test_partitions_fold_in_incrementally(data_dir, partitions):
+    customer_path = str(data_dir / "customer_data.csv")
+    aggregate_store = store.AggregateStore(str(data_dir / "store"))
+    first = aggregate_store.sync(customer_path, partitions[:2], chunksize=1_000)
+    assert_matches_stages(aggregate_store, customer_path, partitions[:2])
+
+    # Reopened from disk, a later partition is folded into what is stored
+    aggregate_store = store.AggregateStore(str(data_dir / "store"))
+    second = aggregate_store.sync(customer_path, partitions, chunksize=1_000)
+    assert second != first
+    assert aggregate_store.sync(customer_path, partitions) == second
+    assert_matches_stages(aggregate_store, customer_path, partitions)
+
+
+def test_later_cancellations_move_customers_to_churned(data_dir, partitions):
+    customer_path = str(data_dir / "customer_data.csv")
+    aggregate_store = store.AggregateStore(str(data_dir / "store"))
+    aggregate_store.sync(customer_path, partitions)
+    customers = pd.read_csv(customer_path, keep_default_na=False)
+    active = customers.index[(customers["product_name"] == "Mailchimp") & (customers["cancel_date"] == "")
+                             & (customers["first_activation_date"] != "")][:50]
+    customers.loc[active, "cancel_date"] = "6/29/22"
+    customers.to_csv(customer_path, index=False)
+    aggregate_store.sync(customer_path, partitions)
+    assert_matches_stages(aggregate_store, customer_path, partitions)
+
+
+def test_a_merged_partition_must_not_change(data_dir, partitions):
+    aggregate_store = store.AggregateStore(str(data_dir / "store"))
+    aggregate_store.sync(str(data_dir / "customer_data.csv"), partitions)
+    with open(partitions[1], "a") as f:
+        f.write("9130350000000001,Mailchimp,1,1,7/1/22\n")
+    with pytest.raises(ValueError, match="changed after it was merged"):
+        aggregate_store.sync(str(data_dir / "customer_data.csv"), partitions)